@@ -4,21 +4,35 @@ import time
 import threading
 import uuid
 import logging
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
 from werkzeug.utils import secure_filename
-from src.parser import QQChatParser
-from src.analyzer import ChatAnalyzer
-from src.renderer import HTMLRenderer as ReportRenderer
+from src.upload import StreamingUploader
 from src.llm_client import LLMClient
-from src.generator import ReportGenerator
+from src.generator import json_parse_failure_rates
+from src.pipeline import AnalysisPipeline, ParseCache
+from src.renderer import HTMLRenderer
 from src.history import HistoryManager
+from src.metrics import metrics
+from src.client_pool import client_registry
+from src.failover import endpoint_router
+from src.budget import throughput
+from src.task_store import create_task_store
+from src.report_store import ReportStore
+from src.worker import execute_task, execute_task_async
+from src.async_runner import AsyncTaskRunner
+from src.registry import UPLOAD_COMPRESSED_SUFFIXES, UPLOAD_TTL_SECONDS, TASK_BACKEND_MEMORY, TASK_STORE_PATH, REPORT_STORE_DIR, REPORT_CACHE_MAX_AGE, STATS_PREVIEW_PATTERN, TASK_RUNNER_THREAD, TASK_RUNNER_ASYNC
 
 # --- Config ---
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
 HISTORY_FILE = 'history.json'
 CONFIG_FILE = 'config.json'
-ALLOWED_EXTENSIONS = {'json'}
+ALLOWED_EXTENSIONS = {'json', 'zip'}
+# memory: 单进程 + 线程执行 (默认)；sqlite: 可多进程部署，任务由 worker.py 启动的工作进程执行
+TASK_BACKEND = os.environ.get('TASK_BACKEND', TASK_BACKEND_MEMORY)
+TASK_STORE = os.environ.get('TASK_STORE_PATH', TASK_STORE_PATH)
+# 内存后端的执行方式：thread (每个任务一个线程，默认) / async (共享事件循环，见 src.async_runner)
+TASK_RUNNER = os.environ.get('TASK_RUNNER', TASK_RUNNER_THREAD)
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -29,248 +43,77 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB limit
 
 # --- Global State for Tasks ---
-# In a production app, use Redis/Celery. Here we use a simple dict for local usage.
-tasks = {}
+# 任务状态存储；SQLite 后端下所有 Web 进程与工作进程共享同一个数据库
+tasks = create_task_store(TASK_BACKEND, TASK_STORE)
+# 流式上传的状态 (进度 / 吞吐 / 哈希)，上传完成后由 /api/analyze 认领
+uploads = create_task_store(TASK_BACKEND, TASK_STORE, namespace='uploads')
 
 history_manager = HistoryManager(HISTORY_FILE)
+report_store = ReportStore(os.path.join(OUTPUT_FOLDER, REPORT_STORE_DIR))
+preview_renderer = HTMLRenderer()
+# 运行前估算与随后确认执行的任务共用解析结果 (仅内存后端：工作进程有各自的缓存)
+parse_cache = ParseCache()
+async_runner = AsyncTaskRunner() if TASK_RUNNER == TASK_RUNNER_ASYNC and not tasks.durable else None
 
 # --- Helpers ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-class TaskLogger:
-    def __init__(self, task_id):
-        self.task_id = task_id
-    
-    def info(self, msg):
-        if self.task_id in tasks:
-            tasks[self.task_id]['logs'].append(msg)
-            print(f"[Task {self.task_id}] {msg}")
+def stats_preview_path(task_id):
+    return os.path.join(OUTPUT_FOLDER, STATS_PREVIEW_PATTERN.format(task_id=task_id))
+
+def disk_filename(original_name, upload_id):
+    """落盘文件名 <upload_id>_<安全文件名>；secure_filename 丢失了扩展名 (如纯中文文件名) 时为 <upload_id><扩展名>。"""
+    base = strip_compression_suffix(original_name)
+    suffix = ('.' + base.rsplit('.', 1)[1] + original_name[len(base):]).lower()
+    filename = secure_filename(original_name)
+    if not filename.lower().endswith(suffix) or len(filename) == len(suffix):
+        return upload_id + suffix
+    return f"{upload_id}_{filename}"
+
+def parse_upload_ids(raw):
+    """解析表单中的 upload_ids (JSON 字符串数组)，格式不合法时抛出 ValueError。"""
+    try:
+        upload_ids = json.loads(raw or '[]')
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid upload_ids: {e}')
+    if not isinstance(upload_ids, list) or not all(isinstance(u, str) for u in upload_ids):
+        raise ValueError('Invalid upload_ids: expected a list of strings')
+    return upload_ids
 
-    def progress(self, percent, status_text):
-        if self.task_id in tasks:
-            tasks[self.task_id]['progress'] = percent
-            tasks[self.task_id]['status_text'] = status_text
+def discard_upload(upload_id):
+    """删除未被任务认领的上传记录及其文件；记录不存在 (已认领) 时返回 False。"""
+    record = uploads.pop(upload_id)
+    if record is None:
+        return False
+    if record.get('path') and os.path.exists(record['path']):
+        os.remove(record['path'])
+    return True
 
-def smart_sample(df, max_tokens, logger=None):
+def purge_expired_uploads():
     """
-    智能采样函数，确保不超过 Token 预算。
+    清理超过 UPLOAD_TTL_SECONDS 未被认领的上传 (估算后未确认执行、页面关闭等)。
+    按上传目录中文件的修改时间判断，文件名前缀即 upload_id；已认领的上传没有记录，不受影响。
     """
-    # 估算字符限制 (1 Token ≈ 1.5 Chars)
-    target_chars = int(max_tokens * 1.5)
-    
-    # 预处理消息格式
-    if 'formatted_msg' not in df.columns:
-        df['formatted_msg'] = df.apply(
-            lambda x: f"[{str(x['datetime'])[:16]}] {x.get('user_name', 'Unknown')}: {str(x['content'])[:100]}", 
-            axis=1
-        )
-    
-    full_text_list = df['formatted_msg'].tolist()
-    total_msgs = len(full_text_list)
-    
-    if total_msgs == 0:
-        return ""
+    cutoff = time.time() - UPLOAD_TTL_SECONDS
+    for entry in os.scandir(app.config['UPLOAD_FOLDER']):
+        upload_id = entry.name.split('_', 1)[0].split('.', 1)[0]
+        if entry.is_file() and entry.stat().st_mtime < cutoff and uploads.get(upload_id) is not None:
+            discard_upload(upload_id)
 
-    avg_len = sum(len(m) for m in full_text_list[:100]) / min(total_msgs, 100)
-    if avg_len == 0: avg_len = 50
-    
-    estimated_total_chars = total_msgs * avg_len
-    
-    if estimated_total_chars <= target_chars:
-        sampled_msgs = full_text_list
-        if logger: logger.info(f"数据量较小 ({estimated_total_chars} chars)，全量发送")
-    else:
-        target_msg_count = int(target_chars / avg_len)
-        step = max(1, total_msgs // target_msg_count)
-        sampled_msgs = full_text_list[::step]
-        if logger: logger.info(f"数据量过大，执行均匀采样 (Step={step})。从 {total_msgs} 条中抽取 {len(sampled_msgs)} 条。")
-        
-    return "\n".join(sampled_msgs)
+def strip_compression_suffix(filename):
+    for suffix in UPLOAD_COMPRESSED_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
 
 # --- Analysis Worker ---
-def run_analysis_task(task_id, file_path, config):
-    logger = TaskLogger(task_id)
-    try:
-        tasks[task_id]['state'] = 'processing'
-        logger.progress(5, "正在初始化组件...")
-        
-        # 1. Parse
-        logger.info(f"正在解析文件: {os.path.basename(file_path)}")
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            parser = QQChatParser()
-            df, meta = parser.parse_json(content)
-        except Exception as e:
-            raise ValueError(f"文件解析失败: {str(e)}")
-        
-        logger.progress(20, f"解析完成，共加载 {len(df)} 条消息")
-        logger.info(f"解析成功: {len(df)} messages")
-
-        # 2. Analyze (Stats)
-        logger.progress(30, "正在进行统计分析...")
-        analyzer = ChatAnalyzer(df)
-        stats = analyzer.get_basic_stats()
-        # Merge meta into stats if needed, or keep separate. 
-        # analyzer.get_basic_stats() returns dict. 
-        # meta contains chat_name.
-        stats.update(meta)
-        
-        daily_activity = analyzer.get_daily_activity()
-        logger.progress(40, "统计分析完成")
-        logger.info("基础统计完成")
+def task_pipeline():
+    return AnalysisPipeline(output_folder=OUTPUT_FOLDER, history_manager=history_manager, report_store=report_store,
+                            parse_cache=parse_cache, stats_preview=True)
 
-        # 3. AI Analysis (Map-Reduce)
-        logger.progress(45, "正在初始化 AI 分析组件...")
-        
-        llm_config = {}
-        # Base config for LLMClient (acts as default)
-        if config.get('mode') == 'custom':
-            llm_config = {
-                'api_key': config.get('api_key'),
-                'base_url': config.get('base_url'),
-                'model': config.get('model') # Default model
-            }
-        else:
-            logger.info("使用内置演示模式 (Mock)")
-            
-        # Get specific models for each phase
-        model_map = config.get('model_map') or llm_config.get('model')
-        model_reduce = config.get('model_reduce') or llm_config.get('model')
-        model_refine = config.get('model_refine') or llm_config.get('model')
-
-        client = LLMClient(**llm_config)
-        generator = ReportGenerator(client)
-        max_tokens = int(config.get('max_tokens', 128000))
-
-        # Step 1: Map (Quarterly/Periodic Analysis)
-        logger.info("正在进行切分...")
-        splits = analyzer.get_quarterly_splits()
-        
-        # Detect if it's a periodic split (non-full year)
-        is_periodic = False
-        if splits and any(k.startswith("Period_") for k in splits.keys()):
-            is_periodic = True
-            logger.info("检测到非完整年度数据，启用阶段性分析模式")
-        
-        quarterly_results = []
-        
-        total_quarters = len(splits)
-        if total_quarters == 0:
-            logger.info("切分失败，降级为全量分析")
-            splits = {"Whole_Year": df}
-            total_quarters = 1
-
-        processed_count = 0
-        for q_name, q_df in splits.items():
-            processed_count += 1
-            progress_start = 50 + int((processed_count - 1) / total_quarters * 30) # 50% -> 80%
-            logger.progress(progress_start, f"正在分析 {q_name} ({processed_count}/{total_quarters})...")
-            
-            if q_df.empty:
-                logger.info(f"分块 {q_name} 数据为空，跳过")
-                continue
-                
-            # Sample using Adaptive Strategy (Phase 2 - 3.3)
-            # Use smart_sample from global scope instead of q_analyzer method
-            sample_text = smart_sample(q_df, max_tokens, logger)
-            
-            # Generate
-            logger.info(f"发送 AI 请求: {q_name} (Model: {model_map})")
-            res = generator.generate_quarterly_analysis(q_name, sample_text, model=model_map, is_periodic=is_periodic)
-            quarterly_results.append(res)
-            
-        # Step 2: Reduce (Annual/Periodic Report)
-        logger.progress(85, "正在生成汇总报告...")
-        
-        # Prepare Global Stats for Reduce
-        global_stats_simple = {
-            'total_messages': stats.get('total_messages'),
-            'total_users': stats.get('total_users'),
-            'year': analyzer.get_target_year(),
-            'active_users_count': stats.get('active_users_count', 0), # Added safely
-            'silent_users_count': stats.get('silent_users_count', 0), # Added safely
-            'top_talkers': stats.get('top_talkers', []), # Added safely
-            'top_repeaters': stats.get('top_repeaters', []), # Added safely
-            'hardcore': analyzer.get_hardcore_stats()
-        }
-        
-        # 获取小剧场配置
-        anime_theme = config.get('anime_theme', 'default')
-        custom_theme_prompt = config.get('custom_theme_prompt', '')
-        
-        logger.info(f"发送 AI 请求: 汇总报告 (Model: {model_reduce})")
-        final_html = generator.generate_annual_report(
-            quarterly_results, 
-            global_stats_simple,
-            anime_theme=anime_theme,
-            custom_theme_prompt=custom_theme_prompt,
-            model=model_reduce,
-            is_periodic=is_periodic
-        )
-        logger.info("报告生成完成")
-
-        # 4. Render
-        logger.progress(95, "正在渲染 HTML...")
-        renderer = ReportRenderer()
-        chat_name = stats.get('title', 'QQ聊天记录')
-        report_filename = f"report_{task_id}.html"
-        report_path = os.path.join(OUTPUT_FOLDER, report_filename)
-        
-        # Get Hardcore Stats
-        rankings = analyzer.get_user_rankings()
-        
-        renderer.render(
-            stats=stats,
-            daily_activity=daily_activity,
-            summary=final_html, 
-            rankings=rankings,
-            output_path=report_path
-        )
-        
-        # 4.1 Enhance HTML (Optional)
-        if config.get('enhance_mode', False):
-            logger.progress(98, "正在进行最终输出增强 (HTML Refine)...")
-            logger.info(f"启动 HTML 修复与 CSS 优化... (Model: {model_refine})")
-            
-            try:
-                with open(report_path, 'r', encoding='utf-8') as f:
-                    raw_html = f.read()
-                
-                refined_html = generator.refine_report_html(raw_html, model=model_refine)
-                
-                if refined_html and len(refined_html) > 100:
-                    with open(report_path, 'w', encoding='utf-8') as f:
-                        f.write(refined_html)
-                    logger.info("HTML 增强完成并已保存")
-                else:
-                    logger.info("HTML 增强结果异常，保留原文件")
-                    
-            except Exception as e:
-                logger.info(f"HTML 增强失败: {e}")
-        
-        # 5. Save History
-        history_manager.add_record(
-            chat_name=chat_name,
-            messages_count=stats['total_messages'],
-            report_path=report_path
-        )
-
-        tasks[task_id]['result_url'] = f"/download/{report_filename}"
-        tasks[task_id]['state'] = 'completed'
-        logger.progress(100, "分析完成！")
-
-    except Exception as e:
-        logger.info(f"Error: {str(e)}")
-        tasks[task_id]['state'] = 'failed'
-        tasks[task_id]['error'] = str(e)
-    finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+def run_analysis_task(task_id, payload):
+    execute_task(tasks, task_id, payload, task_pipeline())
 
 # --- Routes ---
 
@@ -278,40 +121,145 @@ def run_analysis_task(task_id, file_path, config):
 def index():
     return render_template('index.html')
 
+@app.route('/api/upload', methods=['PUT', 'POST'])
+def stream_upload():
+    """
+    流式上传路由：请求体即文件内容，按块直接写入上传目录。
+    """
+    # 扩展名按客户端原始文件名检查：secure_filename 会去掉中文等非 ASCII 字符 ("测试群.json" -> "json")
+    original_name = request.headers.get('X-Filename') or request.args.get('filename', '')
+    # upload_id 始终由服务端生成并随响应返回，客户端无法指定或覆盖已有的上传记录
+    upload_id = str(uuid.uuid4())
+    purge_expired_uploads()
+    
+    if not allowed_file(strip_compression_suffix(original_name)):
+        return jsonify({'status': 'error', 'message': 'Invalid file type'})
+    
+    uploads.create(upload_id, {
+        'state': 'uploading',
+        'filename': original_name,
+        'bytes_received': 0,
+        'total_bytes': request.content_length,
+        'throughput_mbps': 0
+    })
+    
+    def on_progress(received, total, mbps):
+        uploads.update(upload_id, bytes_received=received, throughput_mbps=round(mbps, 2))
+    
+    try:
+        uploader = StreamingUploader(app.config['UPLOAD_FOLDER'])
+        info = uploader.receive(
+            request.stream,
+            original_name,
+            disk_filename(original_name, upload_id),
+            total_bytes=request.content_length,
+            progress_callback=on_progress
+        )
+        uploads.update(upload_id, state='completed', **info)
+        print(f"[Upload {upload_id}] {original_name}: {info['bytes_received']} bytes -> {info['bytes_written']} bytes, "
+              f"{info['seconds']}s, {info['throughput_mbps']} MB/s, sha256={info['sha256'][:12]}")
+        
+        return jsonify({
+            'status': 'success',
+            'upload_id': upload_id,
+            'sha256': info['sha256'],
+            'compression': info['compression'],
+            'bytes_received': info['bytes_received'],
+            'bytes_written': info['bytes_written'],
+            'seconds': info['seconds'],
+            'throughput_mbps': info['throughput_mbps']
+        })
+    except Exception as e:
+        uploads.update(upload_id, state='failed', error=str(e))
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/api/upload/<upload_id>')
+def upload_status(upload_id):
+    record = uploads.get(upload_id)
+    if record is None:
+        return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+    info = {k: v for k, v in record.items() if k != 'path'}
+    return jsonify(info)
+
+@app.route('/api/upload/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """放弃尚未认领的上传 (用户在估算后取消执行时调用)。"""
+    record = uploads.get(upload_id)
+    if record is None:
+        return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+    if record.get('state') == 'uploading':
+        return jsonify({'status': 'error', 'message': 'Upload in progress'}), 409
+    discard_upload(upload_id)
+    return jsonify({'status': 'success'})
+
+def start_task(save_paths, config, source_hashes=None):
+    task_id = str(uuid.uuid4())
+    
+    # Initialize Task
+    tasks.create(task_id, {
+        'state': 'queued',
+        'progress': 0,
+        'status_text': '等待队列...',
+        'result_url': None,
+        'error': None,
+        'source_hashes': source_hashes or []
+    })
+    payload = {'file_paths': save_paths, 'config': config, 'source_hashes': source_hashes or []}
+    
+    if tasks.durable:
+        # 持久化队列：由独立工作进程领取执行
+        tasks.enqueue(task_id, payload)
+    elif async_runner is not None:
+        # 共享事件循环：等待模型期间不占用线程
+        async_runner.submit(execute_task_async(tasks, task_id, payload, task_pipeline(), executor=async_runner.executor))
+    else:
+        # Start Thread
+        thread = threading.Thread(target=run_analysis_task, args=(task_id, payload))
+        thread.daemon = True
+        thread.start()
+    return task_id
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
+    config_str = request.form.get('config', '{}')
+    
+    # 流式上传路径：引用已经落盘的 upload_id
+    try:
+        upload_ids = parse_upload_ids(request.form.get('upload_ids'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if upload_ids:
+        try:
+            config = json.loads(config_str)
+            missing = [u for u in upload_ids if (uploads.get(u) or {}).get('state') != 'completed']
+            if missing:
+                return jsonify({'status': 'error', 'message': f'Upload not completed: {missing}'})
+            claimed = [uploads.pop(u) for u in upload_ids]
+            task_id = start_task([c['path'] for c in claimed], config, [c['sha256'] for c in claimed])
+            return jsonify({'status': 'success', 'task_id': task_id})
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': str(e)})
+    
     if 'file' not in request.files:
         return jsonify({'status': 'error', 'message': 'No file part'})
     
-    file = request.files['file']
-    config_str = request.form.get('config', '{}')
+    files = [f for f in request.files.getlist('file') if f.filename]
     
-    if file.filename == '':
+    if not files:
         return jsonify({'status': 'error', 'message': 'No selected file'})
     
-    if file and allowed_file(file.filename):
+    if all(allowed_file(f.filename) for f in files):
         try:
             config = json.loads(config_str)
-            filename = secure_filename(file.filename)
-            task_id = str(uuid.uuid4())
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{filename}")
-            file.save(save_path)
-            
-            # Initialize Task
-            tasks[task_id] = {
-                'state': 'queued',
-                'progress': 0,
-                'status_text': '等待队列...',
-                'logs': [],
-                'result_url': None,
-                'error': None
-            }
-            
-            # Start Thread
-            thread = threading.Thread(target=run_analysis_task, args=(task_id, save_path, config))
-            thread.daemon = True
-            thread.start()
+            batch_id = str(uuid.uuid4())
+            save_paths = []
+            for idx, file in enumerate(files):
+                filename = secure_filename(file.filename)
+                save_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{batch_id}_{idx}_{filename}")
+                file.save(save_path)
+                save_paths.append(save_path)
             
+            task_id = start_task(save_paths, config)
             return jsonify({'status': 'success', 'task_id': task_id})
             
         except Exception as e:
@@ -319,12 +267,33 @@ def analyze():
             
     return jsonify({'status': 'error', 'message': 'Invalid file type'})
 
+@app.route('/api/estimate', methods=['POST'])
+def estimate():
+    """
+    运行前估算：对已上传完成的文件 (upload_ids) 按给定配置规划分块与预算，
+    返回各阶段的 Token、耗时与费用估算及超出上限时的调整方案，供前端在确认执行前展示。
+    """
+    try:
+        upload_ids = parse_upload_ids(request.form.get('upload_ids'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    try:
+        config = json.loads(request.form.get('config', '{}'))
+        records = [uploads.get(u) for u in upload_ids]
+        if not records or any((r or {}).get('state') != 'completed' for r in records):
+            return jsonify({'status': 'error', 'message': 'Upload not completed'})
+        pipeline = AnalysisPipeline(output_folder=OUTPUT_FOLDER, parse_cache=parse_cache)
+        result = pipeline.estimate([r['path'] for r in records], config, [r['sha256'] for r in records])
+        return jsonify({'status': 'success', **result})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/status/<task_id>')
 def task_status(task_id):
-    if task_id not in tasks:
+    task = tasks.get(task_id)
+    if task is None:
         return jsonify({'status': 'error', 'message': 'Task not found'}), 404
     
-    task = tasks[task_id]
     # Return logs and clear them from server memory to avoid duplication if client polls?
     # Actually simple polling: client maintains offset or we just send all?
     # For simplicity, send all logs but client filters? Or we pop?
@@ -339,8 +308,7 @@ def task_status(task_id):
     # Better: return "new_logs" by checking an optional "last_log_index" param?
     # Let's keep it extremely simple: Send all logs, client handles it. 
     # Or actually, we pop logs! Because logs are ephemeral stream.
-    logs_to_send = list(task['logs']) # Copy
-    task['logs'] = [] # Clear sent logs
+    logs_to_send = tasks.pop_logs(task_id) # Read and clear sent logs
     
     return jsonify({
         'state': task['state'],
@@ -348,9 +316,62 @@ def task_status(task_id):
         'status_text': task['status_text'],
         'new_logs': logs_to_send,
         'result_url': task['result_url'],
+        'stats_url': f"/api/tasks/{task_id}/stats" if os.path.exists(stats_preview_path(task_id)) else None,
         'error': task['error']
     })
 
+@app.route('/api/tasks/<task_id>/stats')
+def task_stats(task_id):
+    """
+    统计预览：统计阶段完成后即可获取基础统计、排行榜、活跃趋势与作息热力图 (紧凑 JSON)，
+    无需等待 LLM 阶段；尚未生成时返回 202 与当前进度。
+    """
+    task = tasks.get(task_id)
+    if task is None:
+        return jsonify({'status': 'error', 'message': 'Task not found'}), 404
+    path = stats_preview_path(task_id)
+    if not os.path.exists(path):
+        return jsonify({'status': 'pending', 'state': task['state'], 'progress': task['progress']}), 202
+    # 预览文件只写一次 (原子替换)，按 ETag 协商缓存
+    return send_file(os.path.abspath(path), mimetype='application/json', conditional=True, max_age=0)
+
+@app.route('/api/tasks/<task_id>/preview')
+def task_preview(task_id):
+    """部分报告：由统计预览渲染，AI 段落显示占位文字；报告完成后仍可查看。"""
+    if tasks.get(task_id) is None:
+        return jsonify({'status': 'error', 'message': 'Task not found'}), 404
+    path = stats_preview_path(task_id)
+    if not os.path.exists(path):
+        return jsonify({'status': 'pending', 'message': 'Stats not ready'}), 202
+    with open(path, 'r', encoding='utf-8') as f:
+        preview = json.load(f)
+    return preview_renderer.render_preview(preview)
+
+@app.route('/api/cancel/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """
+    取消任务：记录取消请求时间，执行中的任务由其监视线程在下一次轮询时感知并中止。
+    """
+    task = tasks.get(task_id)
+    if task is None:
+        return jsonify({'status': 'error', 'message': 'Task not found'}), 404
+    if task['state'] in ('completed', 'failed', 'cancelled'):
+        return jsonify({'status': 'error', 'message': f"Task already {task['state']}"})
+    if not task.get('cancel_requested_at'):
+        tasks.update(task_id, cancel_requested_at=time.time(), status_text='正在取消...')
+    return jsonify({'status': 'success', 'task_id': task_id})
+
+@app.route('/api/metrics')
+def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot['json_parse_failure_rate'] = json_parse_failure_rates()
+    snapshot['client_pool'] = client_registry.stats()
+    snapshot['llm_throughput'] = throughput.snapshot()
+    snapshot['llm_endpoints'] = endpoint_router.stats()
+    if async_runner is not None:
+        snapshot['async_runner'] = async_runner.stats()
+    return jsonify(snapshot)
+
 @app.route('/api/history')
 def get_history():
     return jsonify(history_manager.get_records())
@@ -388,7 +409,7 @@ def test_connection_api():
         
         print(f"[Debug] Received Test Connection Request: Mode={mode}, BaseURL={base_url}, Model={model}")
         
-        # 临时实例化 Client 进行测试
+        # 实例化 Client 进行测试 (底层复用进程级连接池)
         client = LLMClient(mode=mode, api_key=api_key, base_url=base_url, model=model)
         
         result = client.test_connection()
@@ -400,8 +421,37 @@ def test_connection_api():
 
 @app.route('/download/<filename>')
 def download_file(filename):
-    return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
+    """
+    报告下载：内容寻址的报告按 Accept-Encoding 返回预压缩版本，支持强 ETag 与 304；
+    旧版 report_<task_id>.html 直接从输出目录返回。
+    """
+    digest = report_store.lookup(filename)
+    if digest is None:
+        return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
+    
+    path, encoding = report_store.negotiate(digest, request.headers.get('Accept-Encoding', ''))
+    etag = report_store.etag(digest, encoding)
+    if request.if_none_match.contains_weak(etag.strip('"')) or request.if_none_match.star_tag:
+        response = app.response_class(status=304)
+    else:
+        response = send_file(
+            os.path.abspath(path),
+            mimetype='text/html',
+            as_attachment=True,
+            download_name=f"report_{digest[:12]}.html",
+            conditional=False,
+            etag=False
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={REPORT_CACHE_MAX_AGE}, immutable'
+    metrics.incr('report_download_total', encoding=encoding or 'identity', status=response.status_code)
+    return response
 
 if __name__ == '__main__':
     print("Starting Flask Server at http://localhost:5000")
+    if tasks.durable:
+        print(f"Task backend: {TASK_BACKEND} ({TASK_STORE}), run `python worker.py` to process tasks")
     app.run(debug=True, port=5000)
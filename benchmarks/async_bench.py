@@ -0,0 +1,193 @@
+# benchmarks/async_bench.py
+
+"""
+Async Runner Benchmark
+======================
+在本地模拟的 OpenAI 兼容服务 (固定响应延迟) 上，对比两种任务执行方式的并发吞吐：
+  thread  每个任务一个线程，同步调用 LLM (app.py 默认的 run_analysis_task)
+  async   所有任务共享一个事件循环 (src.async_runner)，CPU 阶段在线程池中执行
+
+输出每种方式的总耗时、任务吞吐、LLM 请求数与峰值线程数。模拟服务运行在独立进程中，不计入线程数。
+
+用法 (在项目根目录，需要安装 openai):
+    python benchmarks/async_bench.py --tasks 8 32 --latency 1.0 --messages 3000
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.registry import *  # noqa: E402
+from src.task_store import create_task_store  # noqa: E402
+from src.pipeline import AnalysisPipeline  # noqa: E402
+from src.worker import execute_task, execute_task_async  # noqa: E402
+from src.async_runner import AsyncTaskRunner  # noqa: E402
+from src.metrics import metrics  # noqa: E402
+
+_SAMPLE = {str: "模拟内容", list: ["模拟"], dict: {"模拟": "角色"}}
+
+
+def mock_reply() -> str:
+    """同时满足 Map / Reduce Schema 的 JSON，避免触发补请求。"""
+    fields = {**MAP_JSON_SCHEMA, **REDUCE_JSON_SCHEMA}
+    return json.dumps({k: _SAMPLE[t] for k, t in fields.items()}, ensure_ascii=False)
+
+
+def serve_mock(port: int, latency: float) -> None:
+    """模拟 /v1/chat/completions：固定延迟后返回固定内容 (独立进程)。"""
+    body = json.dumps({
+        "id": "mock", "object": "chat.completion", "created": 0, "model": "mock",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": mock_reply()}}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200}
+    }).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def build_chat(path: str, messages: int) -> None:
+    """生成一份约 messages 条消息、覆盖一整年的聊天导出。"""
+    rng = random.Random(0)
+    words = "今天 考试 好耶 下雨 猫猫 睡觉 加班 游戏 周末 老板 奶茶 摸鱼".split()
+    start = datetime(2023, 1, 1)
+    step = 365 * 24 * 3600 / messages
+    records = []
+    for i in range(messages):
+        uin = rng.randint(1, 30)
+        records.append({
+            "timestamp": (start + timedelta(seconds=i * step + rng.random() * step)).isoformat(),
+            "sender": {"uin": str(10000 + uin), "name": f"用户{uin}"},
+            "content": {"text": " ".join(rng.choices(words, k=rng.randint(1, 8)))},
+            "isRecalled": False
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"chatInfo": {"name": "bench"}, "messages": records}, f, ensure_ascii=False)
+
+
+class ThreadWatcher:
+    """后台采样进程内线程数的峰值。"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._done.wait(0.02):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def make_tasks(store, source: str, work_dir: str, n: int, config: dict, prefix: str):
+    """每个任务一份数据源副本 (任务结束时会删除上传文件)。"""
+    tasks = []
+    for i in range(n):
+        task_id = f"{prefix}-{i}"
+        path = os.path.join(work_dir, f"{task_id}.json")
+        shutil.copyfile(source, path)
+        store.create(task_id, {'state': 'queued', 'progress': 0})
+        tasks.append((task_id, {'file_paths': [path], 'config': config, 'source_hashes': []}))
+    return tasks
+
+
+def run_thread(store, tasks, pipeline) -> None:
+    threads = [threading.Thread(target=execute_task, args=(store, task_id, payload, pipeline), daemon=True)
+               for task_id, payload in tasks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_async(store, tasks, pipeline, runner: AsyncTaskRunner) -> None:
+    futures = [runner.submit(execute_task_async(store, task_id, payload, pipeline, executor=runner.executor))
+               for task_id, payload in tasks]
+    for future in futures:
+        future.result()
+
+
+def llm_requests() -> float:
+    return sum(c['value'] for c in metrics.snapshot()['counters'] if c['name'] == 'llm_prompt_tokens_total') / 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Thread vs async task runner benchmark")
+    parser.add_argument('--tasks', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--latency', type=float, default=1.0, help="模拟服务的响应延迟 (秒)")
+    parser.add_argument('--messages', type=int, default=3000, help="每个任务的消息数")
+    parser.add_argument('--port', type=int, default=18931)
+    parser.add_argument('--cpu-workers', type=int, default=None, help="异步模式 CPU 线程池大小")
+    args = parser.parse_args(argv)
+
+    server = multiprocessing.Process(target=serve_mock, args=(args.port, args.latency), daemon=True)
+    server.start()
+    time.sleep(0.5)
+
+    work_dir = tempfile.mkdtemp(prefix="async_bench_")
+    source = os.path.join(work_dir, "chat.json")
+    build_chat(source, args.messages)
+    config = {
+        'mode': 'custom', 'base_url': f"http://127.0.0.1:{args.port}/v1", 'api_key': 'bench', 'model': 'mock',
+        'max_tokens': 32000, 'enhance_mode': False, 'out_of_core': False, 'hedge_requests': False
+    }
+    store = create_task_store(TASK_BACKEND_MEMORY)
+    pipeline = AnalysisPipeline(output_folder=work_dir)
+    runner = AsyncTaskRunner(args.cpu_workers)
+
+    print(f"{'tasks':>6}{'mode':>8}{'seconds':>10}{'tasks/min':>11}{'requests':>10}{'peak threads':>14}{'failed':>8}")
+    try:
+        for n in args.tasks:
+            for mode in ('thread', 'async'):
+                tasks = make_tasks(store, source, work_dir, n, config, f"{mode}{n}")
+                before = llm_requests()
+                started = time.perf_counter()
+                with ThreadWatcher() as watcher:
+                    if mode == 'thread':
+                        run_thread(store, tasks, pipeline)
+                    else:
+                        run_async(store, tasks, pipeline, runner)
+                elapsed = time.perf_counter() - started
+                failed = sum(1 for task_id, _ in tasks if store.get(task_id)['state'] != 'completed')
+                print(f"{n:>6}{mode:>8}{elapsed:>10.2f}{n / elapsed * 60:>11.1f}{llm_requests() - before:>10.0f}"
+                      f"{watcher.peak:>14}{failed:>8}")
+    finally:
+        runner.stop(timeout=5)
+        server.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
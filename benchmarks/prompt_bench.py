@@ -0,0 +1,101 @@
+# benchmarks/prompt_bench.py
+
+"""
+Prompt Assembly Benchmark
+=========================
+对比单个分块 Map Prompt 组装 (采样 + 拼接) 的两种方式的耗时与峰值内存分配：
+  legacy   df.apply(axis=1) 逐行格式化整列 -> tolist -> "\\n".join -> 模板 + 标题 + 正文拼接 (原实现)
+  builder  ChatLines 按列计算行长度，只格式化入选的行，PromptBuilder 一次 join (当前实现)
+
+未超出预算时两种方式生成的 Prompt 逐字节一致；legacy 的会话采样可能略超字符预算，
+builder 会在格式化前截去超出部分，此时其 Prompt 是 legacy 的前缀 (脚本会校验)。
+
+用法 (在项目根目录):
+    python benchmarks/prompt_bench.py --messages 20000 100000 --budgets 12000 200000 --rounds 3
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.pipeline import smart_sample  # noqa: E402
+from src.prompts import PromptManager  # noqa: E402
+from src.sessions import SessionIndex, sample_by_sessions  # noqa: E402
+
+
+def build_split(messages: int) -> pd.DataFrame:
+    """构造一个 messages 条消息的分块 (与解析结果相同的列)。"""
+    rng = random.Random(0)
+    words = "今天 考试 好耶 下雨 猫猫 睡觉 加班 游戏 周末 老板 奶茶 摸鱼".split()
+    return pd.DataFrame({
+        'datetime': pd.date_range("2023-01-01", periods=messages, freq="97s"),
+        'user_id': [str(rng.randint(1, 40)) for _ in range(messages)],
+        'user_name': [f"用户{rng.randint(1, 40)}" for _ in range(messages)],
+        'content': [" ".join(rng.choices(words, k=rng.randint(1, 40))) for _ in range(messages)],
+    })
+
+
+def assemble_legacy(df: pd.DataFrame, max_tokens: int, prompts: PromptManager) -> str:
+    target_chars = int(max_tokens * 1.5)
+    df['formatted_msg'] = df.apply(
+        lambda x: f"[{str(x['datetime'])[:16]}] {x.get('user_name', 'Unknown')}: {str(x['content'])[:100]}",
+        axis=1
+    )
+    full_text_list = df['formatted_msg'].tolist()
+    if sum(len(m) + 1 for m in full_text_list) <= target_chars:
+        sampled = full_text_list
+    else:
+        sampled = sample_by_sessions(full_text_list, SessionIndex.from_frame(df), target_chars)
+    return prompts.build_map_prompt("Q1", "\n".join(sampled))
+
+
+def assemble_builder(df: pd.DataFrame, max_tokens: int, prompts: PromptManager) -> str:
+    return prompts.build_map_prompt("Q1", smart_sample(df, max_tokens))
+
+
+def measure(fn, df, max_tokens, prompts, rounds):
+    """返回 (最佳耗时, 峰值分配 MB, 结果)；每轮使用分块副本，legacy 新增的列不影响下一轮。"""
+    best = float('inf')
+    for _ in range(rounds):
+        frame = df.copy()
+        started = time.perf_counter()
+        result = fn(frame, max_tokens, prompts)
+        best = min(best, time.perf_counter() - started)
+    frame = df.copy()
+    tracemalloc.start()
+    fn(frame, max_tokens, prompts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map prompt assembly benchmark")
+    parser.add_argument('--messages', type=int, nargs='+', default=[20000, 100000])
+    parser.add_argument('--budgets', type=int, nargs='+', default=[12000, 200000], help="单块采样 Token 预算")
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    prompts = PromptManager()
+    print(f"{'messages':>9}{'budget':>9}{'mode':>9}{'seconds':>10}{'peak MB':>10}{'prompt chars':>14}{'check':>9}")
+    for messages in args.messages:
+        df = build_split(messages)
+        for budget in args.budgets:
+            outputs = {}
+            for mode, fn in (('legacy', assemble_legacy), ('builder', assemble_builder)):
+                seconds, peak, outputs[mode] = measure(fn, df, budget, prompts, args.rounds)
+                check = ""
+                if mode == 'builder':
+                    legacy = outputs['legacy']
+                    check = "same" if legacy == outputs[mode] else "trimmed" if legacy.startswith(outputs[mode]) else "DIFF"
+                print(f"{messages:>9}{budget:>9}{mode:>9}{seconds:>10.3f}{peak:>10.1f}{len(outputs[mode]):>14}{check:>9}")
+
+
+if __name__ == '__main__':
+    main()
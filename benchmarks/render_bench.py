@@ -0,0 +1,98 @@
+# benchmarks/render_bench.py
+
+"""
+Render Benchmark
+================
+对比报告渲染的两种方式在多年 daily_activity 数据下的耗时与峰值内存：
+  legacy  每次新建 Environment、渲染为完整字符串后一次性写盘，内嵌 daily_activity 记录 (原实现)
+  stream  模块级缓存的 Environment + template.stream() 流式写盘，内嵌打包后的活跃度序列 (当前实现)
+
+用法 (在项目根目录):
+    python benchmarks/render_bench.py --years 1 5 10 --rounds 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.renderer import HTMLRenderer  # noqa: E402
+
+
+def build_inputs(years: int, summary_kb: int):
+    """构造 years 年的每日活跃数据、排行榜与 summary_kb KB 的 AI 文案。"""
+    dates = pd.date_range("2015-01-01", periods=365 * years, freq="D")
+    daily = pd.DataFrame({'date': dates.date, 'count': (pd.Series(range(len(dates))) % 500).values})
+    ranking = pd.DataFrame({'user_name': [f"user_{i}" for i in range(10)], 'count': list(range(100, 0, -10))})
+    block = "<p>" + "群友们在深夜讨论了很多有趣的话题。" * 32 + "</p>\n"
+    text = block * max(1, summary_kb * 1024 // len(block.encode('utf-8')))
+    summary = {key: text for key in ('portrait', 'quarterly_review', 'awards', 'moments', 'roasts', 'anime_theater', 'essay', 'timeline')}
+    summary['keywords'] = [f"kw{i}" for i in range(50)]
+    stats = {'chat_name': 'bench', 'total_messages': int(daily['count'].sum()), 'total_users': 200,
+             'total_images': 1234, 'days_covered': len(dates)}
+    rankings = {k: ranking for k in ('message_rank', 'image_rank', 'night_owl_rank', 'early_bird_rank')}
+    return stats, daily, summary, rankings
+
+
+def render_legacy(stats, daily, summary, rankings, output_path):
+    env = Environment(loader=FileSystemLoader("templates"))
+    template = env.get_template("report.html")
+    context = {
+        "title": f"{stats.get('chat_name', '群聊')} - 年度总结报告",
+        "stats": stats,
+        "daily_activity": daily.to_dict('records'),
+        "summary": summary,
+        "rankings": {k: df.to_dict('records') for k, df in rankings.items()},
+        "generated_at": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    html_content = template.render(**context)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html_content)
+
+
+def render_stream(stats, daily, summary, rankings, output_path):
+    HTMLRenderer().render(stats=stats, daily_activity=daily, summary=summary, rankings=rankings, output_path=output_path)
+
+
+def measure(fn, args, rounds):
+    """返回 (平均耗时 ms, 峰值内存 MB)。首轮用于预热 (含模板编译 / 字节码缓存)，不计入耗时。"""
+    fn(*args)
+    elapsed = []
+    peak = 0
+    for _ in range(rounds):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(*args)
+        elapsed.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sum(elapsed) / len(elapsed) * 1000, peak / 1024 / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report render micro-benchmark")
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--summary-kb', type=int, default=512, help="每个 AI 文案字段的大小 (KB)")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    out_dir = tempfile.mkdtemp(prefix="render_bench_")
+    print(f"{'years':>6}{'days':>8}{'legacy ms':>12}{'legacy MB':>12}{'stream ms':>12}{'stream MB':>12}{'legacy KB':>12}{'stream KB':>12}")
+    for years in args.years:
+        stats, daily, summary, rankings = build_inputs(years, args.summary_kb)
+        legacy_path, stream_path = os.path.join(out_dir, "legacy.html"), os.path.join(out_dir, "stream.html")
+        legacy = measure(render_legacy, (stats, daily, summary, rankings, legacy_path), args.rounds)
+        stream = measure(render_stream, (stats, daily, summary, rankings, stream_path), args.rounds)
+        sizes = [os.path.getsize(p) / 1024 for p in (legacy_path, stream_path)]
+        print(f"{years:>6}{len(daily):>8}{legacy[0]:>12.1f}{legacy[1]:>12.1f}{stream[0]:>12.1f}{stream[1]:>12.1f}"
+              f"{sizes[0]:>12.0f}{sizes[1]:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+# cli.py
+
+"""
+Headless CLI
+============
+命令行批处理入口：在同一进程内对多个群聊导出执行与 Web 服务相同的分析流水线。
+所有任务共享解析缓存、LLM 连接池、限流器与 Jinja 模板环境，支持断点续跑。
+
+用法示例:
+    python cli.py exports/ --jobs 4 --config config.json --output output/batch
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.registry import *
+from src.pipeline import AnalysisPipeline, ParseCache, build_llm_client, hash_file
+from src.ratelimit import RateLimiter
+from src.client_pool import client_registry
+from src.cancel import CancelToken, TaskCancelled
+from src.renderer import HTMLRenderer
+from src.history import HistoryManager
+
+HISTORY_FILE = 'history.json'
+CONFIG_FILE = 'config.json'
+
+
+class ConsoleLogger:
+    """与 app.TaskLogger 接口一致的控制台日志器。"""
+
+    def __init__(self, job_id: str, verbose: bool = False):
+        self.job_id = job_id
+        self.verbose = verbose
+
+    def info(self, msg):
+        print(f"[Job {self.job_id}] {msg}")
+
+    def progress(self, percent, status_text):
+        if self.verbose:
+            print(f"[Job {self.job_id}] {percent}% {status_text}")
+
+
+class JobManifest:
+    """
+    可续跑的任务清单，每次状态变化后原子写盘。
+    """
+
+    def __init__(self, path: str):
+        # 意义: 初始化清单
+        # 作用: 读取已有清单 (若存在)，用于跳过已完成的任务
+        # 关联: 默认位于输出目录下的 manifest.json
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.jobs = json.load(f).get('jobs', {})
+
+    def is_done(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id, {})
+        return job.get('state') == 'completed' and os.path.exists(job.get('report_path') or '')
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self.jobs.setdefault(job_id, {}).update(fields)
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': self.jobs}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+
+def discover_jobs(inputs):
+    """
+    将命令行输入展开为任务列表。
+
+    文件 / zip 为一个任务；目录下的每个文件、zip 或子目录各为一个任务 (子目录内的多份导出会被合并)。
+    """
+    jobs = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                child = os.path.join(path, name)
+                if os.path.isdir(child) or name.lower().endswith(tuple(INGEST_EXTENSIONS)):
+                    jobs.append(child)
+        elif os.path.exists(path):
+            jobs.append(path)
+        else:
+            print(f"[Warning] Input not found, skipped: {path}")
+    return [
+        {'id': hashlib.sha1(os.path.abspath(p).encode('utf-8')).hexdigest()[:12], 'source': p}
+        for p in jobs
+    ]
+
+
+def job_files(source: str):
+    """列出任务包含的原始文件，用于计算解析缓存键。"""
+    if not os.path.isdir(source):
+        return [source]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(source)
+        for name in names
+        if name.lower().endswith(tuple(INGEST_EXTENSIONS))
+    )
+
+
+def print_summary(jobs, manifest):
+    """输出每个任务的分阶段耗时汇总表。"""
+    stages = ['parse', 'stats', 'map', 'reduce', 'render', 'refine', 'total']
+    header = f"{'job':<14}{'state':<11}{'messages':>10}" + "".join(f"{s:>9}" for s in stages) + "  source"
+    print("\n" + header)
+    print("-" * len(header))
+    for job in jobs:
+        info = manifest.jobs.get(job['id'], {})
+        timings = info.get('timings', {})
+        cells = "".join(f"{timings[s]:>9.1f}" if s in timings else f"{'-':>9}" for s in stages)
+        print(f"{job['id']:<14}{info.get('state', 'pending'):<11}{info.get('messages', 0):>10}{cells}  {job['source']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QQ Chat AI Analyzer - 命令行批处理")
+    parser.add_argument('inputs', nargs='+', help="导出文件 / zip / 目录 (目录下每个条目为一个任务)")
+    parser.add_argument('--config', default=CONFIG_FILE, help="配置文件路径 (默认 config.json)")
+    parser.add_argument('--output', default='output', help="报告输出目录")
+    parser.add_argument('--jobs', type=int, default=2, help="同时运行的任务数")
+    parser.add_argument('--manifest', default=None, help=f"任务清单路径 (默认 <output>/{BATCH_MANIFEST_NAME})")
+    parser.add_argument('--max-concurrent-requests', type=int, default=4, help="所有任务共享的 LLM 并发请求上限")
+    parser.add_argument('--rpm', type=int, default=None, help="所有任务共享的每分钟 LLM 请求上限")
+    parser.add_argument('--no-history', action='store_true', help="不写入 history.json")
+    parser.add_argument('--verbose', action='store_true', help="输出进度信息")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = JobManifest(args.manifest or os.path.join(args.output, BATCH_MANIFEST_NAME))
+    jobs = discover_jobs(args.inputs)
+    if not jobs:
+        print("No jobs found.")
+        return 1
+
+    # 所有任务共享的组件
+    limiter = RateLimiter(args.max_concurrent_requests, args.rpm)
+    pipeline = AnalysisPipeline(
+        output_folder=args.output,
+        renderer=HTMLRenderer(),
+        parse_cache=ParseCache(),
+        history_manager=None if args.no_history else HistoryManager(HISTORY_FILE)
+    )
+
+    def run_job(job):
+        job_id = job['id']
+        if manifest.is_done(job_id):
+            print(f"[Job {job_id}] 已完成，跳过 ({job['source']})")
+            return
+        logger = ConsoleLogger(job_id, args.verbose)
+        manifest.update(job_id, source=job['source'], state='running', error=None, started_at=time.time())
+        try:
+            # 每个任务独立统计用量，底层共享进程级连接池 (src.client_pool) 与限流器
+            client = build_llm_client(config, rate_limiter=limiter)
+            hashes = [hash_file(p) for p in job_files(job['source'])]
+            token = CancelToken(float(config.get('deadline_seconds') or 0))
+            result = pipeline.run(job_id, [job['source']], config, logger, client=client,
+                                  source_hashes=hashes, cancel_token=token)
+            manifest.update(
+                job_id,
+                state='completed',
+                report_path=result['report_path'],
+                messages=int(result['total_messages']),
+                timings=result['timings'],
+                peak_rss_mb=result['peak_rss_mb'],
+                usage=result['usage'],
+                finished_at=time.time()
+            )
+        except TaskCancelled as e:
+            logger.info(f"Cancelled: {e.reason}")
+            manifest.update(job_id, state='failed', error=e.reason, finished_at=time.time())
+        except Exception as e:
+            logger.info(f"Error: {e}")
+            manifest.update(job_id, state='failed', error=str(e), finished_at=time.time())
+        finally:
+            # 失败 / 取消时删除残留的 out-of-core 工作集
+            working_set = pipeline.working_set_path(job_id)
+            if os.path.exists(working_set):
+                os.remove(working_set)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        list(pool.map(run_job, jobs))
+
+    print_summary(jobs, manifest)
+    client_registry.close_all()
+    failed = sum(1 for j in jobs if manifest.jobs.get(j['id'], {}).get('state') == 'failed')
+    print(f"\n{len(jobs)} jobs, {failed} failed, wall time {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,23 +7,177 @@ Chat Analyzer Module
 遵循 Phase 5 编程规范。
 """
 
+import time
+import threading
+import numpy as np
 import pandas as pd
 import jieba
 from collections import Counter
-from typing import Dict, List, Tuple, Any
+from collections.abc import Mapping
+from typing import Dict, List, Tuple, Any, Optional, Union
 from src.registry import *
+from src.temporal import compute_temporal_matrices, summarize_temporal
+from src.graph import build_interaction_graph, summarize_graph
+from src.sessions import SessionIndex, sample_by_sessions
+from src.events import detect_events
+from src.planner import plan_splits, estimate_message_tokens, predicted_coverage
+from src.columnar import MessageStore, LazySplits
+from src.metrics import metrics
 
 class ChatAnalyzer:
     """
     提供多种维度的聊天记录统计分析功能。
+
+    数据既可以是内存中的 DataFrame，也可以是 Arrow 工作集 (src.columnar.MessageStore，out-of-core 模式)；
+    各统计方法只读取自己需要的列。
+
+    排序后的时间列、年份计数、用户聚合表、作息掩码、密度序列等派生结果在首次访问时计算并缓存，
+    流水线与 API 重复调用时直接复用 (cache_stats 查看命中情况，invalidate 在数据变更后清除)。
+    缓存的 DataFrame / 数组为共享对象，调用方应只读。
     """
     
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, data: Union[pd.DataFrame, MessageStore]):
         # 意义: 初始化分析器
-        # 作用: 接收 DataFrame 并进行预处理（如过滤无效数据）
+        # 作用: 接收 DataFrame 或工作集；不再额外复制整张表
         # 关联: 被主程序调用，依赖 src.parser 的输出
-        self.df = df
-        self.msg_df = self.df.copy() # 目前不做复杂过滤，保留全量用于某些统计
+        if isinstance(data, MessageStore):
+            self.store, self.df = data, None
+        else:
+            self.store, self.df = None, data
+        self._cache: Dict[Any, Any] = {}
+        self._cache_stats: Dict[Any, Dict[str, float]] = {}
+        self._cache_lock = threading.RLock()
+
+    def _memo(self, key, compute):
+        """
+        返回 key 对应的派生结果，首次访问时调用 compute() 计算并缓存。
+        """
+        # 意义: 派生结果缓存
+        # 作用: 记录每个键的命中 / 未命中次数与计算耗时；可重入锁保证并发访问时只计算一次，
+        #       且允许派生结果之间相互依赖 (如用户聚合表依赖作息掩码)
+        # 关联: 各 get_* 方法与内部辅助方法，统计结果由 cache_stats 导出
+        with self._cache_lock:
+            entry = self._cache_stats.setdefault(key, {'hits': 0, 'misses': 0, 'seconds': 0.0})
+            if key in self._cache:
+                entry['hits'] += 1
+                metrics.incr('analyzer_cache_hits_total')
+                return self._cache[key]
+            started = time.perf_counter()
+            value = compute()
+            entry['misses'] += 1
+            entry['seconds'] += time.perf_counter() - started
+            metrics.incr('analyzer_cache_misses_total')
+            self._cache[key] = value
+            return value
+
+    def invalidate(self, *keys) -> None:
+        """清除指定派生结果的缓存 (不传参数时全部清除)，用于原始数据被修改之后。"""
+        with self._cache_lock:
+            if not keys:
+                self._cache.clear()
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        导出缓存统计：总命中 / 未命中次数、已缓存条目数，以及每个键的命中次数与计算耗时 (秒)。
+        """
+        with self._cache_lock:
+            items = {
+                str(key): {'hits': int(v['hits']), 'misses': int(v['misses']), 'seconds': round(v['seconds'], 4)}
+                for key, v in self._cache_stats.items()
+            }
+            return {
+                'entries': len(self._cache),
+                'hits': sum(v['hits'] for v in items.values()),
+                'misses': sum(v['misses'] for v in items.values()),
+                'items': items
+            }
+
+    @property
+    def empty(self) -> bool:
+        return len(self.store) == 0 if self.store is not None else self.df.empty
+
+    def get_frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取指定列。内存模式直接返回原 DataFrame (不复制)；工作集模式只解码这些列。
+        """
+        if self.store is not None:
+            return self.store.read(columns)
+        self._ensure_datetime()
+        return self.df
+
+    def _has_column(self, column: str) -> bool:
+        return column in (self.store.columns if self.store is not None else self.df.columns)
+
+    def _ensure_datetime(self) -> None:
+        """内存模式下确保 datetime 列为 datetime 类型 (工作集写入时已是)；检查与转换只做一次。"""
+        if self.df is not None:
+            self._memo('datetime_dtype', self._convert_datetime)
+
+    def _convert_datetime(self) -> bool:
+        if not self.df.empty and not pd.api.types.is_datetime64_any_dtype(self.df[COL_DATETIME]):
+            self.df[COL_DATETIME] = pd.to_datetime(self.df[COL_DATETIME])
+        return True
+
+    def _sorted(self) -> pd.DataFrame:
+        """内存模式下按时间排序的 DataFrame (已有序时不复制)。"""
+        def compute():
+            self._ensure_datetime()
+            monotonic = self.df[COL_DATETIME].is_monotonic_increasing
+            return self.df if monotonic else self.df.sort_values(COL_DATETIME, kind='stable')
+        return self._memo('sorted_df', compute)
+
+    def _sorted_datetimes(self) -> pd.Series:
+        """按时间排序的 datetime 列，行位置与 _take_rows 的区间一致。"""
+        def compute():
+            if self.store is not None:
+                return self.store.read([COL_DATETIME])[COL_DATETIME]
+            return self._sorted()[COL_DATETIME].reset_index(drop=True)
+        return self._memo('sorted_datetimes', compute)
+
+    def _year_counts(self) -> pd.Series:
+        """每年的消息数 (按消息数降序)，供基准年份与季度切分共用。"""
+        return self._memo('year_counts', lambda: self._sorted_datetimes().dt.year.value_counts())
+
+    def _hour_masks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(守夜人时段, 早起鸟时段) 的逐行布尔掩码 (与 get_frame 行顺序一致)。"""
+        def compute():
+            hours = self.get_frame([COL_HOUR])[COL_HOUR].to_numpy()
+            return ((hours >= NIGHT_HOURS[0]) & (hours < NIGHT_HOURS[1]),
+                    (hours >= EARLY_HOURS[0]) & (hours < EARLY_HOURS[1]))
+        return self._memo('hour_masks', compute)
+
+    def _user_table(self) -> pd.DataFrame:
+        """
+        按 (user_id, user_name) 聚合的用户表：messages / images / night / early 四列，行按首次出现排序。
+        龙虎榜、图王、守夜人、早起鸟等排行榜都由这一次 groupby 导出。
+        """
+        def compute():
+            df = self.get_frame([COL_USER_ID, COL_USER_NAME, COL_IMAGE_COUNT])
+            night, early = self._hour_masks()
+            table = pd.DataFrame({
+                COL_USER_ID: df[COL_USER_ID].to_numpy(),
+                COL_USER_NAME: df[COL_USER_NAME].to_numpy(),
+                'messages': 1,
+                'images': df[COL_IMAGE_COUNT].to_numpy() if COL_IMAGE_COUNT in df.columns else 0,
+                'night': night.astype(np.int64),
+                'early': early.astype(np.int64)
+            })
+            return table.groupby([COL_USER_ID, COL_USER_NAME], sort=False).sum()
+        return self._memo('user_table', compute)
+
+    def _take_rows(self, start: int, stop: int) -> pd.DataFrame:
+        """读取时间排序后 [start, stop) 行；工作集模式只读取 Map 阶段需要的列。"""
+        if self.store is not None:
+            return self.store.read(OOC_SPLIT_COLUMNS, start, stop)
+        return self._sorted().iloc[start:stop].copy()
+
+    def _make_splits(self, ranges: Dict[str, Tuple[int, int]]) -> Mapping:
+        """由行区间构建分块：内存模式立即切出，工作集模式按需读取 (LazySplits)。"""
+        if self.store is not None:
+            return LazySplits(ranges, self._take_rows)
+        return {name: self._take_rows(start, stop) for name, (start, stop) in ranges.items()}
 
     def get_basic_stats(self) -> Dict[str, Any]:
         """
@@ -33,55 +187,50 @@ class ChatAnalyzer:
         # 作用: 计算总消息数、用户数、图片数、撤回数等
         # 关联: 用于报告首页展示
         
-        if self.df.empty:
+        if self.empty:
             return {}
-            
-        return {
-            "total_messages": len(self.df),
-            "total_users": self.df[COL_USER_ID].nunique(),
-            "total_images": self.df[COL_IMAGE_COUNT].sum(),
-            "total_recalled": self.df[COL_IS_RECALLED].sum(),
-            "days_covered": (self.df[COL_DATETIME].max() - self.df[COL_DATETIME].min()).days if not self.df.empty else 0
-        }
+
+        def compute():
+            df = self.get_frame([COL_USER_ID, COL_IMAGE_COUNT, COL_IS_RECALLED])
+            datetimes = self._sorted_datetimes()
+            return {
+                "total_messages": len(df),
+                "total_users": df[COL_USER_ID].nunique(),
+                "total_images": df[COL_IMAGE_COUNT].sum(),
+                "total_recalled": df[COL_IS_RECALLED].sum(),
+                "days_covered": (datetimes.iloc[-1] - datetimes.iloc[0]).days
+            }
+        # 返回副本：流水线会向结果中合并元数据
+        return dict(self._memo('basic_stats', compute))
 
     def get_hardcore_stats(self, top_n: int = 5) -> Dict[str, Any]:
         """
         获取硬核统计数据：龙虎榜、图王、守夜人、早起鸟。
         """
-        if self.df.empty:
+        if self.empty:
             return {}
 
+        # 按显示名称汇总缓存的用户表 (与按名称 value_counts 等价)
+        by_name = self._user_table().groupby(level=COL_USER_NAME, sort=False).sum()
+
+        def top(column: str) -> Dict[str, int]:
+            counts = by_name[column]
+            counts = counts[counts > 0].sort_values(ascending=False, kind='stable').head(top_n)
+            return {name: int(count) for name, count in counts.items()}
+
         stats = {}
 
         # 1. 龙虎榜 (Most Active Users)
-        user_counts = self.df[COL_USER_NAME].value_counts().head(top_n)
-        stats['top_talkers'] = user_counts.to_dict()
+        stats['top_talkers'] = top('messages')
 
         # 2. 图王争霸 (Most Images)
-        # Assuming COL_IMAGE_COUNT exists and is numeric. If not, we might need to count 'image' type messages.
-        # Based on parser logic, usually we have image count or type.
-        # Let's check COL_IMAGE_COUNT definition in registry. It might not be there.
-        # If not, use message type filtering.
-        if COL_IMAGE_COUNT in self.df.columns:
-            img_counts = self.df.groupby(COL_USER_NAME)[COL_IMAGE_COUNT].sum().sort_values(ascending=False).head(top_n)
-            stats['top_img_senders'] = img_counts.to_dict()
-        else:
-             # Fallback: Count messages where type is 'image'
-             # We need to know the column for type. registry says JSON_FIELD_... but DataFrame columns might differ.
-             # Usually parser maps it. Let's assume a way to count images.
-             # If COL_IMAGE_COUNT is not reliable, we skip or implement fallback.
-             # For now, let's assume if it's 0, we try to count '[图片]' in content or check type if available.
-             stats['top_img_senders'] = {}
+        stats['top_img_senders'] = top('images') if self._has_column(COL_IMAGE_COUNT) else {}
 
         # 3. 守夜人 (00:00 - 05:00)
-        night_mask = (self.df[COL_HOUR] >= 0) & (self.df[COL_HOUR] < 5)
-        night_counts = self.df[night_mask][COL_USER_NAME].value_counts().head(top_n)
-        stats['night_owls'] = night_counts.to_dict()
+        stats['night_owls'] = top('night')
 
         # 4. 早起鸟 (05:00 - 08:00)
-        morning_mask = (self.df[COL_HOUR] >= 5) & (self.df[COL_HOUR] < 8)
-        morning_counts = self.df[morning_mask][COL_USER_NAME].value_counts().head(top_n)
-        stats['early_birds'] = morning_counts.to_dict()
+        stats['early_birds'] = top('early')
 
         return stats
 
@@ -90,41 +239,32 @@ class ChatAnalyzer:
         生成各类用户排行榜。
         """
         # 意义: 用户行为画像
-        # 作用: 计算活跃度、图片发送量、作息习惯等排名
+        # 作用: 计算活跃度、图片发送量、作息习惯等排名 (均由缓存的用户聚合表导出)
         # 关联: 对应报告中的“龙虎榜”模块
         
-        if self.df.empty:
+        if self.empty:
             return {}
 
-        # 1. 话痨榜 (Message Count)
-        msg_count = self.df.groupby([COL_USER_ID, COL_USER_NAME]).size().reset_index(name='count')
-        msg_rank = msg_count.sort_values('count', ascending=False).head(top_n)
-        
-        # 2. 图王榜 (Image Sharer)
-        img_count = self.df.groupby([COL_USER_ID, COL_USER_NAME])[COL_IMAGE_COUNT].sum().reset_index(name='count')
-        img_rank = img_count.sort_values('count', ascending=False).head(top_n)
-        
-        # 3. 守夜人 (Night Owl: 00:00 - 05:00)
-        night_df = self.df[(self.df[COL_HOUR] >= 0) & (self.df[COL_HOUR] < 5)]
-        if not night_df.empty:
-            night_count = night_df.groupby([COL_USER_ID, COL_USER_NAME]).size().reset_index(name='count')
-            night_rank = night_count.sort_values('count', ascending=False).head(top_n)
-        else:
-            night_rank = pd.DataFrame()
+        table = self._user_table()
 
-        # 4. 早起鸟 (Early Bird: 05:00 - 08:00)
-        morning_df = self.df[(self.df[COL_HOUR] >= 5) & (self.df[COL_HOUR] < 8)]
-        if not morning_df.empty:
-            morning_count = morning_df.groupby([COL_USER_ID, COL_USER_NAME]).size().reset_index(name='count')
-            morning_rank = morning_count.sort_values('count', ascending=False).head(top_n)
-        else:
-            morning_rank = pd.DataFrame()
+        def rank(column: str, drop_zero: bool = False) -> pd.DataFrame:
+            counts = table[column]
+            if drop_zero:
+                counts = counts[counts > 0]
+                if counts.empty:
+                    return pd.DataFrame()
+            ranked = counts.sort_values(ascending=False, kind='stable').head(top_n)
+            return ranked.reset_index(name='count')
 
         return {
-            'message_rank': msg_rank,
-            'image_rank': img_rank,
-            'night_owl_rank': night_rank,
-            'early_bird_rank': morning_rank
+            # 1. 话痨榜 (Message Count)
+            'message_rank': rank('messages'),
+            # 2. 图王榜 (Image Sharer)
+            'image_rank': rank('images'),
+            # 3. 守夜人 (Night Owl: 00:00 - 05:00)
+            'night_owl_rank': rank('night', drop_zero=True),
+            # 4. 早起鸟 (Early Bird: 05:00 - 08:00)
+            'early_bird_rank': rank('early', drop_zero=True)
         }
 
     def get_hourly_activity(self) -> pd.DataFrame:
@@ -135,96 +275,160 @@ class ChatAnalyzer:
         # 作用: 聚合计算 0-23 点的消息总量，补全缺失的小时
         # 关联: 用于生成热力图或折线图
         
-        if self.df.empty:
+        if self.empty:
             return pd.DataFrame({'hour': range(24), 'count': 0})
             
-        counts = self.df.groupby(COL_HOUR).size().reset_index(name='count')
-        all_hours = pd.DataFrame({'hour': range(24)})
-        result = pd.merge(all_hours, counts, on='hour', how='left').fillna(0)
-        return result
+        def compute():
+            hours = self.get_frame([COL_HOUR])[COL_HOUR].to_numpy(dtype=np.int64)
+            return np.bincount(hours, minlength=24)[:24]
+        return pd.DataFrame({'hour': range(24), 'count': self._memo('hour_counts', compute)})
+
+    def get_temporal_matrices(self) -> Dict[str, Any]:
+        """
+        获取 星期 × 小时 时间矩阵 (全群热力图 + 每个用户的 7×24 画像 + 作息得分)。
+        """
+        # 意义: 作息画像
+        # 作用: 一次向量化 bincount 完成，详见 src.temporal
+        # 关联: 用于报告热力图与 Reduce 阶段的统计数据
+        return self._memo('temporal_matrices', lambda: compute_temporal_matrices(
+            self.get_frame([COL_DATETIME, COL_USER_ID, COL_USER_NAME])))
+
+    def get_temporal_summary(self, top_n: int = 5) -> Dict[str, Any]:
+        """获取时间矩阵的紧凑摘要 (热力图、高峰时段、夜猫子 / 早起鸟得分榜)。"""
+        return self._memo(('temporal_summary', top_n), lambda: summarize_temporal(self.get_temporal_matrices(), top_n))
+
+    def get_interaction_graph(self) -> Dict[str, Any]:
+        """
+        获取基于 @提及 与接话的用户互动关系图 (稀疏有向加权边表)。
+        """
+        # 意义: 关系网络
+        # 作用: 详见 src.graph；关系事实由统计得出，不再依赖 LLM 从采样文本中猜测
+        # 关联: 用于 Map / Reduce 阶段 Prompt 中的互动关系数据
+        return self._memo('interaction_graph', lambda: build_interaction_graph(
+            self.get_frame([COL_DATETIME, COL_USER_ID, COL_USER_NAME, COL_MENTIONS])))
+
+    def get_interaction_summary(self, top_n: int = GRAPH_TOP_EDGES) -> Dict[str, Any]:
+        """获取互动关系摘要 (最强关系对、单向关注、互惠度、社群)。"""
+        return self._memo(('interaction_summary', top_n), lambda: summarize_graph(self.get_interaction_graph(), top_n))
+
+    def get_session_index(self, gap_seconds: float = SESSION_GAP_SECONDS) -> SessionIndex:
+        """
+        获取按消息间隔切分的会话索引。
+        """
+        # 意义: 对话切分
+        # 作用: 间隔超过 gap_seconds 即断开为新对话，详见 src.sessions
+        # 关联: 用于动态分块边界对齐、热门对话统计
+        return self._memo(('session_index', gap_seconds), lambda: SessionIndex.from_frame(
+            self.get_frame([COL_DATETIME, COL_USER_ID]), gap_seconds))
+
+    def get_top_sessions(self, top_n: int = SESSION_TOP_N, by: str = 'intensity') -> List[Dict[str, Any]]:
+        """获取最热门的若干段对话 (起止时间、消息数、参与人数、强度、突发度)。"""
+        index = self.get_session_index()
+        return index.describe(index.top(top_n, by))
+
+    def get_events(self, top_n: int = EVENT_TOP_N) -> List[Dict[str, Any]]:
+        """
+        获取统计检测的异常时刻 (消息激增 / 集中撤回 / 图片刷屏 / 复读接龙)。
+        """
+        # 意义: 事件检测
+        # 作用: 按时间顺序扫描 (工作集模式按记录批)，详见 src.events；摘录只读取事件窗口内的行
+        # 关联: 事件窗口在 Map 采样中优先保留，并注入 Map / Reduce Prompt
+        if self.empty:
+            return []
+
+        def compute():
+            columns = [COL_DATETIME, COL_USER_ID, COL_CONTENT, COL_IS_RECALLED, COL_IMAGE_COUNT]
+            batches = self.store.iter_batches(columns) if self.store is not None else [self._sorted()]
+            return detect_events(batches, self._take_rows, top_n)
+        return self._memo(('events', top_n), compute)
 
     def get_daily_activity(self) -> pd.DataFrame:
         """
         统计每日的消息数量。
         """
-        if self.df.empty:
+        if self.empty:
             return pd.DataFrame(columns=['date', 'count'])
             
-        # Ensure datetime column is datetime type
-        if not pd.api.types.is_datetime64_any_dtype(self.df[COL_DATETIME]):
-             self.df[COL_DATETIME] = pd.to_datetime(self.df[COL_DATETIME])
-             
-        daily = self.df.groupby(self.df[COL_DATETIME].dt.date).size().reset_index(name='count')
-        daily.columns = ['date', 'count']
-        return daily
+        def compute():
+            datetimes = self._sorted_datetimes()
+            daily = datetimes.groupby(datetimes.dt.date).size().reset_index(name='count')
+            daily.columns = ['date', 'count']
+            return daily
+        return self._memo('daily_activity', compute)
 
     def get_word_cloud_data(self, top_n: int = 50) -> List[Tuple[str, int]]:
         """
         提取高频词汇用于生成词云。
         """
         # 意义: 文本内容分析
-        # 作用: 对消息内容进行分词、去停用词、统计词频
+        # 作用: 对消息内容进行分词、去停用词、统计词频；工作集模式按批流式分词
         # 关联: 依赖 jieba 库，用于生成词云图
         
-        if self.df.empty:
+        if self.empty:
             return []
             
-        text = " ".join(self.df[COL_CONTENT].dropna().astype(str).tolist())
-        
         # 基础停用词 (Phase 1) - 后续可扩展到配置文件
         stop_words = {'的', '了', '是', '我', '你', '在', '他', '我们', '好', '去', '吧', '吗', 
                       '有', '就', '不', '人', '都', '一个', '上', '也', '很', '啊', '哦', '嗯',
                       '哈', '哈哈', '哈哈哈', '图片', '表情', 'video', 'image', 'nan', '[', ']'}
-        
-        words = jieba.cut(text)
-        filtered_words = [w for w in words if len(w) > 1 and w not in stop_words]
-        
-        return Counter(filtered_words).most_common(top_n)
 
-    def get_quarterly_splits(self) -> Dict[str, pd.DataFrame]:
+        def compute():
+            batches = self.store.iter_batches([COL_CONTENT]) if self.store is not None else [self.df]
+            counter = Counter()
+            for batch in batches:
+                text = " ".join(batch[COL_CONTENT].dropna().astype(str).tolist())
+                counter.update(w for w in jieba.cut(text) if len(w) > 1 and w not in stop_words)
+            return counter
+
+        # 分词结果 (完整词频) 只计算一次，不同 top_n 共用
+        return self._memo('word_counts', compute).most_common(top_n)
+
+    def get_quarterly_splits(self) -> Mapping:
         """
         智能切分策略：
         1. 首先尝试按自然季度切分。
         2. 检查数据分布是否极度不均（如集中在某一个季度）或时间跨度过短。
         3. 如果满足条件，切换为“等量分块模式”，将数据按消息量均分为 4 份。
         """
-        if self.df.empty:
+        if self.empty:
             return {}
+        ranges = self._quarter_ranges()
+        if ranges is None:
+            # 切换到动态等量切分
+            return self._get_dynamic_splits(4)
+        return self._make_splits(ranges)
 
-        # 确保 datetime 列是 datetime 类型
-        if not pd.api.types.is_datetime64_any_dtype(self.df[COL_DATETIME]):
-             self.df[COL_DATETIME] = pd.to_datetime(self.df[COL_DATETIME])
+    def _quarter_ranges(self) -> Optional[Dict[str, Tuple[int, int]]]:
+        """消息最多的年份的自然季度行区间 (时间排序后)；季度切分失效 (极度集中或跨度过短) 时返回 None。"""
+        datetimes = self._sorted_datetimes()
         
         # 1. 找到消息最多的年份
-        year_counts = self.df[COL_DATETIME].dt.year.value_counts()
+        year_counts = self._year_counts()
         if year_counts.empty:
-            return {}
+            return None
         target_year = year_counts.idxmax()
-        self.target_year = target_year 
         
         # 获取时区信息
-        tz = self.df[COL_DATETIME].dt.tz
-
-        # 2. 尝试标准季度切分
-        q1_start = pd.Timestamp(f"{target_year}-01-01", tz=tz)
-        q2_start = pd.Timestamp(f"{target_year}-04-01", tz=tz)
-        q3_start = pd.Timestamp(f"{target_year}-07-01", tz=tz)
-        q4_start = pd.Timestamp(f"{target_year}-10-01", tz=tz)
-        
-        splits = {}
-        splits['First_quarter'] = self.df[(self.df[COL_DATETIME] >= q1_start) & (self.df[COL_DATETIME] < q2_start)].copy()
-        splits['Second_quarter'] = self.df[(self.df[COL_DATETIME] >= q2_start) & (self.df[COL_DATETIME] < q3_start)].copy()
-        splits['Third_quarter'] = self.df[(self.df[COL_DATETIME] >= q3_start) & (self.df[COL_DATETIME] < q4_start)].copy()
-        splits['Fourth_quarter'] = self.df[(self.df[COL_DATETIME] >= q4_start)].copy()
+        tz = datetimes.dt.tz
+
+        # 2. 尝试标准季度切分 (在排序后的时间列上二分查找各季度起点)
+        q_starts = [pd.Timestamp(f"{target_year}-{month:02d}-01", tz=tz) for month in (1, 4, 7, 10)]
+        p1, p2, p3, p4 = (int(p) for p in datetimes.searchsorted(q_starts))
+        ranges = {
+            'First_quarter': (p1, p2),
+            'Second_quarter': (p2, p3),
+            'Third_quarter': (p3, p4),
+            'Fourth_quarter': (p4, len(datetimes))
+        }
         
         # 3. 智能检测机制
-        total_msgs = len(self.df)
+        total_msgs = len(datetimes)
         if total_msgs < 100: # 数据太少不折腾
-            return splits
+            return ranges
             
-        counts = [len(splits[k]) for k in splits]
+        counts = [stop - start for start, stop in ranges.values()]
         max_ratio = max(counts) / total_msgs
-        days_covered = (self.df[COL_DATETIME].max() - self.df[COL_DATETIME].min()).days
+        days_covered = (datetimes.iloc[-1] - datetimes.iloc[0]).days
         
         # 触发条件：
         # A. 某一季度占据超过 80% 的数据 (极度偏科)
@@ -237,57 +441,105 @@ class ChatAnalyzer:
         is_short_duration = days_covered < 200 # 约半年多一点
         
         if is_concentrated or is_short_duration:
-            # 切换到动态等量切分
-            return self._get_dynamic_splits(4)
+            return None
             
-        return splits
+        return ranges
 
-    def _get_dynamic_splits(self, n_splits: int = 4) -> Dict[str, pd.DataFrame]:
+    def _get_dynamic_splits(self, n_splits: int = 4) -> Mapping:
         """
         将 DataFrame 按消息数量均分为 n 份。
         """
-        if self.df.empty:
+        if self.empty:
             return {}
             
         # 确保按时间排序
-        df_sorted = self.df.sort_values(COL_DATETIME)
-        total = len(df_sorted)
+        datetimes = self._sorted_datetimes()
+        total = len(datetimes)
         chunk_size = total // n_splits
-        
-        splits = {}
-        for i in range(n_splits):
-            start_idx = i * chunk_size
-            # 最后一个分块包含剩余所有
-            if i == n_splits - 1:
-                end_idx = total
-            else:
-                end_idx = (i + 1) * chunk_size
-                
-            chunk = df_sorted.iloc[start_idx:end_idx].copy()
+
+        # 分块边界对齐到最近的会话起点，避免把一段对话拆到两个分块里
+        index = self._boundary_index()
+        bounds = [0] + [index.nearest_boundary(i * chunk_size) for i in range(1, n_splits)] + [total]
+        return self._splits_from_bounds(datetimes, np.maximum.accumulate(bounds))
+
+    def get_planned_splits(self, split_budget: int, coverage: float = SPLIT_TARGET_COVERAGE,
+                           max_splits: int = SPLIT_MAX_CALLS) -> Tuple[Mapping, Dict[str, Any]]:
+        """
+        按 Token 预算规划分块 (替代固定 4 块)。
+
+        Args:
+            split_budget: 单个 Map 请求可容纳的聊天记录 Token 数
+            coverage: 目标覆盖率
+            max_splits: 最大分块数 (Map 调用数上限)
+
+        Returns:
+            (splits, plan): plan 为 src.planner.plan_splits 的结果，额外带 mode (quarterly / periodic)
+        """
+        # 意义: 自适应分块
+        # 作用: 分块数由数据量与预算决定，边界按 Token 量均分并对齐会话间隙；
+        #       恰好规划为 4 块、数据位于同一自然年且季度切分有效时，沿用自然季度 (年度报告措辞)，
+        #       此时 boundaries / split_tokens / predicted_coverage 按季度区间重新计算
+        # 关联: 被 AnalysisPipeline 的 Map 阶段调用；plan 供 plan_budget 与 /api/estimate 估算
+        if self.empty:
+            return {}, {'n_splits': 0, 'mode': 'periodic', 'boundaries': [0, 0]}
+
+        datetimes = self._sorted_datetimes()
+        tokens = self._message_tokens()
+        plan = plan_splits(tokens, split_budget, coverage, max_splits, index=self._boundary_index())
+        if plan['n_splits'] == 4 and datetimes.iloc[0].year == datetimes.iloc[-1].year:
+            ranges = self._quarter_ranges()
+            if ranges is not None:
+                plan['mode'] = 'quarterly'
+                plan['boundaries'] = [start for start, _ in ranges.values()] + [len(datetimes)]
+                plan['split_tokens'] = [int(tokens[start:stop].sum()) for start, stop in ranges.values()]
+                plan['predicted_coverage'] = predicted_coverage(plan['split_tokens'], plan['split_budget'])
+                return self._make_splits(ranges), plan
+        plan['mode'] = 'periodic'
+        return self._splits_from_bounds(datetimes, plan['boundaries']), plan
+
+    def _message_tokens(self) -> np.ndarray:
+        """时间排序后每条消息的估算 Token 数；只需内容与名称两列，工作集模式按批读取。"""
+        def compute():
+            if self.store is not None:
+                return np.concatenate([
+                    estimate_message_tokens(batch)
+                    for batch in self.store.iter_batches([COL_CONTENT, COL_USER_NAME])
+                ])
+            return estimate_message_tokens(self._sorted())
+        return self._memo('message_tokens', compute)
+
+    def _boundary_index(self) -> SessionIndex:
+        """时间排序后的会话索引 (不含参与人统计)，用于分块边界对齐。"""
+        return self._memo('boundary_index', lambda: SessionIndex(self._sorted_datetimes().to_numpy()))
+
+    def _splits_from_bounds(self, datetimes: pd.Series, bounds) -> Mapping:
+        """按边界位置切出 Period_X 分块 (边界重合产生的空块会被跳过)。"""
+        ranges = {}
+        for i in range(len(bounds) - 1):
+            start_idx, end_idx = int(bounds[i]), int(bounds[i + 1])
+            if start_idx >= end_idx and len(bounds) > 2:
+                continue
             
-            if chunk.empty:
+            if start_idx >= end_idx:
                 time_range_str = "No Data"
             else:
-                start_date = chunk[COL_DATETIME].min().strftime("%m.%d")
-                end_date = chunk[COL_DATETIME].max().strftime("%m.%d")
+                start_date = datetimes.iloc[start_idx].strftime("%m.%d")
+                end_date = datetimes.iloc[end_idx - 1].strftime("%m.%d")
                 time_range_str = f"{start_date}-{end_date}"
             
             # 使用 Period_X 作为 key，并附带时间范围供 LLM 理解
-            key_name = f"Period_{i+1} ({time_range_str})"
-            splits[key_name] = chunk
+            key_name = f"Period_{len(ranges)+1} ({time_range_str})"
+            ranges[key_name] = (start_idx, end_idx)
             
-        return splits
+        return self._make_splits(ranges)
 
     def get_target_year(self) -> int:
         """
         获取分析的基准年份。
         """
-        if hasattr(self, 'target_year'):
-            return self.target_year
-        elif not self.df.empty:
-            if not pd.api.types.is_datetime64_any_dtype(self.df[COL_DATETIME]):
-                self.df[COL_DATETIME] = pd.to_datetime(self.df[COL_DATETIME])
-            return self.df[COL_DATETIME].dt.year.mode()[0]
+        if not self.empty:
+            # 与季度切分使用同一份年份计数：消息最多的年份
+            return int(self._year_counts().idxmax())
         else:
             return pd.Timestamp.now().year
 
@@ -299,14 +551,14 @@ class ChatAnalyzer:
         # 作用: 统计单位时间内的消息数量，用于识别热点时刻
         # 关联: Phase 2 Level 3 采样策略依赖此数据提取高密度窗口
         
-        if self.df.empty:
+        if self.empty:
             return pd.DataFrame()
             
-        # 设置时间索引
-        temp_df = self.df.set_index(COL_DATETIME)
-        # 重采样计数
-        density = temp_df.resample(window_size).size().reset_index(name='count')
-        return density
+        # 只需时间列：以时间为索引重采样计数 (按窗口大小分别缓存)
+        def compute():
+            datetimes = self._sorted_datetimes()
+            return pd.Series(1, index=datetimes).resample(window_size).size().reset_index(name='count')
+        return self._memo(('density', window_size), compute)
 
     def adaptive_sample(self, max_tokens: int = 4000, logger=None) -> str:
         """
@@ -358,11 +610,11 @@ class ChatAnalyzer:
         1. 格式化为 [MM-DD HH:mm] Name: Content
         2. 合并同一用户 1 分钟内的连续发言
         """
-        if self.df.empty:
+        if self.empty:
             return []
 
-        # 确保按时间排序
-        df_sorted = self.df.sort_values(COL_DATETIME)
+        # 确保按时间排序 (只读取格式化需要的列)
+        df_sorted = self.get_frame([COL_DATETIME, COL_USER_NAME, COL_CONTENT]).sort_values(COL_DATETIME)
         
         results = []
         current_group = None
@@ -438,72 +690,18 @@ class ChatAnalyzer:
 
     def _smart_focus_sample(self, msgs: List[Dict[str, Any]], max_tokens: int, logger) -> str:
         """
-        Level 3: 基于密度的智能采样
-        1. 计算密度，提取 Top N 热点窗口
-        2. 热点窗口内保留全部/大部分
-        3. 非热点窗口稀疏采样
+        Level 3: 基于会话的智能采样
+        1. 按消息间隔切分会话，按强度排序
+        2. 在预算内保留最热门的完整会话
+        3. 其余消息稀疏采样作为背景
         """
         if not msgs:
             return ""
 
         # Target chars
         target_chars = int(max_tokens * 1.5)
-        
-        # 1. 转换为 DataFrame 以方便时间窗口计算
-        times = [m['time'] for m in msgs]
-        df_temp = pd.DataFrame({'time': times, 'msg': msgs})
-        df_temp.set_index('time', inplace=True)
-        
-        # 2. 计算 10分钟 窗口的消息量
-        density = df_temp.resample('10min').count()
-        
-        # 3. 找出 Top 20 热点窗口
-        top_windows = density.sort_values('msg', ascending=False).head(20).index
-        
-        # 标记每条消息是否在热点窗口内
-        final_selection = []
-        # 将热点窗口转为 set 以便快速查找 (简单起见，按整点比较)
-        # 这里使用一个简单策略：遍历消息，如果它属于某个 Top 窗口，则标记为 Hot
-        
-        # 为了高效，我们可以给 df_temp 加一列 is_hot
-        df_temp['is_hot'] = False
-        for window_start in top_windows:
-            window_end = window_start + pd.Timedelta(minutes=10)
-            # 标记窗口内的消息
-            mask = (df_temp.index >= window_start) & (df_temp.index < window_end)
-            df_temp.loc[mask, 'is_hot'] = True
-            
-        # 4. 采样
-        # 热点区域：保留 (如果总量还是太大，可能需要进一步压缩，这里暂定全保留)
-        # 非热点区域：1/10 采样 (或者根据剩余空间动态计算)
-        
-        # 估算热点区域大小
-        hot_msgs = df_temp[df_temp['is_hot']]['msg'].tolist()
-        hot_chars = sum(len(m['text']) for m in hot_msgs)
-        
-        remaining_budget = target_chars - hot_chars
-        
-        if remaining_budget < 0:
-            # 热点都装不下，只取热点的前部分或 Top 10 窗口
-            if logger: logger.info("热点数据过多，仅保留热点窗口")
-            selected_msgs = hot_msgs
-        else:
-            # 还有预算，填充非热点数据
-            cold_msgs = df_temp[~df_temp['is_hot']]['msg'].tolist()
-            if not cold_msgs:
-                selected_msgs = hot_msgs
-            else:
-                cold_chars = sum(len(m['text']) for m in cold_msgs)
-                if cold_chars <= remaining_budget:
-                    # 全装下
-                    selected_msgs = hot_msgs + cold_msgs
-                else:
-                    # 均匀采样冷数据
-                    step = int(cold_chars / max(1, remaining_budget)) + 1
-                    sampled_cold = cold_msgs[::step]
-                    selected_msgs = hot_msgs + sampled_cold
-        
-        # 重新按时间排序
-        selected_msgs.sort(key=lambda x: x['time'])
-        
-        return "\n".join([m['text'] for m in selected_msgs])
+
+        index = SessionIndex([m['time'] for m in msgs])
+        selected = sample_by_sessions([m['text'] for m in msgs], index, target_chars)
+        if logger: logger.info(f"会话采样: {len(index)} 段对话，从 {len(msgs)} 条中保留 {len(selected)} 条")
+        return "\n".join(selected)
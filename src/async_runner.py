@@ -0,0 +1,79 @@
+# src/async_runner.py
+
+"""
+Async Task Runner Module
+========================
+负责以单个 asyncio 事件循环驱动多个分析任务：LLM 请求在事件循环上等待 (AsyncOpenAI)，
+解析 / 统计 / 采样 / 渲染等 CPU 阶段在有限大小的线程池中执行 (src.steps.arun_steps)，
+不再为每个任务创建一个线程，几十个任务的模型流量只占用一个事件循环线程。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Coroutine, Dict, Optional
+
+from src.registry import *
+from src.client_pool import client_registry
+from src.metrics import metrics
+
+
+class AsyncTaskRunner:
+    """
+    后台事件循环 + CPU 执行器。线程安全：可从 Flask 请求线程或工作进程主循环提交任务。
+
+    CPU 执行器使用线程池而不是进程池：流水线以生成器逐段推进，无法跨进程传递；
+    解析阶段本身已使用进程池 (src.ingest)，pandas 的主要计算也会释放 GIL。
+    """
+
+    def __init__(self, cpu_workers: Optional[int] = None):
+        # 意义: 初始化执行器
+        # 作用: cpu_workers 为空时取 min(ASYNC_CPU_WORKERS, CPU 核数)；事件循环在守护线程中常驻
+        # 关联: app.py (TASK_RUNNER=async) 与 src.worker.worker_loop (concurrency > 1) 使用
+        self.cpu_workers = cpu_workers or max(1, min(ASYNC_CPU_WORKERS, os.cpu_count() or 1))
+        self.executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="pipeline-cpu")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._serve, name="pipeline-loop", daemon=True)
+        self._thread.start()
+
+    def _serve(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """提交协程 (通常为 src.worker.execute_task_async) 到事件循环，返回 concurrent.futures.Future。"""
+        with self._lock:
+            self._active += 1
+        metrics.incr('async_runner_tasks_total')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._active -= 1
+
+    @property
+    def active(self) -> int:
+        """在途任务数。"""
+        return self._active
+
+    def stats(self) -> Dict[str, Any]:
+        return {'active_tasks': self._active, 'cpu_workers': self.cpu_workers}
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """关闭异步客户端并停止事件循环与执行器 (在途任务不会等待完成)。"""
+        if not self.loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client_registry.close_async(), self.loop).result(timeout)
+        except Exception as e:
+            print(f"[Warning] Failed to close async clients: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,241 @@
+# src/budget.py
+
+"""
+LLM Budget Controller Module
+============================
+负责单个任务的 LLM 成本与延迟预算：在调用任何模型之前，根据分块规划与各模型的历史输出速度
+估算每个阶段 (Map / Reduce / Refine) 的输入输出 Token、费用与耗时，
+并在超出任务上限时依次跳过 HTML 增强、缩减每块的采样预算。
+遵循 Phase 5 编程规范。
+"""
+
+import threading
+from typing import Dict, Any, List, Optional
+from src.registry import *
+from src.prompts import PromptManager
+
+
+class ThroughputTracker:
+    """
+    进程内各模型的输出速度 (Token / 秒) 的指数加权平均，由 LLMClient 在每次请求后更新。
+    """
+
+    def __init__(self, alpha: float = BUDGET_THROUGHPUT_ALPHA):
+        self.alpha = alpha
+        self._rates: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, elapsed: float) -> None:
+        """记录一次请求：扣除固定开销与输入处理时间后，剩余时间视为生成时间。"""
+        if completion_tokens <= 0 or elapsed <= 0:
+            return
+        generation = elapsed - BUDGET_REQUEST_OVERHEAD_SECONDS - prompt_tokens / BUDGET_INPUT_TOKENS_PER_SECOND
+        rate = completion_tokens / max(generation, elapsed * 0.1)
+        with self._lock:
+            entry = self._rates.get(model)
+            if entry is None:
+                self._rates[model] = {'output_tps': rate, 'samples': 1}
+            else:
+                entry['output_tps'] += self.alpha * (rate - entry['output_tps'])
+                entry['samples'] += 1
+
+    def output_tps(self, model: str) -> float:
+        with self._lock:
+            entry = self._rates.get(model)
+            return entry['output_tps'] if entry else BUDGET_DEFAULT_OUTPUT_TPS
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {m: {'output_tps': round(v['output_tps'], 2), 'samples': int(v['samples'])} for m, v in self._rates.items()}
+
+
+# 模块级单例，同一进程内的所有任务共享历史速度
+throughput = ThroughputTracker()
+
+_prompts = PromptManager()
+
+
+def _prompt_tokens(text: str) -> int:
+    return int(len(text) / TOKENS_PER_CHAR_ESTIMATE)
+
+
+def _stage(model: str, calls: int, input_tokens: float, output_tokens: float, seconds: float,
+           prices: Dict[str, Any]) -> Dict[str, Any]:
+    price = prices.get(model)
+    cost = (input_tokens * price[0] + output_tokens * price[1]) / 1e6 if price else None
+    return {
+        'model': model,
+        'calls': int(calls),
+        'input_tokens': int(input_tokens),
+        'output_tokens': int(output_tokens),
+        'seconds': round(seconds, 1),
+        'cost': round(cost, 4) if cost is not None else None
+    }
+
+
+def _request_seconds(model: str, input_tokens: float, output_tokens: float, tracker: ThroughputTracker) -> float:
+    return BUDGET_REQUEST_OVERHEAD_SECONDS + input_tokens / BUDGET_INPUT_TOKENS_PER_SECOND \
+        + output_tokens / tracker.output_tps(model)
+
+
+def _map_stage(model: str, inputs: List[float], tracker: ThroughputTracker, prices: Dict[str, Any]) -> Dict[str, Any]:
+    """Map 类阶段：分块逐个串行请求，每次输出 BUDGET_MAP_OUTPUT_TOKENS。"""
+    seconds = sum(_request_seconds(model, t, BUDGET_MAP_OUTPUT_TOKENS, tracker) for t in inputs)
+    return _stage(model, len(inputs), sum(inputs), BUDGET_MAP_OUTPUT_TOKENS * len(inputs), seconds, prices)
+
+
+def estimate_task(plan: Dict[str, Any], sample_budget: int, models: Dict[str, str], refine: Optional[str] = None,
+                  is_periodic: bool = False, prices: Optional[Dict[str, Any]] = None,
+                  tracker: ThroughputTracker = throughput, cascade: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    估算一次任务各阶段的 Token、费用与耗时。
+
+    Args:
+        plan: ChatAnalyzer.get_planned_splits 返回的规划 (使用 split_tokens)
+        sample_budget: 每块聊天记录的采样预算 (Token)
+        models: map / reduce / refine 各阶段使用的模型
+        refine: HTML 增强模式 (sections / full)，为空表示不增强
+        prices: 模型单价 {model: [输入, 输出]} (每百万 Token)，缺少单价的模型费用为 None
+        cascade: 级联设置 (src.cascade.cascade_settings)，提供时拆分为 screen (全部分块、小采样) 与
+                 map (最大的 hot_splits 个分块、完整采样，实际重跑的分块在初筛后才确定) 两个阶段
+
+    Returns:
+        Dict: stages (各阶段明细) / input_tokens / output_tokens / total_tokens / seconds / cost
+    """
+    # 意义: 调用前估算
+    # 作用: Map 按分块逐个串行，输入为静态前缀 + 互动关系 + min(分块 Token, 采样预算)；
+    #       Reduce 输入为各块 Map 输出 + 统计数据；分段增强按 REFINE_MAX_WORKERS 并发
+    # 关联: 被 plan_budget 与 AnalysisPipeline.estimate 调用
+    prices = {**BUDGET_MODEL_PRICES, **(prices or {})}
+    system_tokens = _prompt_tokens(SYSTEM_PROMPT_JSON)
+    split_tokens = plan.get('split_tokens') or []
+
+    map_prefix = system_tokens + _prompt_tokens(_prompts.get_static_prefix("map", is_periodic)) + BUDGET_MAP_FACTS_TOKENS
+    stages = {}
+    n_splits = len(split_tokens)
+    if cascade:
+        screen_budget = int(sample_budget * cascade['screen_ratio'])
+        screen_inputs = [map_prefix + min(tokens, screen_budget) for tokens in split_tokens]
+        stages['screen'] = _map_stage(cascade['model'], screen_inputs, tracker, prices)
+        split_tokens = sorted(split_tokens, reverse=True)[:cascade['hot_splits']]
+    map_inputs = [map_prefix + min(tokens, sample_budget) for tokens in split_tokens]
+    stages['map'] = _map_stage(models['map'], map_inputs, tracker, prices)
+
+    reduce_model = models['reduce']
+    reduce_input = system_tokens + _prompt_tokens(_prompts.get_static_prefix("reduce", is_periodic)) \
+        + BUDGET_REDUCE_STATS_TOKENS + BUDGET_MAP_OUTPUT_TOKENS * n_splits
+    stages['reduce'] = _stage(
+        reduce_model, 1, reduce_input, BUDGET_REDUCE_OUTPUT_TOKENS,
+        _request_seconds(reduce_model, reduce_input, BUDGET_REDUCE_OUTPUT_TOKENS, tracker), prices
+    )
+
+    if refine:
+        refine_model = models['refine']
+        if refine == REFINE_MODE_SECTIONS:
+            # 每个 AI 段落与 CSS 块各一次请求，输出与输入等长
+            sections = sum(1 for kind in REDUCE_JSON_SCHEMA.values() if kind is str)
+            calls = sections + 1
+            body = BUDGET_REDUCE_OUTPUT_TOKENS + BUDGET_REFINE_CSS_TOKENS
+            prompt = _prompt_tokens(PROMPT_REFINE_SECTION) * sections + _prompt_tokens(PROMPT_REFINE_CSS)
+            seconds = sum(
+                _request_seconds(refine_model, body / calls, body / calls, tracker) for _ in range(calls)
+            ) / min(REFINE_MAX_WORKERS, calls)
+        else:
+            calls = 1
+            body = BUDGET_REDUCE_OUTPUT_TOKENS + BUDGET_REFINE_TEMPLATE_TOKENS
+            prompt = _prompt_tokens(PROMPT_REFINE_HTML)
+            seconds = _request_seconds(refine_model, body + prompt, body, tracker)
+        stages['refine'] = _stage(refine_model, calls, body + prompt, body, seconds, prices)
+
+    costs = [stage['cost'] for stage in stages.values()]
+    input_tokens = sum(stage['input_tokens'] for stage in stages.values())
+    output_tokens = sum(stage['output_tokens'] for stage in stages.values())
+    return {
+        'stages': stages,
+        'sample_budget': int(sample_budget),
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'total_tokens': input_tokens + output_tokens,
+        'seconds': round(sum(stage['seconds'] for stage in stages.values()), 1),
+        'cost': round(sum(costs), 4) if costs and all(c is not None for c in costs) else None
+    }
+
+
+def _over_caps(estimate: Dict[str, Any], caps: Dict[str, float]) -> List[str]:
+    """返回被超出的上限名称 (tokens / cost / seconds)。"""
+    over = []
+    if caps.get('tokens') and estimate['total_tokens'] > caps['tokens']:
+        over.append('tokens')
+    if caps.get('cost') and estimate['cost'] is not None and estimate['cost'] > caps['cost']:
+        over.append('cost')
+    if caps.get('seconds') and estimate['seconds'] > caps['seconds']:
+        over.append('seconds')
+    return over
+
+
+def budget_caps(config: Dict[str, Any]) -> Dict[str, float]:
+    """读取任务上限：config.budget_max_tokens / budget_max_cost / budget_max_seconds (缺省或 0 表示不限)。"""
+    return {
+        'tokens': float(config.get('budget_max_tokens') or 0),
+        'cost': float(config.get('budget_max_cost') or 0),
+        'seconds': float(config.get('budget_max_seconds') or 0)
+    }
+
+
+def plan_budget(plan: Dict[str, Any], sample_budget: int, models: Dict[str, str], config: Dict[str, Any],
+                is_periodic: bool = False, tracker: ThroughputTracker = throughput,
+                cascade: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    估算并在超出上限时调整执行方案。
+
+    调整顺序：先跳过 HTML 增强 (不影响报告内容)，仍超出时按 BUDGET_SHRINK_FACTOR 逐次缩减每块采样预算，
+    最低到 BUDGET_MIN_SAMPLE_TOKENS；此时仍超出则照常执行并标记 within_budget 为 False。
+
+    Returns:
+        Dict: estimate (调整后的估算) / original (调整前的估算) / sample_budget / skip_refine /
+              within_budget / actions (调整说明) / caps / cascade (级联设置，含调整后的 screen_budget)
+    """
+    # 意义: 预算执行
+    # 作用: 所有调整都发生在第一次模型调用之前，用户看到的估算即为实际执行方案
+    # 关联: 被 AnalysisPipeline.run (执行) 与 AnalysisPipeline.estimate (/api/estimate) 调用
+    caps = budget_caps(config)
+    refine = config.get('refine_mode', REFINE_MODE_SECTIONS) if config.get('enhance_mode', False) else None
+    prices = config.get('model_prices')
+
+    def estimate(budget: int, refine_mode: Optional[str]) -> Dict[str, Any]:
+        return estimate_task(plan, budget, models, refine_mode, is_periodic, prices, tracker, cascade)
+
+    original = current = estimate(sample_budget, refine)
+    actions = []
+    if refine and _over_caps(current, caps):
+        refine = None
+        current = estimate(sample_budget, refine)
+        actions.append("跳过 HTML 增强")
+
+    budget = sample_budget
+    while _over_caps(current, caps) and budget > BUDGET_MIN_SAMPLE_TOKENS:
+        budget = max(BUDGET_MIN_SAMPLE_TOKENS, int(budget * BUDGET_SHRINK_FACTOR))
+        current = estimate(budget, refine)
+    if budget < sample_budget:
+        actions.append(f"每块采样预算 {sample_budget} -> {budget} tokens")
+
+    return {
+        'estimate': current,
+        'original': original,
+        'sample_budget': budget,
+        'skip_refine': bool(config.get('enhance_mode', False)) and refine is None,
+        'within_budget': not _over_caps(current, caps),
+        'actions': actions,
+        'caps': caps,
+        'cascade': {**cascade, 'screen_budget': int(budget * cascade['screen_ratio'])} if cascade else None
+    }
+
+
+def format_estimate(estimate: Dict[str, Any]) -> str:
+    """单行估算摘要，用于任务日志。"""
+    stages = ", ".join(
+        f"{name} {s['calls']} 次 {s['input_tokens'] + s['output_tokens']} tokens ~{s['seconds']}s"
+        for name, s in estimate['stages'].items()
+    )
+    cost = f", 费用约 {estimate['cost']}" if estimate['cost'] is not None else ""
+    return f"{estimate['total_tokens']} tokens, 约 {estimate['seconds']}s{cost} ({stages})"
@@ -0,0 +1,116 @@
+# src/cancel.py
+
+"""
+Cancellation Module
+===================
+负责任务取消与截止时间的传播：由工作线程持有 CancelToken，在解析、采样、Map、渲染等阶段检查。
+遵循 Phase 5 编程规范。
+"""
+
+import time
+import threading
+from typing import Callable, Optional
+from src.registry import *
+
+
+class TaskCancelled(BaseException):
+    """
+    任务被取消或超过截止时间。
+
+    继承 BaseException (与 asyncio.CancelledError 相同)，避免被各阶段用于降级的
+    `except Exception` 吞掉，从而能一路传播到任务执行入口。
+    """
+
+    def __init__(self, reason: str = CANCEL_REASON_USER):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    线程安全的取消令牌，可附带截止时间。
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        # 意义: 初始化令牌
+        # 作用: deadline_seconds 为空或 <= 0 时不设截止时间
+        # 关联: 由 src.worker.execute_task 创建并注入流水线与 LLMClient
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds and deadline_seconds > 0 else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(CANCEL_REASON_DEADLINE)
+        return self._event.is_set()
+
+    def cancel(self, reason: str = CANCEL_REASON_USER) -> None:
+        """触发取消并执行已注册的回调 (仅第一次生效)。"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Warning] Cancel callback failed: {e}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """注册取消回调；令牌已取消时立即执行。"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self) -> None:
+        """已取消 (或超过截止时间) 时抛出 TaskCancelled。"""
+        if self.cancelled:
+            raise TaskCancelled(self.reason)
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的剩余秒数，无截止时间时返回 None。"""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def wait(self, timeout: float) -> bool:
+        """最多等待 timeout 秒，期间被取消则提前返回 True。"""
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+def run_cancellable(fn: Callable, token: Optional[CancelToken]):
+    """
+    在辅助线程中执行阻塞调用，主线程等待结果或取消信号。
+
+    取消时立即抛出 TaskCancelled，不再等待阻塞调用返回；该调用的结果被丢弃。
+    """
+    if token is None:
+        return fn()
+    token.check()
+
+    outcome = {}
+    done = threading.Event()
+
+    def call():
+        try:
+            outcome['value'] = fn()
+        except BaseException as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=call, daemon=True).start()
+    while not done.wait(CANCEL_POLL_INTERVAL):
+        token.check()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['value']
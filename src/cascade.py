@@ -0,0 +1,86 @@
+# src/cascade.py
+
+"""
+Map Cascade Module
+==================
+负责 Map 阶段的模型级联：先用廉价 / 快速模型以小采样为每个分块生成摘要 (初筛)，
+再按消息密度、会话强度与摘要丰富度为分块排名，只有最热的分块使用 model_map 以完整采样重新分析。
+长而大部分冷清的记录可以显著减少强模型的调用量与耗时，热点分块的质量不受影响。
+遵循 Phase 5 编程规范。
+"""
+
+import math
+import pandas as pd
+from typing import Dict, Any, List, Optional
+from src.registry import *
+from src.sessions import SessionIndex
+
+
+def cascade_settings(config: Dict[str, Any], n_splits: int, map_model: str) -> Optional[Dict[str, Any]]:
+    """
+    读取级联配置：config.cascade_mode 开启且分块数不少于 CASCADE_MIN_SPLITS 时返回设置，否则返回 None。
+
+    Returns:
+        Dict: model (初筛模型) / hot_splits (强模型重跑的分块数) / screen_ratio (初筛采样占完整采样的比例)
+    """
+    if not config.get('cascade_mode', False) or n_splits < CASCADE_MIN_SPLITS:
+        return None
+    ratio = float(config.get('cascade_hot_ratio') or CASCADE_HOT_RATIO)
+    return {
+        'model': config.get('model_screen') or map_model,
+        'hot_splits': min(n_splits, max(1, math.ceil(n_splits * ratio))),
+        'screen_ratio': float(config.get('cascade_screen_ratio') or CASCADE_SCREEN_SAMPLE_RATIO)
+    }
+
+
+def split_features(df: pd.DataFrame) -> Dict[str, float]:
+    """
+    分块的热度特征：density (每小时消息数) 与 intensity (最热若干段对话的平均强度，每分钟消息数)。
+    """
+    if df.empty:
+        return {'messages': 0, 'density': 0.0, 'intensity': 0.0}
+    index = SessionIndex.from_frame(df)
+    top = index.top(SESSION_TOP_N, 'intensity')
+    datetimes = df[COL_DATETIME]
+    hours = max((datetimes.max() - datetimes.min()).total_seconds() / 3600, 1.0)
+    return {
+        'messages': len(df),
+        'density': len(df) / hours,
+        'intensity': float(index.intensity[top].mean()) if len(top) else 0.0
+    }
+
+
+def digest_richness(result: Dict[str, Any]) -> float:
+    """
+    初筛摘要的丰富度：事件、梗、人物、关系等条目数，加上摘要长度 (每 100 字计 1)。
+    """
+    score = 0.0
+    for key, kind in MAP_JSON_SCHEMA.items():
+        value = result.get(key)
+        if kind in (list, dict) and value:
+            score += len(value)
+    return score + len(str(result.get('summary', ''))) / 100
+
+
+def select_hot_splits(features: Dict[str, Dict[str, float]], digests: Dict[str, Dict[str, Any]],
+                      hot_splits: int, failed: Optional[List[str]] = None) -> List[str]:
+    """
+    为分块排名并返回需要强模型重跑的分块名称 (保持原顺序)。
+
+    三项指标分别取百分位排名后平均，与量纲无关；初筛失败的分块 (failed) 总是重跑。
+    """
+    # 意义: 级联路由
+    # 作用: 密度 / 会话强度 / 摘要丰富度 百分位平均后取前 hot_splits 个
+    # 关联: 被 AnalysisPipeline 的 Map 阶段调用
+    names = list(features)
+    if not names:
+        return []
+    table = pd.DataFrame({
+        'density': [features[n]['density'] for n in names],
+        'intensity': [features[n]['intensity'] for n in names],
+        'richness': [digest_richness(digests.get(n, {})) for n in names]
+    }, index=names)
+    score = table.rank(pct=True).mean(axis=1)
+    ranked = score.sort_values(ascending=False, kind='stable').index[:hot_splits]
+    chosen = set(ranked) | set(failed or [])
+    return [n for n in names if n in chosen]
@@ -0,0 +1,431 @@
+# src/client_pool.py
+
+"""
+Client Pool Module
+==================
+负责进程级 OpenAI 客户端复用：按 (base_url, api_key 哈希) 共享 HTTP keep-alive 连接池，
+支持连接池上限、空闲淘汰、健康检查，并统计连接复用与节省的握手时间。
+遵循 Phase 5 编程规范。
+"""
+
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, Tuple
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa: F401  (HTTP/2 为可选依赖)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+try:
+    from openai import OpenAI
+except ImportError:
+    OpenAI = None
+try:
+    from openai import AsyncOpenAI
+except ImportError:
+    AsyncOpenAI = None
+
+from src.registry import *
+from src.metrics import metrics
+
+
+class _PoolEntry:
+    """单个 (base_url, key) 对应的客户端及其连接统计。"""
+
+    def __init__(self, key: Tuple, client, http_client, is_async: bool = False):
+        self.key = key
+        self.client = client
+        self.http_client = http_client
+        self.is_async = is_async
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.active = 0
+        self.failures = 0
+        self.retired = False # 已被替换 / 淘汰，最后一个在途请求结束后关闭
+        self.stats = {'leases': 0, 'requests': 0, 'new_connections': 0, 'reused_connections': 0, 'handshake_seconds': 0.0}
+        self.lock = threading.Lock()
+
+    def avg_handshake(self) -> float:
+        n = self.stats['new_connections']
+        return self.stats['handshake_seconds'] / n if n else 0.0
+
+
+if httpx is not None:
+    class _TrackedStream(httpx.SyncByteStream):
+        """响应体包装：响应关闭 (读完或被丢弃) 时才结束在途计数。"""
+
+        def __init__(self, stream, release):
+            self._stream = stream
+            self._release = release
+
+        def __iter__(self):
+            yield from self._stream
+
+        def close(self) -> None:
+            try:
+                self._stream.close()
+            finally:
+                self._release()
+
+    class _AsyncTrackedStream(httpx.AsyncByteStream):
+        def __init__(self, stream, release):
+            self._stream = stream
+            self._release = release
+
+        async def __aiter__(self):
+            async for chunk in self._stream:
+                yield chunk
+
+        async def aclose(self) -> None:
+            try:
+                await self._stream.aclose()
+            finally:
+                self._release()
+
+    class _TrackingTransport(httpx.BaseTransport):
+        """
+        包装 HTTPTransport：在途计数覆盖整个传输过程 (超时、连接错误与取消同样会释放)，
+        并记录新建 / 复用连接与握手耗时。
+        """
+
+        def __init__(self, registry: 'ClientRegistry', entry: _PoolEntry, inner):
+            self._registry = registry
+            self._entry = entry
+            self._inner = inner
+
+        def handle_request(self, request):
+            release = self._registry._begin_request(self._entry, request)
+            try:
+                response = self._inner.handle_request(request)
+            except BaseException:
+                release()
+                raise
+            self._registry._record_response(self._entry, request)
+            response.stream = _TrackedStream(response.stream, release)
+            return response
+
+        def close(self) -> None:
+            self._inner.close()
+
+    class _AsyncTrackingTransport(httpx.AsyncBaseTransport):
+        """_TrackingTransport 的异步版本 (AsyncOpenAI 使用)。"""
+
+        def __init__(self, registry: 'ClientRegistry', entry: _PoolEntry, inner):
+            self._registry = registry
+            self._entry = entry
+            self._inner = inner
+
+        async def handle_async_request(self, request):
+            release = self._registry._begin_request(self._entry, request)
+            try:
+                response = await self._inner.handle_async_request(request)
+            except BaseException:
+                release()
+                raise
+            self._registry._record_response(self._entry, request)
+            response.stream = _AsyncTrackedStream(response.stream, release)
+            return response
+
+        async def aclose(self) -> None:
+            await self._inner.aclose()
+
+
+class ClientRegistry:
+    """
+    进程级 OpenAI 客户端注册表。
+    """
+
+    def __init__(self, max_connections: int = CLIENT_POOL_MAX_CONNECTIONS,
+                 max_keepalive: int = CLIENT_POOL_MAX_KEEPALIVE,
+                 keepalive_expiry: float = CLIENT_POOL_KEEPALIVE_EXPIRY,
+                 idle_seconds: float = CLIENT_POOL_IDLE_SECONDS,
+                 health_interval: float = CLIENT_POOL_HEALTH_INTERVAL,
+                 max_failures: int = CLIENT_POOL_MAX_FAILURES):
+        # 意义: 初始化注册表
+        # 作用: 保存连接池上限、空闲淘汰时间、健康检查间隔与连续失败阈值
+        # 关联: 模块级单例 client_registry 被 LLMClient 使用
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_seconds = idle_seconds
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self._entries: Dict[Tuple[str, str], _PoolEntry] = {}
+        self._async_entries: Dict[Tuple[str, str, int], _PoolEntry] = {} # (base_url, key 哈希, 事件循环 id) -> AsyncOpenAI 条目
+        self._lock = threading.Lock()
+        self._evicted = 0
+
+    def make_key(self, base_url: str, api_key: str) -> Tuple[str, str]:
+        """注册表键：不保存明文 Key，仅保存其哈希前缀。"""
+        digest = hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16]
+        return ((base_url or DEFAULT_API_BASE).rstrip('/'), digest)
+
+    def get(self, base_url: str, api_key: str):
+        """
+        获取 (或创建) 共享的 OpenAI 客户端。
+        """
+        # 意义: 客户端复用入口
+        # 作用: 先淘汰空闲条目；不健康 (连续失败或健康检查失败) 的条目会被重建
+        # 关联: LLMClient.client 每次请求前调用
+        if OpenAI is None:
+            return None
+        key = self.make_key(base_url, api_key)
+        self._evict_idle()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.failures >= self.max_failures:
+                print(f"[Info] Client pool entry for {key[0]} unhealthy ({entry.failures} failures), recreating.")
+                del self._entries[key]
+                self._retire(entry)
+                entry = None
+            if entry is None:
+                entry = self._create(key, base_url, api_key)
+                self._entries[key] = entry
+            else:
+                metrics.incr('llm_pool_client_reuse_total', base_url=key[0])
+
+        if time.monotonic() - entry.last_checked > self.health_interval and entry.active == 0:
+            if not self.health_check(entry):
+                entry.failures = self.max_failures
+                return self.get(base_url, api_key)
+
+        with entry.lock:
+            entry.stats['leases'] += 1
+            entry.last_used = time.monotonic()
+        return entry.client
+
+    def async_client(self, base_url: str, api_key: str):
+        """
+        获取 (或创建) 当前事件循环共享的 AsyncOpenAI 客户端，供异步流水线使用；不可用时返回 None。
+
+        异步连接池绑定创建它的事件循环，因此按 (base_url, key, 事件循环) 缓存；
+        与同步客户端一样统计复用 / 握手，并淘汰当前事件循环上的空闲客户端。
+        """
+        if AsyncOpenAI is None:
+            return None
+        loop = asyncio.get_running_loop()
+        key = self.make_key(base_url, api_key) + (id(loop),)
+        self._evict_idle_async(loop)
+        with self._lock:
+            entry = self._async_entries.get(key)
+            if entry is None:
+                entry = _PoolEntry(key, None, None, is_async=True)
+                if httpx is not None:
+                    entry.http_client = httpx.AsyncClient(
+                        transport=_AsyncTrackingTransport(self, entry, httpx.AsyncHTTPTransport(
+                            http2=HTTP2_AVAILABLE, limits=self._limits()
+                        )),
+                        timeout=httpx.Timeout(60.0, connect=10.0)
+                    )
+                # 重试与故障转移由 LLMClient 按端点健康统一调度，SDK 内置重试会叠加重复请求
+                entry.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=entry.http_client, max_retries=0)
+                self._async_entries[key] = entry
+                metrics.incr('llm_pool_async_clients_created_total', base_url=key[0])
+            else:
+                metrics.incr('llm_pool_client_reuse_total', base_url=key[0])
+        with entry.lock:
+            entry.stats['leases'] += 1
+            entry.last_used = time.monotonic()
+        return entry.client
+
+    async def close_async(self) -> None:
+        """关闭绑定当前事件循环的异步客户端 (异步执行器停止时调用)。"""
+        loop_id = id(asyncio.get_running_loop())
+        with self._lock:
+            keys = [k for k in self._async_entries if k[2] == loop_id]
+            entries = [self._async_entries.pop(k) for k in keys]
+        for entry in entries:
+            try:
+                await entry.client.close()
+            except Exception as e:
+                print(f"[Warning] Failed to close async client: {e}")
+
+    def report(self, base_url: str, api_key: str, ok: bool) -> None:
+        """LLMClient 上报请求结果，连续失败达到阈值后条目在下次获取时重建。"""
+        entry = self._entries.get(self.make_key(base_url, api_key))
+        if entry is None:
+            return
+        with entry.lock:
+            entry.failures = 0 if ok else entry.failures + 1
+
+    def health_check(self, entry: _PoolEntry) -> bool:
+        """
+        轻量健康检查：对 /models 发起一次短超时请求，能收到任意非 5xx 响应即视为健康。
+        """
+        entry.last_checked = time.monotonic()
+        if entry.http_client is None:
+            return True
+        try:
+            response = entry.http_client.get(
+                f"{entry.key[0]}/models",
+                headers={"Authorization": f"Bearer {entry.client.api_key}"},
+                timeout=CLIENT_POOL_HEALTH_TIMEOUT
+            )
+            healthy = response.status_code < 500
+        except Exception as e:
+            print(f"[Warning] Client pool health check failed for {entry.key[0]}: {e}")
+            healthy = False
+        metrics.incr('llm_pool_health_checks_total', base_url=entry.key[0], healthy=healthy)
+        return healthy
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出连接池统计：复用次数、新建连接数、平均握手耗时与估算节省的握手时间。
+        """
+        with self._lock:
+            entries = list(self._entries.values()) + list(self._async_entries.values())
+            async_count = len(self._async_entries)
+        now = time.monotonic()
+        result = []
+        for e in entries:
+            s = dict(e.stats)
+            s['handshake_seconds'] = round(s['handshake_seconds'], 4)
+            s['avg_handshake_seconds'] = round(e.avg_handshake(), 4)
+            s['handshake_seconds_saved'] = round(e.avg_handshake() * s['reused_connections'], 4)
+            result.append({
+                'base_url': e.key[0],
+                'key_hash': e.key[1],
+                'http2': HTTP2_AVAILABLE,
+                'async': e.is_async,
+                'active': e.active,
+                'failures': e.failures,
+                'idle_seconds': round(now - e.last_used, 1),
+                **s
+            })
+        return {'clients': result, 'async_clients': async_count, 'evicted': self._evicted}
+
+    def close_all(self) -> None:
+        """关闭所有客户端 (进程退出时调用)。"""
+        with self._lock:
+            for entry in self._entries.values():
+                self._close(entry)
+            self._entries.clear()
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _create(self, key: Tuple[str, str], base_url: str, api_key: str) -> _PoolEntry:
+        """创建带连接追踪传输层的 httpx 客户端，并包装为 OpenAI 客户端。"""
+        entry = _PoolEntry(key, None, None)
+        if httpx is not None:
+            entry.http_client = httpx.Client(
+                transport=_TrackingTransport(self, entry, httpx.HTTPTransport(http2=HTTP2_AVAILABLE, limits=self._limits())),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        # 重试与故障转移由 LLMClient 按端点健康统一调度，SDK 内置重试会叠加重复请求
+        entry.client = OpenAI(api_key=api_key, base_url=base_url, http_client=entry.http_client, max_retries=0)
+        metrics.incr('llm_pool_clients_created_total', base_url=key[0])
+        return entry
+
+    def _begin_request(self, entry: _PoolEntry, request):
+        """
+        传输层开始处理请求：在途计数加一，并挂载 httpcore trace 回调以记录 TCP / TLS 握手耗时。
+
+        Returns:
+            只生效一次的释放函数 (响应关闭或传输失败时调用)
+        """
+        state = {'new': False, 'started': None, 'handshake': 0.0}
+
+        def trace(event_name, info):
+            if 'connect_tcp' in event_name or 'start_tls' in event_name:
+                if event_name.endswith('.started'):
+                    state['new'] = True
+                    state['started'] = time.perf_counter()
+                elif event_name.endswith('.complete') and state['started'] is not None:
+                    state['handshake'] += time.perf_counter() - state['started']
+                    state['started'] = None
+
+        async def atrace(event_name, info):
+            trace(event_name, info)
+
+        # 异步传输层要求 trace 回调为协程函数
+        request.extensions['trace'] = atrace if entry.is_async else trace
+        request.extensions['pool_state'] = state
+        with entry.lock:
+            entry.active += 1
+        released = []
+
+        def release() -> None:
+            with entry.lock:
+                if released:
+                    return
+                released.append(True)
+                entry.active -= 1
+                entry.last_used = time.monotonic()
+                close = entry.retired and entry.active == 0
+            if close:
+                self._close(entry)
+
+        return release
+
+    def _record_response(self, entry: _PoolEntry, request) -> None:
+        """收到响应头：区分新建连接与复用连接，并累计握手耗时。"""
+        state = request.extensions.get('pool_state', {})
+        with entry.lock:
+            entry.stats['requests'] += 1
+            if state.get('new'):
+                entry.stats['new_connections'] += 1
+                entry.stats['handshake_seconds'] += state['handshake']
+            else:
+                entry.stats['reused_connections'] += 1
+        base_url = entry.key[0]
+        if state.get('new'):
+            metrics.incr('llm_pool_connections_new_total', base_url=base_url)
+            metrics.observe('llm_pool_handshake_seconds', state['handshake'], base_url=base_url)
+        else:
+            metrics.incr('llm_pool_connections_reused_total', base_url=base_url)
+            metrics.incr('llm_pool_handshake_seconds_saved', entry.avg_handshake(), base_url=base_url)
+
+    def _evict_idle(self) -> None:
+        """淘汰空闲时间超过阈值且无在途请求的客户端。"""
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.active == 0 and now - entry.last_used > self.idle_seconds:
+                    self._close(entry)
+                    del self._entries[key]
+                    self._evicted += 1
+                    metrics.incr('llm_pool_clients_evicted_total', base_url=key[0])
+
+    def _evict_idle_async(self, loop) -> None:
+        """淘汰当前事件循环上空闲的异步客户端 (异步连接池只能在其所属的事件循环上关闭)。"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, entry in self._async_entries.items()
+                    if key[2] == id(loop) and entry.active == 0 and now - entry.last_used > self.idle_seconds]
+            entries = [self._async_entries.pop(key) for key in idle]
+            self._evicted += len(entries)
+        for entry in entries:
+            metrics.incr('llm_pool_clients_evicted_total', base_url=entry.key[0])
+            loop.create_task(entry.client.close())
+
+    def _retire(self, entry: _PoolEntry) -> None:
+        """条目已从注册表移除：没有在途请求时立即关闭，否则由最后一个请求结束时关闭。"""
+        with entry.lock:
+            entry.retired = True
+            close = entry.active == 0
+        if close:
+            self._close(entry)
+
+    def _close(self, entry: _PoolEntry) -> None:
+        try:
+            if entry.http_client is not None:
+                entry.http_client.close()
+        except Exception as e:
+            print(f"[Warning] Failed to close pooled client: {e}")
+
+
+# 进程级单例
+client_registry = ClientRegistry()
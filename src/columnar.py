@@ -0,0 +1,117 @@
+# src/columnar.py
+
+"""
+Columnar Working Set Module
+===========================
+负责超大聊天记录的列式工作集：解析结果按时间排序写入未压缩的 Arrow IPC 文件，
+之后以内存映射方式零拷贝地按需读取列与记录批，统计、分块与采样都不再持有整张 DataFrame (out-of-core)。
+(Parquet 需要解码 / 解压到新分配的内存，无法真正零拷贝，因此工作集使用 Arrow IPC 格式。)
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+try:
+    import pyarrow as pa  # pyarrow 为可选依赖，未安装时只能使用内存模式
+except ImportError:
+    pa = None
+
+from src.registry import *
+
+# 日期 / 时间两列可由 datetime 推导，且为 Python 对象列，不写入工作集
+_DERIVED_COLUMNS = (COL_DATE, COL_TIME)
+
+
+def out_of_core_available() -> bool:
+    return pa is not None
+
+
+class MessageStore:
+    """
+    Arrow IPC 消息工作集 (只读)。行按 datetime 升序排列，行位置与时间排序后的 DataFrame 一致。
+    """
+
+    def __init__(self, path: str):
+        # 意义: 打开工作集
+        # 作用: 内存映射打开，只读取每个记录批的行数；数据页由操作系统按需换入换出
+        # 关联: 由 MessageStore.write 创建，被 ChatAnalyzer 在 out-of-core 模式下使用
+        if pa is None:
+            raise RuntimeError("out-of-core 模式需要安装 pyarrow")
+        self.path = path
+        self._source = pa.memory_map(path, 'r')
+        self._reader = pa.ipc.open_file(self._source)
+        self.columns = list(self._reader.schema.names)
+        sizes = [self._reader.get_batch(i).num_rows for i in range(self._reader.num_record_batches)]
+        self._batch_starts = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.num_rows = int(self._batch_starts[-1])
+
+    @classmethod
+    def write(cls, df: pd.DataFrame, path: str, batch_size: int = OOC_BATCH_SIZE) -> 'MessageStore':
+        """将消息 DataFrame 按时间排序后写入工作集并打开。"""
+        if pa is None:
+            raise RuntimeError("out-of-core 模式需要安装 pyarrow")
+        if not df[COL_DATETIME].is_monotonic_increasing:
+            df = df.sort_values(COL_DATETIME, kind='stable')
+        df = df.drop(columns=[c for c in _DERIVED_COLUMNS if c in df.columns])
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp = path + ".tmp"
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+        os.replace(tmp, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def read(self, columns: Optional[List[str]] = None, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        读取 [start, stop) 行的指定列，只触及与区间相交的记录批 (零拷贝切片)。
+        """
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        columns = [c for c in columns if c in self.columns] if columns is not None else self.columns
+        if start >= stop:
+            return self._reader.schema.empty_table().select(columns).to_pandas()
+        first = int(np.searchsorted(self._batch_starts, start, side='right')) - 1
+        last = int(np.searchsorted(self._batch_starts, stop, side='left'))
+        batches = [self._reader.get_batch(i).select(columns) for i in range(first, last)]
+        table = pa.Table.from_batches(batches).slice(start - int(self._batch_starts[first]), stop - start)
+        return table.to_pandas()
+
+    def iter_batches(self, columns: List[str]) -> Iterator[pd.DataFrame]:
+        """按记录批读取指定列，用于分词等只需流式扫描的统计。"""
+        columns = [c for c in columns if c in self.columns]
+        for i in range(self._reader.num_record_batches):
+            yield self._reader.get_batch(i).select(columns).to_pandas()
+
+    def close(self, remove: bool = False) -> None:
+        """关闭内存映射；remove 为 True 时同时删除工作集文件。"""
+        self._reader = None
+        self._source.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class LazySplits(Mapping):
+    """
+    分块名称 -> 行区间 的只读映射，取值时才从工作集读取该分块。
+
+    与 Dict[str, DataFrame] 的用法相同 (items / keys / 取值)，
+    但任一时刻只有正在处理的分块驻留内存。
+    """
+
+    def __init__(self, ranges: Dict[str, Tuple[int, int]], loader: Callable[[int, int], pd.DataFrame]):
+        self.ranges = ranges
+        self._loader = loader
+
+    def __getitem__(self, key: str) -> pd.DataFrame:
+        start, stop = self.ranges[key]
+        return self._loader(start, stop)
+
+    def __iter__(self):
+        return iter(self.ranges)
+
+    def __len__(self) -> int:
+        return len(self.ranges)
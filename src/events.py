@@ -0,0 +1,221 @@
+# src/events.py
+
+"""
+Event Detector Module
+=====================
+负责统计检测群聊中的“异常时刻”：按分钟统计消息速率、撤回数、图片数与复读接龙
+(不同用户连续发送相同内容)，以当前分钟之前的滚动窗口为基线计算 z 分数，
+把相邻的异常分钟合并为事件窗口并按得分排序，附带摘录。
+事件窗口在 Map 采样中被优先保留，并以事实的形式注入 Map / Reduce Prompt，
+代替 LLM 从稀疏采样中寻找“社死 / 搞笑时刻”。
+遵循 Phase 5 编程规范。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from src.registry import *
+from src.prompt_builder import ChatLines
+
+_KINDS = (EVENT_BURST, EVENT_RECALL, EVENT_IMAGE, EVENT_CHAIN)
+_MINUTE_NS = 60 * 10 ** 9
+# 基线至少覆盖的分钟数，数据开头没有历史可比较的分钟不参与检测
+_MIN_BASELINE_MINUTES = 60
+
+
+def epoch_ns(datetimes) -> np.ndarray:
+    """datetime 列转为 int64 纳秒时间戳 (带时区的列按 UTC)，检测与采样使用同一口径。"""
+    index = pd.DatetimeIndex(pd.to_datetime(datetimes))
+    # pandas 2 的 datetime 列可能是 us / ms 精度，asi8 按列自身的单位返回
+    if hasattr(index, 'as_unit'):
+        index = index.as_unit('ns')
+    return index.asi8
+
+
+def _row_signals(batch: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """单个记录批的逐行信号：时间戳、是否撤回、图片数、内容 / 用户哈希、内容是否非空。"""
+    n = len(batch)
+    content = batch[COL_CONTENT].astype(str) if COL_CONTENT in batch.columns else pd.Series("", index=batch.index)
+    users = batch[COL_USER_ID].astype(str) if COL_USER_ID in batch.columns else pd.Series("", index=batch.index)
+    return {
+        'ns': epoch_ns(batch[COL_DATETIME]),
+        'recalled': batch[COL_IS_RECALLED].fillna(False).to_numpy(dtype=np.float64)
+        if COL_IS_RECALLED in batch.columns else np.zeros(n),
+        'images': batch[COL_IMAGE_COUNT].fillna(0).to_numpy(dtype=np.float64)
+        if COL_IMAGE_COUNT in batch.columns else np.zeros(n),
+        'content': pd.util.hash_pandas_object(content, index=False).to_numpy(),
+        'users': pd.util.hash_pandas_object(users, index=False).to_numpy(),
+        'nonempty': (content.str.strip().str.len() > 0).to_numpy()
+    }
+
+
+def rolling_zscores(minutes: np.ndarray, values: np.ndarray, window: int = EVENT_BASELINE_MINUTES,
+                    min_std: float = EVENT_MIN_STD) -> np.ndarray:
+    """
+    各活跃分钟相对其之前 window 分钟 (日历分钟，无消息的分钟计为 0) 的 z 分数。
+
+    Args:
+        minutes: (M,) 升序的活跃分钟编号
+        values: (M,) 对应分钟的计数
+    """
+    # 意义: 滚动基线
+    # 作用: 只在活跃分钟上计算；窗口内的和与平方和由前缀和相减得到，searchsorted 定位窗口起点，O(M)
+    # 关联: 被 detect_events 对每个信号调用
+    values = np.asarray(values, dtype=np.float64)
+    prefix = np.concatenate([[0.0], np.cumsum(values)])
+    prefix_sq = np.concatenate([[0.0], np.cumsum(values ** 2)])
+    current = np.arange(len(minutes))
+    first = np.searchsorted(minutes, minutes - window, side='left')
+    span = np.minimum(window, minutes - minutes[0]).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (prefix[current] - prefix[first]) / span
+        var = (prefix_sq[current] - prefix_sq[first]) / span - mean ** 2
+        z = (values - mean) / np.maximum(np.sqrt(np.maximum(var, 0.0)), min_std)
+    return np.where(span >= _MIN_BASELINE_MINUTES, z, 0.0)
+
+
+def detect_events(batches: Iterable[pd.DataFrame], read_rows: Callable[[int, int], pd.DataFrame],
+                  top_n: int = EVENT_TOP_N) -> List[Dict[str, Any]]:
+    """
+    检测异常时刻。
+
+    Args:
+        batches: 按时间排序的消息记录批 (需包含 datetime，可选 user_id / content / is_recalled / image_count)
+        read_rows: 读取时间排序后 [start, stop) 行的函数 (用于事件窗口的时间与摘录)
+        top_n: 返回的事件数量
+
+    Returns:
+        List[Dict]: 按得分降序，每项包含 kind / label / score / start / end / peak / messages /
+            recalls / images / chain / excerpt，以及 window ([起, 止, 峰值] 纳秒时间戳，供采样定位)
+    """
+    # 意义: 统计事件检测
+    # 作用: 分钟级 bincount -> 滚动 z 分数 -> 异常分钟 (z 与计数同时达标) -> 按间隔合并为窗口 -> 排序截取
+    # 关联: 被 ChatAnalyzer.get_events 调用；smart_sample 保留事件窗口，format_event_facts 导出 Prompt 事实
+    parts = [_row_signals(b) for b in batches if len(b)]
+    if not parts:
+        return []
+    rows = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+    ns = rows['ns']
+
+    chain = np.zeros(len(ns))
+    chain[1:] = ((rows['content'][1:] == rows['content'][:-1]) & rows['nonempty'][1:]
+                 & (rows['users'][1:] != rows['users'][:-1]))
+
+    minute_of_row = ns // _MINUTE_NS
+    minutes, bucket = np.unique(minute_of_row, return_inverse=True)
+    counts = np.vstack([
+        np.bincount(bucket, minlength=len(minutes)).astype(np.float64),
+        np.bincount(bucket, weights=rows['recalled'], minlength=len(minutes)),
+        np.bincount(bucket, weights=rows['images'], minlength=len(minutes)),
+        np.bincount(bucket, weights=chain, minlength=len(minutes))
+    ])
+    z = np.vstack([rolling_zscores(minutes, c) for c in counts])
+    floors = np.array([EVENT_MIN_COUNTS[k] for k in _KINDS], dtype=np.float64)[:, None]
+    scored = np.where((z >= EVENT_Z_THRESHOLD) & (counts >= floors), z, 0.0)
+    # 得分取各信号的最大 z；类型优先取具体信号 (撤回 / 图片 / 复读)，消息激增往往只是它们的伴随现象
+    score = scored.max(axis=0)
+    specific = scored[1:]
+    kind = np.where(specific.max(axis=0) > 0, specific.argmax(axis=0) + 1, 0)
+
+    flagged = np.flatnonzero(score > 0)
+    if len(flagged) == 0:
+        return []
+
+    # 合并相邻的异常分钟：每组取得分最高的分钟为峰值
+    breaks = np.diff(minutes[flagged]) > EVENT_MERGE_GAP_MINUTES
+    group = np.concatenate([[0], np.cumsum(breaks)])
+    group_first = np.flatnonzero(np.concatenate([[True], breaks]))
+    group_last = np.append(group_first[1:], len(flagged)) - 1
+    by_score = np.lexsort((-score[flagged], group))
+    peaks = flagged[by_score[np.flatnonzero(np.concatenate([[True], np.diff(group[by_score]) > 0]))]]
+    ranked = np.argsort(-score[peaks], kind='stable')[:top_n]
+
+    prefix = {key: np.concatenate([[0.0], np.cumsum(values)])
+              for key, values in (('recalls', rows['recalled']), ('images', rows['images']), ('chain', chain))}
+    events = []
+    for g in ranked:
+        peak = peaks[g]
+        first_minute = minutes[flagged[group_first[g]]] - EVENT_PAD_MINUTES
+        last_minute = minutes[flagged[group_last[g]]] + EVENT_PAD_MINUTES
+        start = int(np.searchsorted(minute_of_row, first_minute, side='left'))
+        stop = int(np.searchsorted(minute_of_row, last_minute, side='right'))
+        # 窗口过长时以峰值分钟为中心截取
+        peak_row = int(np.searchsorted(minute_of_row, minutes[peak], side='left'))
+        if stop - start > EVENT_WINDOW_MAX_LINES:
+            start = max(start, min(peak_row - EVENT_WINDOW_MAX_LINES // 2, stop - EVENT_WINDOW_MAX_LINES))
+            stop = start + EVENT_WINDOW_MAX_LINES
+
+        frame = read_rows(start, stop)
+        stamps = frame[COL_DATETIME].astype(str).str[:SAMPLE_STAMP_CHARS]
+        excerpt_from = min(peak_row - start, max(0, len(frame) - EVENT_EXCERPT_LINES))
+        events.append({
+            'kind': _KINDS[kind[peak]],
+            'label': EVENT_KIND_LABELS[_KINDS[kind[peak]]],
+            'score': round(float(score[peak]), 1),
+            'start': stamps.iloc[0],
+            'end': stamps.iloc[-1],
+            'peak': stamps.iloc[min(peak_row - start, len(frame) - 1)],
+            'messages': stop - start,
+            **{key: int(values[stop] - values[start]) for key, values in prefix.items()},
+            'excerpt': _excerpt(frame.iloc[excerpt_from:excerpt_from + EVENT_EXCERPT_LINES]),
+            'window': [int(ns[start]), int(ns[stop - 1]), int(ns[peak_row])]
+        })
+    return events
+
+
+def _excerpt(frame: pd.DataFrame) -> List[str]:
+    """事件摘录：内容为空的撤回 / 图片消息以占位符显示。"""
+    frame = frame.copy()
+    content = frame[COL_CONTENT].fillna("").astype(str)
+    if COL_IMAGE_COUNT in frame.columns:
+        images = frame[COL_IMAGE_COUNT].fillna(0).astype(int)
+        content = content.mask((content == "") & (images > 0), "[图片]")
+    if COL_IS_RECALLED in frame.columns:
+        content = content.mask(frame[COL_IS_RECALLED].fillna(False).astype(bool), "[撤回]")
+    frame[COL_CONTENT] = content
+    return ChatLines(frame).format()
+
+
+def events_in_frame(df: pd.DataFrame, events: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """与 df 时间范围相交的事件 (保持得分顺序)，用于确定每个 Map 分块包含的事件。"""
+    if not events or df.empty:
+        return []
+    ns = epoch_ns(df[COL_DATETIME])
+    lo, hi = ns.min(), ns.max()
+    return [e for e in events if e['window'][0] <= hi and e['window'][1] >= lo]
+
+
+def event_mask(df: pd.DataFrame, events: List[Dict[str, Any]], lengths: np.ndarray, max_chars: float) -> np.ndarray:
+    """
+    按得分顺序选取事件窗口内的行 (df 行顺序的布尔掩码)，入选行的字符数合计不超过 max_chars；
+    剩余预算放不下整个窗口时，只保留离峰值最近的行。
+    """
+    selected = np.zeros(len(df), dtype=bool)
+    if not events:
+        return selected
+    ns = epoch_ns(df[COL_DATETIME])
+    remaining = max_chars
+    for event in events:
+        start, end, peak = event['window']
+        rows = np.flatnonzero((ns >= start) & (ns <= end) & ~selected)
+        if len(rows) == 0:
+            continue
+        rows = rows[np.argsort(np.abs(ns[rows] - peak), kind='stable')]
+        rows = rows[:int(np.searchsorted(np.cumsum(lengths[rows]), remaining, side='right'))]
+        selected[rows] = True
+        remaining -= lengths[rows].sum()
+    return selected
+
+
+def format_event_facts(events: Optional[List[Dict[str, Any]]], excerpts: bool = True) -> str:
+    """将事件格式化为紧凑的 Prompt 文本，无事件时返回空字符串。"""
+    lines = []
+    for e in events or []:
+        end = e['end'][11:] if e['end'][:10] == e['start'][:10] else e['end']
+        lines.append(
+            f"- {e['start']} ~ {end} {e['label']} (z={e['score']}): {e['messages']} 条消息，"
+            f"撤回 {e['recalls']}，图片 {e['images']}，复读 {e['chain']}"
+        )
+        if excerpts and e.get('excerpt'):
+            lines.extend(f"    {line}" for line in e['excerpt'])
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+# src/failover.py
+
+"""
+Endpoint Failover Module
+========================
+负责 LLM 多端点的健康评分、熔断与对冲延迟：按配置顺序与健康状况为端点排序，
+每个端点独立熔断 (连续失败后冷却，冷却结束放行一个探测请求)，
+并以该端点近期延迟的 p95 作为对冲请求的发起时机，统计对冲的胜率与延迟分布。
+遵循 Phase 5 编程规范。
+"""
+
+import time
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.registry import *
+from src.metrics import metrics
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class Endpoint:
+    """单个 LLM 端点：base_url + api_key，可选 model 覆盖 (不同服务商的模型名不同)。"""
+
+    def __init__(self, base_url: str, api_key: str, model: Optional[str] = None):
+        self.base_url = (base_url or DEFAULT_API_BASE).rstrip('/')
+        self.api_key = api_key
+        self.model = model or None
+        digest = hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16]
+        self.key: Tuple[str, str] = (self.base_url, digest)
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.base_url})"
+
+
+class _EndpointHealth:
+    """单个端点的熔断状态、成功率与各模型的近期延迟。"""
+
+    def __init__(self):
+        self.state = BREAKER_CLOSED
+        self.failures = 0 # 连续失败次数
+        self.opened_at = 0.0
+        self.probing = False # 半开状态下探测请求是否在途
+        self.success_rate = 1.0 # 成功率 EWMA
+        self.latencies: Dict[str, deque] = {}
+        self.stats = {'requests': 0, 'failures': 0, 'opened': 0, 'hedges': 0, 'hedge_wins': 0}
+
+
+class EndpointRouter:
+    """
+    进程级端点路由器：所有 LLMClient 共享端点的健康状况。
+    """
+
+    def __init__(self, breaker_failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN,
+                 alpha: float = LLM_HEALTH_ALPHA, window: int = LLM_LATENCY_WINDOW):
+        # 意义: 初始化路由器
+        # 作用: 保存熔断阈值、冷却时间、成功率平滑系数与延迟样本窗口
+        # 关联: 模块级单例 endpoint_router 被 LLMClient 使用
+        self.breaker_failures = breaker_failures
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.window = window
+        self._health: Dict[Tuple[str, str], _EndpointHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint: Endpoint) -> _EndpointHealth:
+        health = self._health.get(endpoint.key)
+        if health is None:
+            health = self._health[endpoint.key] = _EndpointHealth()
+        return health
+
+    def order(self, endpoints: List[Endpoint]) -> List[Endpoint]:
+        """
+        返回可用端点 (健康优先，其次保持配置顺序)。
+
+        熔断中的端点被跳过；冷却结束的端点进入半开状态，只放行一个探测请求。
+        全部端点熔断时返回空列表，调用方应快速失败而不是继续请求故障端点。
+        """
+        # 意义: 端点选择
+        # 作用: 排序键为 (成功率 EWMA 取一位小数的相反数, 配置位置)，成功率相近的端点保持用户指定的优先级
+        # 关联: LLMClient._complete 按该顺序依次发起请求 / 对冲
+        now = time.monotonic()
+        available = []
+        with self._lock:
+            for position, endpoint in enumerate(endpoints):
+                health = self._get(endpoint)
+                if health.state == BREAKER_OPEN and now - health.opened_at >= self.cooldown:
+                    health.state = BREAKER_HALF_OPEN
+                    health.probing = False
+                if health.state == BREAKER_OPEN or (health.state == BREAKER_HALF_OPEN and health.probing):
+                    continue
+                available.append((-round(health.success_rate, 1), position, endpoint))
+        return [endpoint for _, _, endpoint in sorted(available, key=lambda item: item[:2])]
+
+    def acquire(self, endpoint: Endpoint) -> None:
+        """发起请求前调用：半开状态的端点标记探测请求在途。"""
+        with self._lock:
+            health = self._get(endpoint)
+            if health.state == BREAKER_HALF_OPEN:
+                health.probing = True
+
+    def record(self, endpoint: Endpoint, model: str, ok: bool, elapsed: float) -> None:
+        """
+        记录一次请求结果 (包括被放弃的对冲请求，它们同样反映端点的真实状况)。
+        """
+        with self._lock:
+            health = self._get(endpoint)
+            health.stats['requests'] += 1
+            health.success_rate += self.alpha * ((1.0 if ok else 0.0) - health.success_rate)
+            if ok:
+                health.failures = 0
+                health.state = BREAKER_CLOSED
+                health.probing = False
+                health.latencies.setdefault(model, deque(maxlen=self.window)).append(elapsed)
+                return
+            health.stats['failures'] += 1
+            health.failures += 1
+            if health.state == BREAKER_HALF_OPEN or health.failures >= self.breaker_failures:
+                if health.state != BREAKER_OPEN:
+                    health.stats['opened'] += 1
+                    metrics.incr('llm_breaker_opened_total', base_url=endpoint.base_url)
+                    print(f"[Warning] Circuit breaker opened for {endpoint.base_url} ({health.failures} consecutive failures).")
+                health.state = BREAKER_OPEN
+                health.opened_at = time.monotonic()
+                health.probing = False
+
+    def hedge_delay(self, endpoint: Endpoint, model: str) -> Optional[float]:
+        """
+        对冲延迟：该端点该模型近期成功请求延迟的 LLM_HEDGE_QUANTILE 分位数；
+        样本不足 LLM_HEDGE_MIN_SAMPLES 时返回 None (不对冲)。
+        """
+        with self._lock:
+            samples = self._get(endpoint).latencies.get(model)
+            if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        p = ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_QUANTILE))]
+        return max(LLM_HEDGE_MIN_DELAY, p)
+
+    def record_hedge(self, endpoint: Endpoint, won: bool) -> None:
+        """记录一次对冲请求 (endpoint 为对冲请求的目标端点) 及其是否先于原请求成功返回。"""
+        with self._lock:
+            health = self._get(endpoint)
+            health.stats['hedges'] += 1
+            health.stats['hedge_wins'] += int(won)
+        metrics.incr('llm_hedges_total', base_url=endpoint.base_url, won=won)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出各端点的熔断状态、成功率、对冲次数 / 胜率与各模型延迟分布。
+        """
+        with self._lock:
+            result = []
+            for (base_url, key_hash), health in self._health.items():
+                latency = {}
+                for model, samples in health.latencies.items():
+                    ordered = sorted(samples)
+                    if ordered:
+                        latency[model] = {
+                            'count': len(ordered),
+                            'p50': round(ordered[len(ordered) // 2], 3),
+                            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                            'max': round(ordered[-1], 3)
+                        }
+                hedges = health.stats['hedges']
+                result.append({
+                    'base_url': base_url,
+                    'key_hash': key_hash,
+                    'state': health.state,
+                    'consecutive_failures': health.failures,
+                    'success_rate': round(health.success_rate, 3),
+                    'hedge_win_rate': round(health.stats['hedge_wins'] / hedges, 3) if hedges else None,
+                    'latency': latency,
+                    **health.stats
+                })
+        return {'endpoints': result}
+
+
+def parse_endpoints(base_url: str, api_key: str, fallbacks: Optional[List[Dict[str, Any]]] = None) -> List[Endpoint]:
+    """
+    构造有序端点列表：主端点在前，其后为 config.fallback_endpoints
+    (每项 {base_url, api_key?, model?}，api_key 留空时沿用主端点的 Key)。
+    """
+    endpoints = [Endpoint(base_url, api_key)]
+    for item in fallbacks or []:
+        if not isinstance(item, dict) or not item.get('base_url'):
+            continue
+        endpoint = Endpoint(item['base_url'], item.get('api_key') or api_key, item.get('model'))
+        if all(e.key != endpoint.key for e in endpoints):
+            endpoints.append(endpoint)
+    return endpoints
+
+
+# 进程级单例
+endpoint_router = EndpointRouter()
@@ -7,16 +7,36 @@ Report Generator Module (Phase 3)
 遵循 Phase 5 编程规范。
 """
 
-from typing import Dict, List, Any
-import json
+from typing import Dict, List, Any, Optional, Sequence, Union
 import time
+from html.parser import HTMLParser
 from src.registry import *
 from src.llm_client import LLMClient
+from src.steps import LLMCall, LLMBatch, Steps, run_steps
 from src.prompts import PromptManager
+from src.json_extract import LLMJSONExtractor
+from src.metrics import metrics
+
+def json_parse_failure_rates() -> Dict[str, float]:
+    """
+    按模型汇总 JSON 解析失败率 (failed / 全部解析次数)。
+    """
+    totals, failures = {}, {}
+    for c in metrics.snapshot()['counters']:
+        if c['name'] != 'llm_json_parse_total':
+            continue
+        model = c['labels'].get('model')
+        totals[model] = totals.get(model, 0) + c['value']
+        if c['labels'].get('outcome') == 'failed':
+            failures[model] = failures.get(model, 0) + c['value']
+    return {m: round(failures.get(m, 0) / t, 4) for m, t in totals.items() if t}
 
 class ReportGenerator:
     """
     报告生成器核心类，协调 LLM Client 和 Prompt Manager。
+
+    各阶段以 *_steps 生成器实现 (src.steps)，同步方法用 run_steps 驱动；
+    异步流水线直接 yield from 这些生成器。
     """
 
     def __init__(self, llm_client: LLMClient):
@@ -25,105 +45,301 @@ class ReportGenerator:
         # 关联: 依赖 src.llm_client
         self.llm = llm_client
         self.prompts = PromptManager()
+        self.extractor = LLMJSONExtractor()
+        self.refine_stats = {}
+        self.prefix_hashes = {} # stage -> 该阶段出现过的静态前缀哈希 (稳定时仅有一个)
 
-    def generate_quarterly_analysis(self, quarter: str, content: str, model: str = None, is_periodic: bool = False) -> Dict[str, Any]:
+    def generate_quarterly_analysis(self, quarter: str, content: Union[str, Sequence[str]], model: str = None, is_periodic: bool = False,
+                                    interactions: Optional[Dict[str, Any]] = None,
+                                    events: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
-        执行 Map 阶段：生成单季度/阶段隐性分析。
+        执行 Map 阶段：生成单季度/阶段隐性分析。content 为聊天记录文本或采样行列表，
+        interactions 为本片段的关系事实，events 为本片段的异常时刻 (均可选)。
         """
+        return run_steps(self.quarterly_analysis_steps(quarter, content, model, is_periodic, interactions, events), self.llm)
+
+    def quarterly_analysis_steps(self, quarter: str, content: Union[str, Sequence[str]], model: str = None, is_periodic: bool = False,
+                                 interactions: Optional[Dict[str, Any]] = None,
+                                 events: Optional[List[Dict[str, Any]]] = None) -> Steps:
+        """generate_quarterly_analysis 的步骤形式。"""
         # 意义: Map 任务执行
         # 作用: 调用 LLM 分析单季度数据
         # 关联: 输出 JSON 中间态
         
-        prompt = self.prompts.build_map_prompt(quarter, content, is_periodic=is_periodic)
-        system_prompt = "你是一个 JSON 生成器。请仅返回合法的 JSON 数据，不要包含 markdown 代码块标记。"
+        prompt = self.prompts.build_map_prompt(quarter, content, is_periodic=is_periodic, interactions=interactions,
+                                               events=events)
+        system_prompt = SYSTEM_PROMPT_JSON
+        self._note_prefix("map", self.prompts.prefix_hash(system_prompt, "map", is_periodic))
+        fallback = {
+            "summary": f"{quarter} 分析失败",
+            "characters": {},
+            "relations": [],
+            "vibe": "未知"
+        }
         
         try:
-            response = self.llm.chat_completion(system_prompt, prompt, model=model)
-            
-            # 清理 Markdown 标记
-            clean_response = response.strip()
-            if clean_response.startswith("```json"):
-                clean_response = clean_response[7:]
-            if clean_response.startswith("```"):
-                clean_response = clean_response[3:]
-            if clean_response.endswith("```"):
-                clean_response = clean_response[:-3]
-                
-            return json.loads(clean_response)
+            result = yield from self._complete_json("map", system_prompt, prompt, MAP_JSON_SCHEMA, model=model)
+            if not result:
+                return fallback
+            # 补请求后仍缺失的字段使用占位值，保留已成功解析的部分
+            for key, value in fallback.items():
+                result.setdefault(key, value)
+            return result
             
         except Exception as e:
             print(f"Error in generating quarterly analysis for {quarter}: {e}")
-            return {
-                "summary": f"{quarter} 分析失败",
-                "characters": {},
-                "relations": [],
-                "vibe": "未知"
-            }
+            return fallback
 
     def generate_annual_report(self, quarterly_results: List[Dict], global_stats: Dict, anime_theme: str = "default", custom_theme_prompt: str = "", model: str = None, is_periodic: bool = False) -> Dict[str, Any]:
         """
         执行 Reduce 阶段：生成年度/阶段汇总内容 (JSON)。
         """
+        return run_steps(self.annual_report_steps(quarterly_results, global_stats, anime_theme, custom_theme_prompt, model, is_periodic), self.llm)
+
+    def annual_report_steps(self, quarterly_results: List[Dict], global_stats: Dict, anime_theme: str = "default",
+                            custom_theme_prompt: str = "", model: str = None, is_periodic: bool = False) -> Steps:
+        """generate_annual_report 的步骤形式。"""
         # 意义: Reduce 任务执行
         # 作用: 汇总所有中间态，生成最终文案
         # 关联: 输出 JSON 内容，包含各模块的 HTML 片段
         
         prompt = self.prompts.build_reduce_prompt(quarterly_results, global_stats, anime_theme, custom_theme_prompt, is_periodic=is_periodic)
-        system_prompt = "你是一个 JSON 生成器。请仅返回合法的 JSON 数据，不要包含 markdown 代码块标记。"
+        system_prompt = SYSTEM_PROMPT_JSON
+        self._note_prefix("reduce", self.prompts.prefix_hash(system_prompt, "reduce", is_periodic))
+        fallback = {
+            "portrait": "<h3>群画像</h3><p>生成失败</p>",
+            "quarterly_review": "<h3>深度复盘</h3><p>生成失败</p>",
+            "roasts": "<h3>群成员锐评</h3><p>生成失败</p>",
+            "awards": "<h3>颁奖典礼</h3><p>生成失败</p>",
+            "anime_theater": "<h3>动漫IP小剧场</h3><p>生成失败</p>",
+            "moments": "<h3>社死/搞笑时刻回顾</h3><p>生成失败</p>",
+            "essay": "<h3>总结小作文</h3><p>生成失败</p>"
+        }
         
         try:
-            response = self.llm.chat_completion(system_prompt, prompt, model=model)
-            
-            # 清理 Markdown 标记
-            clean_response = response.strip()
-            if clean_response.startswith("```json"):
-                clean_response = clean_response[7:]
-            if clean_response.startswith("```"):
-                clean_response = clean_response[3:]
-            if clean_response.endswith("```"):
-                clean_response = clean_response[:-3]
-                
-            result = json.loads(clean_response)
+            result = yield from self._complete_json("reduce", system_prompt, prompt, REDUCE_JSON_SCHEMA, model=model)
+            if not result:
+                return fallback
             
             # Ensure anime_theater exists (fallback for missing key)
             if "anime_theater" not in result or not result["anime_theater"]:
                 result["anime_theater"] = "<h3>动漫IP小剧场</h3><p>（AI 似乎忘了生成小剧场，可能是因为 Token 限制或遗漏。请尝试增加 Token 预算或重试。）</p>"
-                
+            
+            for key, value in fallback.items():
+                result.setdefault(key, value)
             return result
         except Exception as e:
              print(f"Error in generating annual report: {e}")
-             return {
-                 "portrait": "<h3>群画像</h3><p>生成失败</p>",
-                 "quarterly_review": "<h3>深度复盘</h3><p>生成失败</p>",
-                 "roasts": "<h3>群成员锐评</h3><p>生成失败</p>",
-                 "awards": "<h3>颁奖典礼</h3><p>生成失败</p>",
-                 "anime_theater": "<h3>动漫IP小剧场</h3><p>生成失败</p>",
-                 "moments": "<h3>社死/搞笑时刻回顾</h3><p>生成失败</p>",
-                 "essay": "<h3>总结小作文</h3><p>生成失败</p>"
-             }
-
-    def refine_report_html(self, html_content: str, model: str = None) -> str:
+             return fallback
+
+    def _note_prefix(self, stage: str, digest: str) -> None:
+        """记录静态前缀哈希，同一阶段出现多个哈希说明前缀不稳定、无法命中缓存。"""
+        seen = self.prefix_hashes.setdefault(stage, [])
+        if digest not in seen:
+            seen.append(digest)
+            if len(seen) > 1:
+                print(f"[Warning] Prompt prefix for {stage} changed between calls: {seen}")
+
+    def _complete_json(self, stage: str, system_prompt: str, prompt: str, schema: Dict[str, type], model: str = None) -> Steps:
+        """
+        调用 LLM 并容错提取 JSON；校验失败的字段单独补请求，而不是整体重做。
+        一个字段都没有解析出来时 (错误提示 HTML、Mock 响应、完全不可用的输出) 不补请求。
+        """
+        # 意义: 结构化输出的统一入口
+        # 作用: 提取 -> 修复 -> Schema 校验 -> 仅补请求缺失字段 -> 记录各模型解析结果指标
+        # 关联: 依赖 src.json_extract 与 src.metrics；补请求只附带上一次输出，不重发聊天记录
+        target_model = model or self.llm.model
+        response = yield LLMCall(system_prompt, prompt, model)
+        result = self._extract_json(stage, target_model, response)
+        
+        missing = self.extractor.validate(result, schema)
+        if missing and len(missing) < len(schema):
+            print(f"[Warning] {stage} output missing fields {missing}, requesting them only.")
+            metrics.incr('llm_json_refetch_total', model=target_model, stage=stage)
+            followup = PROMPT_JSON_MISSING_FIELDS.format(
+                previous=response.strip()[:JSON_FOLLOWUP_CONTEXT_CHARS],
+                fields=", ".join(f"{key} ({JSON_TYPE_NAMES.get(schema[key], schema[key].__name__)})" for key in missing)
+            )
+            response = yield LLMCall(system_prompt, followup, model)
+            patch = self._extract_json(stage, target_model, response)
+            for key in missing:
+                if key in patch:
+                    result[key] = patch[key]
+            missing = self.extractor.validate(result, schema)
+        if missing:
+            metrics.incr('llm_json_incomplete_total', model=target_model, stage=stage)
+            for key in missing:
+                result.pop(key, None)
+        return result
+
+    def _extract_json(self, stage: str, model: str, response: str) -> Dict[str, Any]:
+        """提取 JSON 并按 (模型, 阶段, 结果) 记录解析指标，失败时返回空字典。"""
+        try:
+            result, outcome = self.extractor.extract(response)
+        except ValueError as e:
+            print(f"[Warning] Failed to parse {stage} JSON from {model}: {e}")
+            result, outcome = {}, "failed"
+        metrics.incr('llm_json_parse_total', model=model, stage=stage, outcome=outcome)
+        return result
+
+    def refine_report_html(self, html_content: str, model: str = None, mode: str = REFINE_MODE_SECTIONS) -> str:
         """
         额外功能：对生成的 HTML 报告进行最终修复和 CSS 优化。
+
+        Args:
+            html_content: 渲染完成的完整 HTML 文档
+            model: 使用的模型
+            mode: REFINE_MODE_SECTIONS (分段并发，默认) 或 REFINE_MODE_FULL (整份文档)
         """
+        return run_steps(self.refine_report_steps(html_content, model, mode), self.llm)
+
+    def refine_report_steps(self, html_content: str, model: str = None, mode: str = REFINE_MODE_SECTIONS) -> Steps:
+        """refine_report_html 的步骤形式。"""
+        if mode == REFINE_MODE_SECTIONS:
+            blocks = self._extract_refine_blocks(html_content)
+            if blocks:
+                return (yield from self._refine_sections(html_content, blocks, model))
+            print("[Warning] No refine markers found in report, falling back to full refine.")
+
         prompt = f"{PROMPT_REFINE_HTML}\n\n{html_content}"
         system_prompt = "你是一个前端专家。请直接返回优化后的 HTML 代码。"
         
         try:
             # 注意：这里可能会消耗较多 Token，取决于 HTML 大小
-            response = self.llm.chat_completion(system_prompt, prompt, model=model)
-            
-            # 清理 Markdown 标记
-            clean_response = response.strip()
-            if clean_response.startswith("```html"):
-                clean_response = clean_response[7:]
-            elif clean_response.startswith("```"):
-                clean_response = clean_response[3:]
-            
-            if clean_response.endswith("```"):
-                clean_response = clean_response[:-3]
-                
-            return clean_response.strip()
+            response = yield LLMCall(system_prompt, prompt, model)
+            self.refine_stats = {'mode': REFINE_MODE_FULL, 'refined': 1, 'failed': 0}
+            return self._strip_code_fence(response, "html")
         except Exception as e:
             print(f"Error in refining HTML report: {e}")
+            self.refine_stats = {'mode': REFINE_MODE_FULL, 'refined': 0, 'failed': 1}
             return html_content # 如果失败，返回原始内容
+
+    def _extract_refine_blocks(self, html_content: str) -> List[Dict[str, Any]]:
+        """
+        根据模板中的标记注释提取可独立优化的块 (主题 CSS + 各 AI 段落)。
+        """
+        # 意义: 分段定位
+        # 作用: 返回每个块的名称、类型以及内容在文档中的起止位置
+        # 关联: 依赖 templates/report.html 中的 theme-css / ai-section 标记
+        blocks = []
+        css = REFINE_CSS_PATTERN.search(html_content)
+        if css:
+            blocks.append({'name': 'theme-css', 'kind': 'css', 'start': css.start(1), 'end': css.end(1)})
+        for m in REFINE_SECTION_PATTERN.finditer(html_content):
+            if m.group(2).strip():
+                blocks.append({'name': m.group(1), 'kind': 'html', 'start': m.start(2), 'end': m.end(2)})
+        return blocks
+
+    def _refine_sections(self, html_content: str, blocks: List[Dict[str, Any]], model: str = None) -> Steps:
+        """
+        并发优化各块，逐块校验后拼接回原文档；单块失败时保留该块原文。
+        """
+        # 意义: 分段并发优化
+        # 作用: 每个块独立请求 (一个 LLMBatch，最多 REFINE_MAX_WORKERS 并发)，输出 Token 仅为段落大小；坏块不影响其余结果
+        # 关联: 被 refine_report_steps 调用
+        originals = [html_content[block['start']:block['end']] for block in blocks]
+        calls = [self._refine_block_call(block, original, model) for block, original in zip(blocks, originals)]
+        responses = yield LLMBatch(calls, REFINE_MAX_WORKERS)
+
+        results = []
+        for block, original, response in zip(blocks, originals, responses):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                results.append(self._refine_block_result(block, original, response))
+            except Exception as e:
+                print(f"Error in refining block {block['name']}: {e}")
+                results.append(None)
+
+        # 从后往前替换，保证前面块的偏移不受影响
+        refined = html_content
+        ok, failed = 0, []
+        for block, result in sorted(zip(blocks, results), key=lambda x: x[0]['start'], reverse=True):
+            if result is None:
+                failed.append(block['name'])
+                continue
+            refined = refined[:block['start']] + result + refined[block['end']:]
+            ok += 1
+
+        self.refine_stats = {'mode': REFINE_MODE_SECTIONS, 'refined': ok, 'failed': len(failed), 'failed_blocks': failed}
+        return refined
+
+    def _refine_block_call(self, block: Dict[str, Any], original: str, model: str = None) -> LLMCall:
+        """单个块的优化请求。"""
+        if block['kind'] == 'css':
+            prompt = f"{PROMPT_REFINE_CSS}\n\n{original}"
+            system_prompt = "你是一个前端专家。请直接返回优化后的 CSS 代码。"
+        else:
+            prompt = PROMPT_REFINE_SECTION.format(section=block['name']) + "\n\n" + original
+            system_prompt = "你是一个前端专家。请直接返回修复后的 HTML 片段。"
+        return LLMCall(system_prompt, prompt, model)
+
+    def _refine_block_result(self, block: Dict[str, Any], original: str, response: str) -> Optional[str]:
+        """清理并校验单个块的优化结果，不合格时返回 None。"""
+        result = self._strip_code_fence(response, "css" if block['kind'] == 'css' else "html")
+
+        if not self._validate_block(block['kind'], original, result):
+            print(f"[Warning] Refined block {block['name']} failed validation, keeping original.")
+            return None
+        return "\n" + result + "\n"
+
+    def _validate_block(self, kind: str, original: str, result: str) -> bool:
+        """
+        校验优化结果：非空、未被截断、不是错误提示，且结构完整。
+        """
+        if not result or len(result) < len(original.strip()) * REFINE_MIN_LENGTH_RATIO:
+            return False
+        if "AI 生成失败" in result or "客户端未初始化" in result:
+            return False
+        if kind == 'css':
+            return "<" not in result and result.count("{") == result.count("}")
+        lowered = result.lower()
+        if "<html" in lowered or "<body" in lowered or "<style" in lowered:
+            return False
+        checker = _TagBalanceChecker()
+        checker.feed(result)
+        checker.close()
+        return checker.balanced
+
+    def _strip_code_fence(self, response: str, lang: str) -> str:
+        """清理 Markdown 代码块标记。"""
+        clean_response = response.strip()
+        if clean_response.startswith(f"```{lang}"):
+            clean_response = clean_response[3 + len(lang):]
+        elif clean_response.startswith("```"):
+            clean_response = clean_response[3:]
+        
+        if clean_response.endswith("```"):
+            clean_response = clean_response[:-3]
+            
+        return clean_response.strip()
+
+
+class _TagBalanceChecker(HTMLParser):
+    """
+    检查 HTML 片段的标签是否成对闭合 (忽略自闭合标签)。
+    """
+
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+        self.balanced = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.VOID_TAGS:
+            self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS:
+            return
+        if not self.stack or self.stack[-1] != tag:
+            self.balanced = False
+            return
+        self.stack.pop()
+
+    def close(self):
+        super().close()
+        if self.stack:
+            self.balanced = False
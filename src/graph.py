@@ -0,0 +1,246 @@
+# src/graph.py
+
+"""
+Interaction Graph Module
+========================
+负责用户互动关系图：由 @提及 与 “接话” (相邻两条消息来自不同用户且间隔不超过 N 秒) 构建
+稀疏的 用户 × 用户 有向加权邻接表 (COO)，并计算最强关系边、互惠度与社群划分。
+结果以事实摘要的形式注入 Map / Reduce Prompt，代替 LLM 从采样文本中猜测关系。
+遵循 Phase 5 编程规范。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Optional
+from src.registry import *
+
+
+def build_interaction_graph(df: pd.DataFrame, reply_window: float = GRAPH_REPLY_WINDOW_SECONDS) -> Dict[str, Any]:
+    """
+    构建互动关系图。
+
+    Args:
+        df: 消息 DataFrame (需包含 datetime / user_id / user_name / mentions)
+        reply_window: 判定为“接话”的最大间隔秒数
+
+    Returns:
+        Dict:
+            user_ids / user_names / messages: 长度 U 的用户信息 (名称取最后一次出现的名片)
+            src / dst: 有向边的端点下标 (src 提及或接了 dst 的话)，按 src * U + dst 升序
+            mentions / replies / weight: 每条边的提及次数、接话次数与加权和
+    """
+    # 意义: 关系图引擎
+    # 作用: 边以 src * U + dst 编码为单个整数，np.unique + bincount 完成聚合，不构建 U × U 稠密矩阵
+    # 关联: 被 ChatAnalyzer.get_interaction_graph 调用，summarize_graph 导出 Prompt 事实
+    empty = np.zeros(0, dtype=np.int64)
+    if df.empty:
+        return {'user_ids': [], 'user_names': [], 'messages': empty,
+                'src': empty, 'dst': empty, 'mentions': empty, 'replies': empty, 'weight': np.zeros(0)}
+
+    order = None
+    if not df[COL_DATETIME].is_monotonic_increasing:
+        order = np.argsort(df[COL_DATETIME].to_numpy(), kind='stable')
+    user_codes, user_ids = pd.factorize(df[COL_USER_ID], sort=False)
+    names = df[COL_USER_NAME].to_numpy()
+    n_users = len(user_ids)
+
+    # 每个用户最后一次出现时的显示名称，以及 名称 -> 用户 的映射 (@ 只记录名称；同名时取最后出现者)
+    reversed_first = np.unique(user_codes[::-1], return_index=True)[1]
+    user_names = names[len(df) - 1 - reversed_first]
+    name_codes, unique_names = pd.factorize(names, sort=False, use_na_sentinel=False)
+    name_last = len(df) - 1 - np.unique(name_codes[::-1], return_index=True)[1]
+    name_to_user = dict(zip(unique_names, user_codes[name_last]))
+
+    # 1. @提及：只展开非空的 mentions 列表 (从 Arrow 工作集读取时为 ndarray)
+    src_parts, dst_parts, kind_parts = [], [], []
+    if COL_MENTIONS in df.columns:
+        mentions = df[COL_MENTIONS]
+        lengths = mentions.str.len().fillna(0).to_numpy(dtype=np.int64) if mentions.dtype == object else np.zeros(len(df), dtype=np.int64)
+        has_mentions = lengths > 0
+        if has_mentions.any():
+            exploded = mentions[has_mentions].explode()
+            targets = exploded.map(name_to_user).to_numpy(dtype=np.float64, na_value=np.nan)
+            sources = user_codes[has_mentions].repeat(lengths[has_mentions])
+            valid = ~np.isnan(targets)
+            src_parts.append(sources[valid])
+            dst_parts.append(targets[valid].astype(np.int64))
+            kind_parts.append(np.zeros(int(valid.sum()), dtype=np.int8))
+
+    # 2. 接话：相邻两条消息换人且间隔不超过窗口，后者视为回应前者
+    seq = user_codes if order is None else user_codes[order]
+    times = df[COL_DATETIME].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    if order is not None:
+        times = times[order]
+    if len(seq) > 1:
+        close = (np.diff(times) <= int(reply_window * 1e9)) & (seq[1:] != seq[:-1])
+        src_parts.append(seq[1:][close].astype(np.int64))
+        dst_parts.append(seq[:-1][close].astype(np.int64))
+        kind_parts.append(np.ones(int(close.sum()), dtype=np.int8))
+
+    src = np.concatenate(src_parts) if src_parts else empty
+    dst = np.concatenate(dst_parts) if dst_parts else empty
+    kind = np.concatenate(kind_parts) if kind_parts else np.zeros(0, dtype=np.int8)
+    keep = src != dst # 自己 @ 自己不算关系
+    src, dst, kind = src[keep], dst[keep], kind[keep]
+
+    keys, inverse = np.unique(src * n_users + dst, return_inverse=True)
+    mention_counts = np.bincount(inverse, weights=(kind == 0), minlength=len(keys)).astype(np.int64)
+    reply_counts = np.bincount(inverse, weights=(kind == 1), minlength=len(keys)).astype(np.int64)
+    return {
+        'user_ids': [str(u) for u in user_ids],
+        'user_names': [str(n) for n in user_names],
+        'messages': np.bincount(user_codes, minlength=n_users),
+        'src': keys // n_users if n_users else empty,
+        'dst': keys % n_users if n_users else empty,
+        'mentions': mention_counts,
+        'replies': reply_counts,
+        'weight': mention_counts * GRAPH_MENTION_WEIGHT + reply_counts * GRAPH_REPLY_WEIGHT
+    }
+
+
+def _reverse_weights(graph: Dict[str, Any]) -> np.ndarray:
+    """每条边 (s, d) 对应反向边 (d, s) 的权重，不存在时为 0 (边编码已排序，二分查找；要求图非空)。"""
+    n_users = len(graph['user_ids'])
+    keys = graph['src'] * n_users + graph['dst']
+    reverse = graph['dst'] * n_users + graph['src']
+    pos = np.minimum(np.searchsorted(keys, reverse), len(keys) - 1)
+    return np.where(keys[pos] == reverse, graph['weight'][pos], 0).astype(np.float64)
+
+
+def detect_communities(graph: Dict[str, Any], max_iter: int = GRAPH_LPA_MAX_ITER) -> np.ndarray:
+    """
+    加权标签传播 (无向化) 划分社群，返回每个用户的社群标签。
+
+    每轮每个节点取邻居中权重和最大的标签；当前标签带极小的额外权重，使平局时保持不变。
+    奇偶轮分别只更新奇数 / 偶数下标的节点 (半同步)，避免全同步更新来回振荡或把社群拆碎。
+    """
+    n_users = len(graph['user_ids'])
+    labels = np.arange(n_users, dtype=np.int64)
+    if len(graph['src']) == 0:
+        return labels
+
+    nodes = np.concatenate([graph['src'], graph['dst']])
+    neighbors = np.concatenate([graph['dst'], graph['src']])
+    weights = np.concatenate([graph['weight'], graph['weight']]).astype(np.float64)
+    everyone = np.arange(n_users, dtype=np.int64)
+    stable_rounds = 0
+    for step in range(max_iter * 2):
+        cand_nodes = np.concatenate([nodes, everyone])
+        cand_labels = np.concatenate([labels[neighbors], labels])
+        cand_weights = np.concatenate([weights, np.full(n_users, 1e-6)])
+        keys, inverse = np.unique(cand_nodes * n_users + cand_labels, return_inverse=True)
+        totals = np.bincount(inverse, weights=cand_weights)
+        key_nodes, key_labels = keys // n_users, keys % n_users
+        # 按 (节点, -权重, 标签) 排序后取每个节点的第一行
+        best = np.lexsort((key_labels, -totals, key_nodes))
+        first = np.r_[True, key_nodes[best][1:] != key_nodes[best][:-1]]
+        winners, winner_labels = key_nodes[best][first], key_labels[best][first]
+        turn = (winners % 2) == (step % 2)
+        new_labels = labels.copy()
+        new_labels[winners[turn]] = winner_labels[turn]
+        stable_rounds = stable_rounds + 1 if np.array_equal(new_labels, labels) else 0
+        labels = new_labels
+        if stable_rounds >= 2: # 奇偶两半都不再变化
+            break
+    return labels
+
+
+def summarize_graph(graph: Dict[str, Any], top_n: int = GRAPH_TOP_EDGES) -> Dict[str, Any]:
+    """
+    导出供 Prompt 使用的关系事实 (纯 Python 类型，可直接 JSON 序列化)。
+
+    Returns:
+        Dict:
+            top_pairs: 按双向权重和排名的用户对，含双方提及 / 接话次数与互惠度 (较弱方向 / 较强方向)
+            one_sided: 单向关注最明显的边 (反向权重远低于正向)
+            reciprocity: 全局加权互惠度 sum(min(w_ij, w_ji)) / sum(w_ij)
+            communities: 人数不少于 2 且不是全群的社群，按消息数排名，每个社群列出核心成员
+    """
+    names = graph['user_names']
+    if len(graph['src']) == 0:
+        return {'top_pairs': [], 'one_sided': [], 'reciprocity': 0.0, 'communities': []}
+
+    src, dst, weight = graph['src'], graph['dst'], graph['weight'].astype(np.float64)
+    reverse = _reverse_weights(graph)
+    reciprocity = float(np.minimum(weight, reverse).sum() / weight.sum()) if weight.sum() else 0.0
+
+    # 无向用户对：只保留 src < dst 的代表边，或反向边不存在的 src > dst 边
+    is_rep = (src < dst) | (reverse == 0)
+    lo, hi = np.minimum(src, dst)[is_rep], np.maximum(src, dst)[is_rep]
+    order = np.argsort(-(weight + reverse)[is_rep], kind='stable')[:top_n]
+    n_users = len(graph['user_ids'])
+    keys = src * n_users + dst
+
+    def find(a, b) -> Optional[int]:
+        i = int(np.searchsorted(keys, a * n_users + b))
+        return i if i < len(keys) and keys[i] == a * n_users + b else None
+
+    def direction(a, b):
+        i = find(a, b)
+        if i is None:
+            return {'mentions': 0, 'replies': 0}
+        return {'mentions': int(graph['mentions'][i]), 'replies': int(graph['replies'][i])}
+
+    top_pairs = []
+    for i in order:
+        a, b = int(lo[i]), int(hi[i])
+        ab, ba = find(a, b), find(b, a)
+        w_ab = float(weight[ab]) if ab is not None else 0.0
+        w_ba = float(weight[ba]) if ba is not None else 0.0
+        top_pairs.append({
+            'users': [names[a], names[b]],
+            'weight': round(w_ab + w_ba, 2),
+            'a_to_b': direction(a, b),
+            'b_to_a': direction(b, a),
+            'reciprocity': round(min(w_ab, w_ba) / max(w_ab, w_ba), 2) if max(w_ab, w_ba) else 0.0
+        })
+
+    # 单向关注：正向权重足够大且至少是反向的若干倍
+    lopsided = (weight >= GRAPH_ONE_SIDED_MIN_WEIGHT) & (weight >= GRAPH_ONE_SIDED_RATIO * np.maximum(reverse, 1))
+    lopsided_idx = np.flatnonzero(lopsided)
+    lopsided_idx = lopsided_idx[np.argsort(-weight[lopsided_idx], kind='stable')][:top_n]
+    one_sided = [
+        {'from': names[int(src[i])], 'to': names[int(dst[i])],
+         'weight': round(float(weight[i]), 2), 'reverse_weight': round(float(reverse[i]), 2)}
+        for i in lopsided_idx
+    ]
+
+    labels = detect_communities(graph)
+    messages = graph['messages']
+    communities = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) < 2 or len(members) == len(labels):
+            continue # 单人或全群一个圈子都不构成“小圈子”
+        members = members[np.argsort(-messages[members], kind='stable')]
+        communities.append({
+            'size': int(len(members)),
+            'messages': int(messages[members].sum()),
+            'core_members': [names[int(m)] for m in members[:GRAPH_COMMUNITY_MEMBERS]]
+        })
+    communities.sort(key=lambda c: -c['messages'])
+
+    return {
+        'top_pairs': top_pairs,
+        'one_sided': one_sided,
+        'reciprocity': round(reciprocity, 4),
+        'communities': communities[:GRAPH_MAX_COMMUNITIES]
+    }
+
+
+def format_graph_facts(summary: Optional[Dict[str, Any]]) -> str:
+    """将关系事实格式化为紧凑的 Prompt 文本，无关系数据时返回空字符串。"""
+    if not summary or not summary.get('top_pairs'):
+        return ""
+    lines = [f"- 全群互惠度: {summary['reciprocity']:.0%} (双向互动占全部互动的比例)"]
+    for p in summary['top_pairs']:
+        a, b = p['users']
+        lines.append(
+            f"- {a} ⇄ {b}: {a}→{b} @{p['a_to_b']['mentions']} 接话{p['a_to_b']['replies']}，"
+            f"{b}→{a} @{p['b_to_a']['mentions']} 接话{p['b_to_a']['replies']}，互惠度 {p['reciprocity']}"
+        )
+    for e in summary.get('one_sided', []):
+        lines.append(f"- 单向关注: {e['from']} → {e['to']} (权重 {e['weight']}，反向 {e['reverse_weight']})")
+    for i, c in enumerate(summary.get('communities', []), 1):
+        lines.append(f"- 小圈子{i} ({c['size']}人): {'、'.join(c['core_members'])}")
+    return "\n".join(lines)
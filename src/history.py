@@ -9,10 +9,18 @@ History Manager Module
 
 import json
 import os
+import uuid
+import threading
+import contextlib
 import pandas as pd
 from datetime import datetime
 from typing import List, Dict, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows: 仅保留进程内的线程锁
+    fcntl = None
+
 HISTORY_FILE = "history.json"
 
 class HistoryManager:
@@ -25,13 +33,44 @@ class HistoryManager:
         # 作用: 确定存储路径，确保文件存在
         # 关联: 被 App 调用
         self.file_path = file_path
+        self._lock = threading.Lock() # 批处理模式下多个任务会并发写入
         self._ensure_file()
 
     def _ensure_file(self):
         """确保历史记录文件存在。"""
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+        with self._locked():
+            if not os.path.exists(self.file_path):
+                self._write(self.file_path, [])
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        读-改-写的互斥区：进程内线程锁 + 旁路锁文件上的 flock。
+        Web 进程与多个 Worker 进程共享同一份 history.json，仅靠线程锁无法互斥。
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.file_path + ".lock", 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write(path: str, records: List[Dict]):
+        """先写同目录下的唯一临时文件再 os.replace，读者永远不会看到截断到一半的文件。"""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'x', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
 
     def add_record(self, chat_name: str, messages_count: int, report_path: str):
         """
@@ -49,11 +88,10 @@ class HistoryManager:
             "report_path": report_path
         }
         
-        records = self.get_records()
-        records.insert(0, record) # 最新记录排前面
-        
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
+        with self._locked():
+            records = self.get_records()
+            records.insert(0, record) # 最新记录排前面
+            self._write(self.file_path, records)
 
     def get_records(self) -> List[Dict]:
         """
@@ -70,5 +108,5 @@ class HistoryManager:
 
     def clear_history(self):
         """清空历史记录。"""
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump([], f)
+        with self._locked():
+            self._write(self.file_path, [])
@@ -0,0 +1,224 @@
+# src/ingest.py
+
+"""
+Multi-file Ingestion Module
+===========================
+负责多文件 / 压缩包 / 目录形式的聊天记录导入：并行解析、按时间 k 路归并、指纹去重。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import time
+import heapq
+import zipfile
+import itertools
+from operator import itemgetter
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Tuple, List
+from src.registry import *
+from src.parser import QQChatParser
+
+
+def _parse_source(source: Dict[str, Any], cancel_token=None) -> Tuple[pd.DataFrame, Dict[str, Any], float]:
+    """
+    解析单个数据源 (独立进程中执行)。
+    """
+    # 意义: 进程池工作函数
+    # 作用: 读取普通 JSON 文件或压缩包内的 JSON 成员，交给 QQChatParser 解析
+    # 关联: 被 MultiFileIngestor.ingest 通过 ProcessPoolExecutor 调用，必须是模块级函数以便序列化
+    start = time.perf_counter()
+
+    if source.get('member'):
+        with zipfile.ZipFile(source['path']) as zf:
+            content = zf.read(source['member']).decode('utf-8')
+    else:
+        with open(source['path'], 'r', encoding='utf-8') as f:
+            content = f.read()
+
+    df, meta = QQChatParser().parse_json(content, cancel_token=cancel_token)
+    return df, meta, time.perf_counter() - start
+
+
+class MultiFileIngestor:
+    """
+    多数据源导入器，将若干份相互重叠的导出文件合并为一份按时间有序、无重复的 DataFrame。
+    """
+
+    def __init__(self, max_workers: int = INGEST_MAX_WORKERS, logger=None, cancel_token=None):
+        # 意义: 初始化导入器
+        # 作用: 设置并行解析的进程数、日志记录器与取消令牌
+        # 关联: 被 AnalysisPipeline.run 调用
+        self.max_workers = max_workers
+        self.logger = logger
+        self.cancel_token = cancel_token
+
+    def collect_sources(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        将文件、目录和 zip 压缩包展开为待解析的数据源列表。
+        """
+        # 意义: 输入归一化
+        # 作用: 目录递归收集 JSON/ZIP，压缩包展开为其内部的 JSON 成员
+        # 关联: ingest 的第一步
+        sources = []
+        for path in paths:
+            if os.path.isdir(path):
+                children = sorted(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(path)
+                    for name in names
+                    if name.lower().endswith(tuple(INGEST_EXTENSIONS))
+                )
+                sources.extend(self.collect_sources(children))
+            elif zipfile.is_zipfile(path):
+                with zipfile.ZipFile(path) as zf:
+                    members = [info for info in zf.infolist()
+                               if not info.is_dir() and info.filename.lower().endswith('.json')]
+                    # 成员在解析进程中整体读入内存；file_size 是解压读取的上限 (超出会报错)，先按声明大小拒绝解压炸弹
+                    if sum(info.file_size for info in members) > INGEST_MAX_ZIP_BYTES:
+                        raise ValueError(f"压缩包 {os.path.basename(path)} 解压后过大，已拒绝")
+                    for info in members:
+                        sources.append({
+                            'name': f"{os.path.basename(path)}:{info.filename}",
+                            'path': path,
+                            'member': info.filename,
+                            'size': info.file_size
+                        })
+            else:
+                sources.append({
+                    'name': os.path.basename(path),
+                    'path': path,
+                    'member': None,
+                    'size': os.path.getsize(path)
+                })
+        return sources
+
+    def ingest(self, paths: List[str]) -> Tuple[pd.DataFrame, Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        并行解析所有数据源，并归并为一份有序去重的 DataFrame。
+
+        Returns:
+            (合并后的 DataFrame, 合并后的元数据, 每个数据源的导入统计)
+        """
+        # 意义: 导入主流程
+        # 作用: 解析 -> 单源排序检查 -> 指纹计算 -> k 路归并去重 -> 按归并顺序取行
+        # 关联: 输出与 QQChatParser.parse_json 相同的 (df, meta) 结构
+        sources = self.collect_sources(paths)
+        if not sources:
+            raise ValueError("未找到可解析的 JSON 文件")
+
+        parsed = self._parse_all(sources)
+
+        frames, metas, file_stats = [], [], []
+        for source, (df, meta, elapsed) in zip(sources, parsed):
+            if not df.empty:
+                df = self._ensure_sorted(df)
+            frames.append(df)
+            metas.append(meta)
+            file_stats.append({
+                'name': source['name'],
+                'bytes': source['size'],
+                'messages': len(df),
+                'duplicates': 0,
+                'parse_seconds': round(elapsed, 3),
+                'start': str(df[COL_DATETIME].iloc[0]) if not df.empty else None,
+                'end': str(df[COL_DATETIME].iloc[-1]) if not df.empty else None
+            })
+
+        merged = self._merge_dedup(frames, file_stats)
+        meta = self._merge_meta(metas, merged)
+
+        if self.logger:
+            for s in file_stats:
+                self.logger.info(
+                    f"导入 {s['name']}: {s['messages']} 条, 重复 {s['duplicates']} 条, "
+                    f"{s['bytes'] / 1024 / 1024:.1f}MB, 解析耗时 {s['parse_seconds']}s, "
+                    f"范围 {s['start']} ~ {s['end']}"
+                )
+            self.logger.info(f"多文件合并完成: {len(sources)} 个数据源 -> {len(merged)} 条消息")
+
+        return merged, meta, file_stats
+
+    def _parse_all(self, sources: List[Dict[str, Any]]) -> List[Tuple[pd.DataFrame, Dict[str, Any], float]]:
+        """
+        并行解析，单数据源时直接在当前进程解析。
+        
+        取消时撤销尚未开始的数据源；已在子进程中解析的数据源无法中断，结果会被丢弃。
+        """
+        workers = min(self.max_workers, len(sources))
+        if workers <= 1:
+            return [_parse_source(s, self.cancel_token) for s in sources]
+
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_parse_source, s) for s in sources]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=CANCEL_STORE_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                if self.cancel_token is not None:
+                    self.cancel_token.check()
+            return [f.result() for f in futures]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_sorted(self, df: pd.DataFrame) -> pd.DataFrame:
+        """单个导出文件通常已按时间有序，仅在必要时排序。"""
+        if not pd.api.types.is_datetime64_any_dtype(df[COL_DATETIME]):
+            df[COL_DATETIME] = pd.to_datetime(df[COL_DATETIME])
+        if not df[COL_DATETIME].is_monotonic_increasing:
+            df = df.sort_values(COL_DATETIME, kind='stable')
+        return df.reset_index(drop=True)
+
+    def _merge_dedup(self, frames: List[pd.DataFrame], file_stats: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        k 路归并各数据源，并按消息指纹 (时间戳 + 发送者 + 内容哈希) 去除数据源之间的重叠。
+        """
+        # 意义: 合并重叠导出
+        # 作用: 各数据源已各自有序，用 heapq.merge 归并行号流，避免对拼接结果整体重排
+        # 关联: 指纹由 pd.util.hash_pandas_object 向量化计算
+        non_empty = [(i, df) for i, df in enumerate(frames) if not df.empty]
+        if not non_empty:
+            return pd.DataFrame()
+        if len(non_empty) == 1:
+            return non_empty[0][1]
+
+        offsets, streams = {}, []
+        offset = 0
+        for i, df in non_empty:
+            offsets[i] = offset
+            offset += len(df)
+            timestamps = pd.DatetimeIndex(df[COL_DATETIME]).asi8
+            fingerprints = pd.util.hash_pandas_object(
+                df[[COL_DATETIME, COL_USER_ID, COL_CONTENT]].astype(str), index=False
+            ).to_numpy()
+            streams.append(zip(timestamps.tolist(), fingerprints.tolist(), itertools.repeat(i), range(len(df))))
+
+        # 同一数据源内的重复消息 (如连续复读 "+1") 是真实消息，不能去掉：
+        # 每个指纹保留各数据源中出现次数的最大值，只去掉其它数据源重叠导出的副本
+        emitted: Dict[int, int] = {}
+        occurrences: Dict[tuple, int] = {}
+        take = []
+        for _, fp, i, row in heapq.merge(*streams, key=itemgetter(0)):
+            nth = occurrences.get((fp, i), 0) + 1
+            occurrences[(fp, i)] = nth
+            if nth <= emitted.get(fp, 0):
+                file_stats[i]['duplicates'] += 1
+                continue
+            emitted[fp] = nth
+            take.append(offsets[i] + row)
+
+        combined = pd.concat([df for _, df in non_empty], ignore_index=True)
+        return combined.take(take).reset_index(drop=True)
+
+    def _merge_meta(self, metas: List[Dict[str, Any]], merged: pd.DataFrame) -> Dict[str, Any]:
+        """合并元数据：群名取第一个有效值，消息数与时间范围以合并结果为准。"""
+        chat_name = next(
+            (m.get('chat_name') for m in metas if m.get('chat_name') and m.get('chat_name') != UNKNOWN_GROUP_NAME),
+            UNKNOWN_GROUP_NAME
+        )
+        return {
+            "chat_name": chat_name,
+            "total_messages": len(merged),
+            "start_time": str(merged[COL_DATETIME].iloc[0]) if not merged.empty else None,
+            "end_time": str(merged[COL_DATETIME].iloc[-1]) if not merged.empty else None
+        }
@@ -0,0 +1,193 @@
+# src/json_extract.py
+
+"""
+JSON Extraction Module
+======================
+负责从 LLM 输出中容错地提取 JSON：定位最外层对象、修复常见缺陷并按阶段 Schema 校验。
+遵循 Phase 5 编程规范。
+"""
+
+import json
+from typing import Dict, Any, List, Tuple
+
+# 字符串外出现时视为结构符号的全角字符
+_STRUCTURAL_FULLWIDTH = {'：': ':', '，': ','}
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class LLMJSONExtractor:
+    """
+    LLM 输出的 JSON 提取与修复器。
+    """
+
+    def extract(self, text: str) -> Tuple[Dict[str, Any], str]:
+        """
+        从任意 LLM 输出中提取 JSON 对象。
+
+        Returns:
+            (解析结果, 状态) 状态为 "clean" (无需修复) 或 "repaired" (经过修复)
+
+        Raises:
+            ValueError: 无法定位或修复出合法的 JSON 对象
+        """
+        # 意义: 容错提取入口
+        # 作用: 先尝试直接解析，失败后执行单遍扫描修复
+        # 关联: 被 ReportGenerator 的 Map / Reduce 阶段调用
+        if not text or '{' not in text and '“' not in text:
+            raise ValueError("No JSON object found in response")
+
+        stripped = text.strip()
+        if stripped.startswith("```"):
+            stripped = stripped.split("\n", 1)[1] if "\n" in stripped else stripped[3:]
+        if stripped.endswith("```"):
+            stripped = stripped[:-3]
+        try:
+            result = json.loads(stripped)
+            if isinstance(result, dict):
+                return result, "clean"
+        except json.JSONDecodeError:
+            pass
+
+        result = self._repair_and_load(text)
+        if not isinstance(result, dict):
+            raise ValueError("Top-level JSON value is not an object")
+        return result, "repaired"
+
+    def validate(self, obj: Dict[str, Any], schema: Dict[str, type]) -> List[str]:
+        """
+        按 Schema 校验并就地做宽松类型转换，返回缺失或类型不符的字段列表。
+        """
+        # 意义: 阶段 Schema 校验
+        # 作用: list 字段收到字符串时包装为列表；str 字段收到 dict/list 时序列化为字符串
+        # 关联: 缺失字段会被 Generator 单独补请求
+        missing = []
+        for field, expected in schema.items():
+            value = obj.get(field)
+            if value is None or value == "" and expected is str:
+                missing.append(field)
+                continue
+            if isinstance(value, expected):
+                continue
+            if expected is list and isinstance(value, str):
+                obj[field] = [value]
+            elif expected is str and isinstance(value, (dict, list)):
+                obj[field] = json.dumps(value, ensure_ascii=False)
+            elif expected is str and isinstance(value, (int, float)):
+                obj[field] = str(value)
+            else:
+                missing.append(field)
+        return missing
+
+    def _repair_and_load(self, text: str) -> Any:
+        """
+        单遍扫描修复并解析。
+        """
+        # 意义: 缺陷修复
+        # 作用: 处理中文引号/全角标点作结构符、字符串内未转义引号与换行、尾随逗号、截断
+        # 关联: 截断时依次回退到最近的安全切点 (逗号 / 开括号之后) 再补全括号
+        # 从最外层对象的 "{" 开始；前言中的中文引号 (如 以下是“年度报告”的 JSON) 不能作为起点，
+        # 只有完全没有 "{" 时才从第一个中文左引号开始
+        start = text.find('{')
+        if start < 0:
+            start = text.find('“')
+        if start < 0:
+            raise ValueError("No JSON object found in response")
+
+        out: List[str] = []
+        stack: List[str] = []
+        cuts: List[Tuple[int, List[str]]] = []
+        in_string = False
+        smart_string = False
+        n = len(text)
+        i = start
+
+        while i < n:
+            ch = text[i]
+
+            if in_string:
+                if ch == '\\':
+                    if i + 1 < n:
+                        out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                if ch == '"' or (smart_string and ch == '”'):
+                    nxt = self._next_significant(text, i + 1)
+                    if nxt in ('', ',', ':', '}', ']', '，', '：'):
+                        out.append('"')
+                        in_string = False
+                    else:
+                        out.append('\\"')
+                elif ch == '\n':
+                    out.append('\\n')
+                elif ch == '\r':
+                    out.append('\\r')
+                elif ch == '\t':
+                    out.append('\\t')
+                elif ord(ch) >= 0x20:
+                    out.append(ch)
+                i += 1
+                continue
+
+            ch = _STRUCTURAL_FULLWIDTH.get(ch, ch)
+            if ch in '"“”':
+                in_string = True
+                smart_string = ch != '"'
+                out.append('"')
+            elif ch in '{[':
+                stack.append(ch)
+                out.append(ch)
+                cuts.append((len(out), list(stack)))
+            elif ch in '}]':
+                self._drop_trailing_comma(out)
+                if stack:
+                    stack.pop()
+                out.append(ch)
+                if not stack:
+                    break
+            elif ch == ',':
+                cuts.append((len(out), list(stack)))
+                out.append(ch)
+            else:
+                out.append(ch)
+            i += 1
+
+        if in_string:
+            out.append('"')
+
+        candidate = self._close(out, stack)
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+
+        # 截断修复：回退到安全切点，丢弃最后一个不完整的成员
+        for pos, cut_stack in reversed(cuts):
+            try:
+                return json.loads(self._close(out[:pos], cut_stack))
+            except json.JSONDecodeError:
+                continue
+        raise ValueError("Unable to repair JSON response")
+
+    def _close(self, out: List[str], stack: List[str]) -> str:
+        """补全悬空的冒号 / 逗号与未闭合的括号。"""
+        body = "".join(out).rstrip()
+        if body.endswith(','):
+            body = body[:-1]
+        elif body.endswith(':'):
+            body += ' null'
+        return body + "".join(_CLOSERS[b] for b in reversed(stack))
+
+    def _drop_trailing_comma(self, out: List[str]) -> None:
+        """移除闭合括号前的尾随逗号。"""
+        j = len(out) - 1
+        while j >= 0 and out[j].isspace():
+            j -= 1
+        if j >= 0 and out[j] == ',':
+            del out[j]
+
+    def _next_significant(self, text: str, i: int) -> str:
+        """返回 i 之后第一个非空白字符，到达末尾时返回空串。"""
+        n = len(text)
+        while i < n and text[i].isspace():
+            i += 1
+        return text[i] if i < n else ''
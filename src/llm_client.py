@@ -8,6 +8,11 @@ LLM Client Module (Phase 2)
 """
 
 import os
+import time
+import queue
+import asyncio
+import threading
+import contextlib
 from typing import Dict, Any, List, Optional
 try:
     from openai import OpenAI
@@ -15,34 +20,76 @@ except ImportError:
     OpenAI = None
 
 from src.registry import *
+from src.metrics import metrics
+from src.client_pool import client_registry
+from src.budget import throughput
+from src.failover import endpoint_router, parse_endpoints
+
+_NO_LIMIT = contextlib.nullcontext()
 
 class LLMClient:
     """
     LLM 客户端，支持默认配置与自定义配置双模式。
+
+    可配置有序的备用端点 (故障转移)；端点响应慢于其近期 p95 延迟时向下一个端点发起对冲请求，先返回者胜出。
     """
 
-    def __init__(self, mode: str = LLM_MODE_DEFAULT, api_key: str = None, base_url: str = DEFAULT_API_BASE, model: str = DEFAULT_MODEL):
+    def __init__(self, mode: str = LLM_MODE_DEFAULT, api_key: str = None, base_url: str = DEFAULT_API_BASE, model: str = DEFAULT_MODEL,
+                 rate_limiter=None, openai_client=None, cancel_token=None, fallback_endpoints=None, hedge: bool = True):
         # 意义: 初始化客户端
-        # 作用: 加载 API Key 和 Base URL
-        # 关联: 被主程序调用
+        # 作用: 加载 API Key 和 Base URL；可注入共享的限流器、已建立连接池的 OpenAI 客户端与任务取消令牌；
+        #       fallback_endpoints 为备用端点 [{base_url, api_key?, model?}]，hedge 控制是否发起对冲请求
+        # 关联: 被主程序调用；端点健康状况由进程级 src.failover.endpoint_router 共享
         
         self.mode = mode
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
-        self.client = None
+        self._client = openai_client
+        self._pooled = False # 为 True 时每次请求从进程级连接池获取客户端
+        self.rate_limiter = rate_limiter
+        self.cancel_token = cancel_token # 取消时在途请求立即放弃等待并抛出 TaskCancelled
+        # 本客户端累计的 Token 用量 (含服务商前缀缓存命中的 cached_tokens)
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0,
+                      'failovers': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._usage_lock = threading.Lock()
         
         if mode == LLM_MODE_DEFAULT and not self.api_key:
             # 默认模式：尝试从环境变量读取
             self.api_key = os.environ.get("OPENAI_API_KEY", "DEMO_KEY")
+        self.endpoints = parse_endpoints(self.base_url, self.api_key, fallback_endpoints)
+        self.hedge = hedge
         
         # 初始化 OpenAI 客户端 (如果 Key 有效且库已安装)
-        if OpenAI and self.api_key and self.api_key != "DEMO_KEY":
+        # 同一 (base_url, api_key) 的所有任务共享一个连接池，避免重复 TLS 握手
+        if self._client is None and OpenAI and self.api_key and self.api_key != "DEMO_KEY":
             try:
-                self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+                self._pooled = client_registry.get(self.base_url, self.api_key) is not None
             except Exception as e:
                 print(f"[Warning] Failed to init OpenAI client: {e}")
 
+    @property
+    def client(self):
+        """当前可用的 OpenAI 客户端 (注入的实例 / 连接池中的共享实例 / None)；每次访问计为一次连接池租用。"""
+        if self._client is not None:
+            return self._client
+        if self._pooled:
+            return client_registry.get(self.base_url, self.api_key)
+        return None
+
+    @property
+    def _has_client(self) -> bool:
+        """是否可以发起真实请求 (不访问连接池，不计租用)。"""
+        return self._client is not None or self._pooled
+
+    def _client_for(self, endpoint):
+        """端点对应的 OpenAI 客户端 (每次请求只调用一次)：主端点使用 self.client，备用端点取自进程级连接池。"""
+        if endpoint is self.endpoints[0]:
+            return self.client
+        if not self._has_client:
+            return None
+        return client_registry.get(endpoint.base_url, endpoint.api_key)
+
     def generate_summary(self, text_content: str) -> str:
         """生成总结报告"""
         system_prompt = self.build_system_prompt("请生成一份幽默的年度总结报告，包含：年度群画像、季度小剧场、年度颁奖典礼、社死时刻、年度总结诗。")
@@ -63,52 +110,50 @@ class LLMClient:
         
         target_model = model if model else self.model
         
-        # 1. 尝试真实调用
-        if self.client:
-            # 简单重试机制 (Max 2 times)
-            max_retries = 2
-            for attempt in range(max_retries):
-                try:
-                    print(f"[Info] Sending request to {target_model} (Attempt {attempt+1}/{max_retries})...")
-                    response = self.client.chat.completions.create(
-                        model=target_model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        timeout=60  # 设置 60s 超时
-                    )
-                    content = response.choices[0].message.content
-                    if not content:
-                        raise ValueError("Empty response from LLM")
-                    return content
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"[Error] API Call Failed (Attempt {attempt+1}): {error_msg}")
-                    
-                    # 如果是最后一次尝试，且是自定义模式，则返回错误 UI
-                    if attempt == max_retries - 1:
-                        if self.mode != LLM_MODE_DEFAULT:
-                            print(f"[Error] All retries failed. Returning error message to UI.")
-                            return f"""
-                            <div style="border: 2px solid #ff4444; padding: 15px; background: #fff0f0; color: #cc0000; border-radius: 8px; margin: 20px 0; font-family: sans-serif;">
-                                <h3 style="margin-top:0; color: #cc0000;">⚠️ AI 生成失败 (API Error)</h3>
-                                <div style="margin-bottom: 10px;">
-                                    <strong>错误信息:</strong> <code style="background: #eee; padding: 2px 5px; border-radius: 4px;">{error_msg}</code>
-                                </div>
-                                <ul style="padding-left: 20px; color: #666;">
-                                    <li><strong>模型:</strong> {target_model}</li>
-                                    <li><strong>地址:</strong> {str(self.client.base_url)}</li>
-                                    <li><strong>建议:</strong> 请检查 API Key 余额、网络连通性或模型名称是否正确。</li>
-                                </ul>
-                            </div>
-                            """
-                    # 否则继续下一次重试
-                    import time
-                    time.sleep(1) # Backoff
-        
+        # 1. 尝试真实调用 (多端点故障转移 + 对冲请求)
+        if self._has_client:
+            try:
+                return self._complete(system_prompt, user_prompt, target_model)
+            except Exception as e:
+                # 自定义模式下所有端点均失败时返回错误 UI
+                if self.mode != LLM_MODE_DEFAULT:
+                    return self._error_html(str(e), target_model)
+
         # 2. Mock 回退 (仅在默认模式或无 Client 时触发)
+        return self._fallback_response(user_prompt)
+
+    async def achat_completion(self, system_prompt: str, user_prompt: str, model: Optional[str] = None) -> str:
+        """
+        chat_completion 的异步版本 (AsyncOpenAI)，用于异步流水线 (src.steps.arun_steps)。
+
+        故障转移、对冲、熔断、用量统计与错误回退均与同步版本一致；落败的对冲请求会被真正取消。
+        """
+        target_model = model if model else self.model
+        if self._has_client:
+            try:
+                return await self._acomplete(system_prompt, user_prompt, target_model)
+            except Exception as e:
+                if self.mode != LLM_MODE_DEFAULT:
+                    return self._error_html(str(e), target_model)
+        return self._fallback_response(user_prompt)
+
+    def _error_html(self, error_msg: str, target_model: str) -> str:
+        print(f"[Error] All retries failed. Returning error message to UI.")
+        return f"""
+        <div style="border: 2px solid #ff4444; padding: 15px; background: #fff0f0; color: #cc0000; border-radius: 8px; margin: 20px 0; font-family: sans-serif;">
+            <h3 style="margin-top:0; color: #cc0000;">⚠️ AI 生成失败 (API Error)</h3>
+            <div style="margin-bottom: 10px;">
+                <strong>错误信息:</strong> <code style="background: #eee; padding: 2px 5px; border-radius: 4px;">{error_msg}</code>
+            </div>
+            <ul style="padding-left: 20px; color: #666;">
+                <li><strong>模型:</strong> {target_model}</li>
+                <li><strong>地址:</strong> {', '.join(e.base_url for e in self.endpoints)}</li>
+                <li><strong>建议:</strong> 请检查 API Key 余额、网络连通性或模型名称是否正确。</li>
+            </ul>
+        </div>
+        """
+
+    def _fallback_response(self, user_prompt: str) -> str:
         if self.mode == LLM_MODE_DEFAULT:
              print("[Info] Using Mock response (Default Mode).")
              return self._mock_response(user_prompt)
@@ -121,6 +166,289 @@ class LLMClient:
              </div>
              """
 
+    def _complete(self, system_prompt: str, user_prompt: str, target_model: str) -> str:
+        """
+        按端点健康顺序发起请求，返回第一个成功的响应内容；全部失败时抛出最后一个异常。
+        """
+        # 意义: 故障转移与对冲
+        # 作用: 请求失败立即转向下一个端点 (重试同一端点前退避)；唯一在途请求超过其端点近期 p95 延迟
+        #       (src.failover.hedge_delay) 时向下一个端点发起对冲，先成功者胜出，落败请求被放弃 (结果丢弃)
+        # 关联: 请求在辅助线程中执行，主线程轮询取消令牌，取消时立即抛出 TaskCancelled
+        # 注意: 同步 SDK 无法从其他线程中止进行中的非流式请求，落败 / 被取消的请求会在其守护线程中
+        #       继续运行到响应返回或 _request_timeout() 超时 (期间占用限流名额，用量照常计入)；
+        #       需要真正中止落败请求时使用异步路径 (_acomplete)
+        token = self.cancel_token
+        pending = self._attempt_plan(target_model)
+        total = len(pending)
+        results = queue.Queue()
+        inflight = {}  # attempt -> (endpoint, 发起时间)
+        hedge_attempt, hedge_endpoint = None, None
+        last_error = None
+        call_started = time.perf_counter()
+
+        def launch() -> None:
+            endpoint = pending.pop(0)
+            attempt = total - len(pending)
+            model = self._announce(endpoint, target_model, attempt, total)
+            inflight[attempt] = (endpoint, time.perf_counter())
+            threading.Thread(
+                target=self._attempt, daemon=True,
+                args=(attempt, endpoint, model, system_prompt, user_prompt, self._request_timeout(), results)
+            ).start()
+
+        launch()
+        while inflight:
+            hedge_at = self._hedge_deadline(inflight, pending, hedge_attempt, target_model)
+            wait = CANCEL_POLL_INTERVAL if hedge_at is None else max(0.0, min(CANCEL_POLL_INTERVAL, hedge_at - time.perf_counter()))
+            try:
+                attempt, content, error = results.get(timeout=wait)
+            except queue.Empty:
+                if token:
+                    token.check()
+                if hedge_at is not None and time.perf_counter() >= hedge_at:
+                    hedge_attempt, hedge_endpoint = total - len(pending) + 1, pending[0]
+                    print(f"[Info] Request exceeded p95 latency, hedging to {pending[0].base_url}.")
+                    launch()
+                continue
+            if attempt not in inflight:
+                continue
+            endpoint, _ = inflight.pop(attempt)
+
+            if error is None:
+                if inflight:
+                    metrics.incr('llm_requests_abandoned_total', model=target_model)
+                self._finish(target_model, call_started, hedge_endpoint, won=attempt == hedge_attempt)
+                return content
+
+            last_error = error
+            print(f"[Error] API Call Failed (Attempt {attempt}): {error}")
+            if pending and not inflight:
+                if self._retry_same(endpoint, pending):
+                    # 重试同一端点前退避
+                    if token:
+                        token.wait(LLM_RETRY_BACKOFF)
+                        token.check()
+                    else:
+                        time.sleep(LLM_RETRY_BACKOFF)
+                launch()
+
+        self._finish(target_model, call_started, hedge_endpoint, won=False)
+        raise last_error
+
+    async def _acomplete(self, system_prompt: str, user_prompt: str, target_model: str) -> str:
+        """
+        _complete 的异步版本：每个请求为一个 asyncio 任务，胜出后取消其余在途请求 (中止 HTTP 请求)。
+        """
+        token = self.cancel_token
+        pending = self._attempt_plan(target_model)
+        total = len(pending)
+        inflight = {}  # asyncio.Task -> (attempt, endpoint, 发起时间)
+        hedge_task, hedge_endpoint = None, None
+        last_error = None
+        call_started = time.perf_counter()
+
+        def launch() -> asyncio.Task:
+            endpoint = pending.pop(0)
+            attempt = total - len(pending)
+            model = self._announce(endpoint, target_model, attempt, total)
+            task = asyncio.ensure_future(
+                self._aattempt(endpoint, model, system_prompt, user_prompt, self._request_timeout())
+            )
+            inflight[task] = (attempt, endpoint, time.perf_counter())
+            return task
+
+        launch()
+        try:
+            while inflight:
+                hedge_at = self._hedge_deadline(
+                    {t: (e, s) for t, (_, e, s) in inflight.items()}, pending, hedge_task, target_model
+                )
+                wait = CANCEL_POLL_INTERVAL if hedge_at is None else max(0.0, min(CANCEL_POLL_INTERVAL, hedge_at - time.perf_counter()))
+                done, _ = await asyncio.wait(inflight, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if token:
+                        token.check()
+                    if hedge_at is not None and time.perf_counter() >= hedge_at:
+                        hedge_endpoint = pending[0]
+                        print(f"[Info] Request exceeded p95 latency, hedging to {hedge_endpoint.base_url}.")
+                        hedge_task = launch()
+                    continue
+
+                for task in done:
+                    attempt, endpoint, _ = inflight.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if inflight:
+                            metrics.incr('llm_requests_abandoned_total', model=target_model)
+                        self._finish(target_model, call_started, hedge_endpoint, won=task is hedge_task)
+                        return task.result()
+                    last_error = error
+                    print(f"[Error] API Call Failed (Attempt {attempt}): {error}")
+                if pending and not inflight:
+                    if self._retry_same(endpoint, pending):
+                        await asyncio.sleep(LLM_RETRY_BACKOFF)
+                        if token:
+                            token.check()
+                    launch()
+        finally:
+            # 胜出 / 取消 / 异常时中止其余在途请求
+            for task in inflight:
+                task.cancel()
+
+        self._finish(target_model, call_started, hedge_endpoint, won=False)
+        raise last_error
+
+    def _attempt_plan(self, target_model: str) -> List:
+        """本次调用依次尝试的端点 (健康顺序循环补足 LLM_MAX_ATTEMPTS 次)；全部熔断时快速失败。"""
+        endpoints = endpoint_router.order(self.endpoints)
+        if not endpoints:
+            metrics.incr('llm_breaker_rejected_total', model=target_model)
+            raise RuntimeError("All LLM endpoints are circuit-open, retry later")
+        return [endpoints[i % len(endpoints)] for i in range(max(LLM_MAX_ATTEMPTS, len(endpoints)))]
+
+    def _request_timeout(self) -> float:
+        """单个请求的超时：LLM_REQUEST_TIMEOUT，且不超过任务截止时间。"""
+        remaining = self.cancel_token.remaining() if self.cancel_token else None
+        return LLM_REQUEST_TIMEOUT if remaining is None else max(1.0, min(LLM_REQUEST_TIMEOUT, remaining))
+
+    def _announce(self, endpoint, target_model: str, attempt: int, total: int) -> str:
+        """发起请求前的日志与熔断探测标记，返回该端点实际使用的模型。"""
+        model = endpoint.model or target_model
+        print(f"[Info] Sending request to {model} @ {endpoint.base_url} (Attempt {attempt}/{total})...")
+        endpoint_router.acquire(endpoint)
+        return model
+
+    def _hedge_deadline(self, inflight: Dict, pending: List, hedged, target_model: str) -> Optional[float]:
+        """唯一在途请求的对冲时刻 (perf_counter)；已对冲、无备用端点或样本不足时返回 None。"""
+        if not self.hedge or hedged is not None or len(inflight) != 1 or not pending:
+            return None
+        (endpoint, started), = inflight.values()
+        delay = endpoint_router.hedge_delay(endpoint, endpoint.model or target_model)
+        if delay is None or pending[0] is endpoint:
+            return None
+        return started + delay
+
+    def _retry_same(self, failed, pending: List) -> bool:
+        """失败后的下一次尝试是否仍为同一端点 (需退避)；否则计为一次故障转移。"""
+        if pending[0] is failed:
+            return True
+        with self._usage_lock:
+            self.usage['failovers'] += 1
+        metrics.incr('llm_failovers_total', base_url=pending[0].base_url)
+        return False
+
+    def _attempt(self, attempt: int, endpoint, model: str, system_prompt: str, user_prompt: str,
+                 timeout: float, results: queue.Queue) -> None:
+        """在辅助线程中向单个端点发送请求，结果 (attempt, content, error) 放入 results。"""
+        started = time.perf_counter()
+        try:
+            client = self._client_for(endpoint)
+            if client is None:
+                raise RuntimeError(f"No client available for {endpoint.base_url}")
+            with self.rate_limiter or _NO_LIMIT:
+                started = time.perf_counter()
+                response = client.chat.completions.create(
+                    model=model, messages=self._messages(system_prompt, user_prompt), timeout=timeout
+                )
+            content = self._on_response(endpoint, model, response, time.perf_counter() - started)
+        except Exception as e:
+            self._on_failure(endpoint, model, started)
+            results.put((attempt, None, e))
+            return
+        results.put((attempt, content, None))
+
+    async def _aattempt(self, endpoint, model: str, system_prompt: str, user_prompt: str, timeout: float) -> str:
+        """向单个端点发送异步请求；没有可用的异步客户端时在线程中执行同步请求。"""
+        started = time.perf_counter()
+        try:
+            client = self._async_client_for(endpoint)
+            async with self.rate_limiter or _NO_LIMIT:
+                started = time.perf_counter()
+                messages = self._messages(system_prompt, user_prompt)
+                if client is not None:
+                    response = await client.chat.completions.create(model=model, messages=messages, timeout=timeout)
+                else:
+                    sync_client = self._client_for(endpoint)
+                    if sync_client is None:
+                        raise RuntimeError(f"No client available for {endpoint.base_url}")
+                    response = await asyncio.to_thread(
+                        sync_client.chat.completions.create, model=model, messages=messages, timeout=timeout
+                    )
+            return self._on_response(endpoint, model, response, time.perf_counter() - started)
+        except Exception:
+            self._on_failure(endpoint, model, started)
+            raise
+
+    def _async_client_for(self, endpoint):
+        """端点对应的 AsyncOpenAI 客户端 (取自连接池，绑定当前事件循环)；注入了同步客户端的主端点返回 None。"""
+        if not self._has_client or (endpoint is self.endpoints[0] and not self._pooled):
+            return None
+        return client_registry.async_client(endpoint.base_url, endpoint.api_key)
+
+    @staticmethod
+    def _messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _on_response(self, endpoint, model: str, response, elapsed: float) -> str:
+        """记录用量与端点健康，返回响应内容 (空响应视为失败)。"""
+        self._record_usage(model, getattr(response, 'usage', None), elapsed)
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError("Empty response from LLM")
+        endpoint_router.record(endpoint, model, ok=True, elapsed=elapsed)
+        self._report_pool(endpoint, ok=True)
+        return content
+
+    def _on_failure(self, endpoint, model: str, started: float) -> None:
+        endpoint_router.record(endpoint, model, ok=False, elapsed=time.perf_counter() - started)
+        self._report_pool(endpoint, ok=False)
+
+    def _report_pool(self, endpoint, ok: bool) -> None:
+        # 注入的客户端不属于连接池，无需上报
+        if endpoint is not self.endpoints[0] or self._pooled:
+            client_registry.report(endpoint.base_url, endpoint.api_key, ok=ok)
+
+    def _finish(self, model: str, started: float, hedge_endpoint, won: bool) -> None:
+        """记录一次调用 (含故障转移与对冲) 的端到端耗时与对冲结果。"""
+        hedged = hedge_endpoint is not None
+        metrics.observe('llm_call_seconds', time.perf_counter() - started, model=model, hedged=hedged)
+        if hedged:
+            endpoint_router.record_hedge(hedge_endpoint, won)
+            with self._usage_lock:
+                self.usage['hedges'] += 1
+                self.usage['hedge_wins'] += int(won)
+
+    def _record_usage(self, model: str, usage, elapsed: float) -> None:
+        """
+        累计响应中的 usage 信息，并写入全局指标。
+        """
+        # 意义: 成本与缓存命中统计
+        # 作用: OpenAI 兼容接口的缓存命中位于 usage.prompt_tokens_details.cached_tokens，
+        #       DeepSeek 等服务商使用 usage.prompt_cache_hit_tokens
+        # 关联: app.py 在任务结束时输出本任务的用量汇总；输出速度供 src.budget 估算耗时
+        metrics.observe('llm_request_seconds', elapsed, model=model)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) if details else 0) or getattr(usage, 'prompt_cache_hit_tokens', 0) or 0
+
+        with self._usage_lock:
+            self.usage['requests'] += 1
+            self.usage['prompt_tokens'] += prompt_tokens
+            self.usage['completion_tokens'] += completion_tokens
+            self.usage['cached_tokens'] += cached_tokens
+
+        throughput.record(model, prompt_tokens, completion_tokens, elapsed)
+
+        metrics.incr('llm_prompt_tokens_total', prompt_tokens, model=model)
+        metrics.incr('llm_completion_tokens_total', completion_tokens, model=model)
+        metrics.incr('llm_cached_tokens_total', cached_tokens, model=model)
+
     def test_connection(self) -> dict:
         """
         测试 API 连接状态 (自检功能)。
@@ -129,19 +457,20 @@ class LLMClient:
         # 作用: 发送极简请求检测连通性，不吞没异常
         # 关联: 前端“测试连接”按钮
         
-        if not self.client:
+        client = self.client
+        if not client:
              if self.mode == LLM_MODE_DEFAULT:
                  return {"success": False, "message": "未检测到有效的 API Key。请检查环境变量 OPENAI_API_KEY 是否设置。"}
              else:
                  return {"success": False, "message": "客户端初始化失败。可能是 API Key 为空或 openai 库未安装。"}
         
         # 获取实际使用的 Base URL (OpenAI Client 会自动处理末尾斜杠等)
-        actual_url = str(self.client.base_url)
+        actual_url = str(client.base_url)
         print(f"[Debug] Testing Connection -> URL: {actual_url}, Key: {self.api_key[:8]}***")
 
         try:
             # 发送一个极简的测试请求
-            response = self.client.chat.completions.create(
+            response = client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": "Hi"}],
                 max_tokens=5
@@ -0,0 +1,110 @@
+# src/metrics.py
+
+"""
+Metrics Module
+==============
+负责进程内的运行指标收集 (计数器 / 观测值)，供 /api/metrics 等接口查询。
+遵循 Phase 5 编程规范。
+"""
+
+import sys
+import threading
+from typing import Dict, Any, Tuple, List, Optional
+try:
+    import resource  # 仅 POSIX 提供
+except ImportError:
+    resource = None
+
+
+class MetricsRegistry:
+    """
+    线程安全的简易指标注册表，按 (指标名, 标签) 聚合。
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        # 意义: 初始化指标存储
+        # 作用: counters 保存累计值，observations 保存最近 max_samples 个观测值用于分位数
+        # 关联: 模块级单例 metrics 被各模块共享
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._observations: Dict[Tuple[str, Tuple], List[float]] = {}
+        self.max_samples = max_samples
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        """累加计数器。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """记录一次观测值 (如耗时)。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            samples = self._observations.setdefault(key, [])
+            samples.append(value)
+            if len(samples) > self.max_samples:
+                del samples[:len(samples) - self.max_samples]
+
+    def get(self, name: str, **labels) -> float:
+        """读取单个计数器的当前值。"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        导出所有指标。
+        """
+        # 意义: 指标快照
+        # 作用: 计数器原样输出，观测值输出 count / avg / p50 / p95 / max
+        # 关联: app.py 的 /api/metrics 路由
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            observations = []
+            for (name, labels), samples in sorted(self._observations.items()):
+                ordered = sorted(samples)
+                observations.append({
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': len(ordered),
+                    'avg': round(sum(ordered) / len(ordered), 4),
+                    'p50': round(ordered[len(ordered) // 2], 4),
+                    'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+                    'max': round(ordered[-1], 4)
+                })
+        return {'counters': counters, 'observations': observations}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    当前进程的峰值常驻内存 (MB)。Linux 读取 /proc/self/status 的 VmHWM (可被 reset_peak_rss 重置)，
+    其他 POSIX 系统退回 getrusage (进程启动以来的峰值)，Windows 返回 None。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def reset_peak_rss() -> bool:
+    """重置峰值常驻内存计数 (仅 Linux，写入 /proc/self/clear_refs)，用于按阶段统计峰值。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# 进程级单例
+metrics = MetricsRegistry()
@@ -24,9 +24,9 @@ class QQChatParser:
         # 关联: 无
         pass
 
-    def parse_json(self, file_content: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    def parse_json(self, file_content: str, cancel_token=None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
         """
-        解析 JSON 字符串内容。
+        解析 JSON 字符串内容。cancel_token 非空时每 CANCEL_CHECK_EVERY 条消息检查一次取消。
         """
         # 意义: 核心解析方法
         # 作用: 将 JSON 字符串解析为 Pandas DataFrame 和 元数据字典
@@ -40,10 +40,12 @@ class QQChatParser:
         messages = data.get(JSON_FIELD_MESSAGES, [])
         parsed_data = []
 
-        for msg in messages:
+        for i, msg in enumerate(messages):
             # 意义: 提取单条消息数据
             # 作用: 遍历消息列表，提取时间、发送者、内容等信息
             # 关联: 依赖 _parse_single_message 方法
+            if cancel_token is not None and i % CANCEL_CHECK_EVERY == 0:
+                cancel_token.check()
             
             parsed_msg = self._parse_single_message(msg)
             if parsed_msg:
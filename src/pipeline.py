@@ -0,0 +1,592 @@
+# src/pipeline.py
+
+"""
+Analysis Pipeline Module
+========================
+负责串联 解析 -> 统计 -> Map -> Reduce -> 渲染 -> 增强 的完整分析流程，供 Web 服务与命令行共用。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import gc
+import time
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional
+from src.registry import *
+from src.ingest import MultiFileIngestor
+from src.analyzer import ChatAnalyzer
+from src.llm_client import LLMClient
+from src.generator import ReportGenerator
+from src.steps import Steps, run_steps, arun_steps
+from src.renderer import HTMLRenderer, build_stats_preview, write_stats_preview
+from src.report_store import ReportStore
+from src.timeseries import build_activity_series
+from src.graph import build_interaction_graph, summarize_graph
+from src.sessions import SessionIndex, sample_rows_by_sessions
+from src.prompt_builder import ChatLines
+from src.events import event_mask, events_in_frame
+from src.columnar import MessageStore, out_of_core_available
+from src.metrics import metrics, peak_rss_mb, reset_peak_rss
+from src.budget import plan_budget, format_estimate
+from src.cascade import cascade_settings, split_features, select_hot_splits
+
+
+def smart_sample(df, max_tokens, logger=None, cancel_token=None, events=None) -> List[str]:
+    """
+    智能采样函数，确保不超过 Token 预算，返回按时间排序的采样行 (由 PromptBuilder 一次拼入 Prompt)。
+    events 为本分块包含的异常时刻 (src.events)，其窗口在预算内优先完整保留。
+    """
+    # 意义: Map 采样
+    # 作用: 先按列算出每行长度决定全量发送或按会话采样，再只格式化入选的行，
+    #       不在 df 上新增整列格式化文本，也不产生拼接好的中间字符串
+    # 关联: src.prompt_builder.ChatLines / src.sessions.sample_rows_by_sessions / src.events.event_mask
+    if cancel_token is not None:
+        cancel_token.check()
+    started = time.perf_counter()
+    # 估算字符限制 (1 Token ≈ 1.5 Chars)
+    target_chars = int(max_tokens * 1.5)
+
+    lines = ChatLines(df)
+    total_msgs = len(lines)
+    if total_msgs == 0:
+        return []
+
+    if cancel_token is not None:
+        cancel_token.check()
+    total_chars = int(lines.lengths.sum())
+    if total_chars <= target_chars:
+        rows = None
+        if logger: logger.info(f"数据量较小 ({total_chars} chars)，全量发送")
+    else:
+        # 异常时刻窗口先占用至多 EVENT_SAMPLE_BUDGET_RATIO 的预算，
+        # 其余预算优先保留最热门的完整对话，再均匀抽取背景消息
+        pinned = event_mask(df, events, lines.lengths, target_chars * EVENT_SAMPLE_BUDGET_RATIO)
+        pinned_chars = int(lines.lengths[pinned].sum())
+        index = SessionIndex.from_frame(df)
+        rows = sample_rows_by_sessions(lines.lengths, index, target_chars - pinned_chars)
+        if pinned_chars:
+            rows = index.sort_rows(np.union1d(rows, np.flatnonzero(pinned)))
+        rows = lines.fit(rows, target_chars, required=pinned)
+        if logger:
+            logger.info(f"数据量过大，按会话采样 ({len(index)} 段对话)。从 {total_msgs} 条中抽取 {len(rows)} 条"
+                        + (f"，其中异常时刻 {int(pinned.sum())} 条。" if pinned_chars else "。"))
+
+    sampled = lines.format(rows)
+    metrics.observe('map_sample_seconds', time.perf_counter() - started)
+    return sampled
+
+
+def hash_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """流式计算文件的 sha256，与 StreamingUploader 返回的哈希一致 (未压缩内容)。"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def build_llm_client(config: Dict[str, Any], logger=None, **client_kwargs) -> LLMClient:
+    """
+    根据任务配置构建 LLMClient。
+    """
+    # 意义: 客户端工厂
+    # 作用: custom 模式使用用户填写的地址与 Key，否则进入内置演示模式 (Mock)
+    # 关联: 被 app.py 与 cli.py 调用；client_kwargs 用于注入共享的限流器等
+    llm_config = {}
+    # Base config for LLMClient (acts as default)
+    if config.get('mode') == 'custom':
+        llm_config = {
+            'api_key': config.get('api_key'),
+            'base_url': config.get('base_url'),
+            'model': config.get('model'), # Default model
+            'fallback_endpoints': config.get('fallback_endpoints') or None,
+            'hedge': bool(config.get('hedge_requests', True))
+        }
+    elif logger:
+        logger.info("使用内置演示模式 (Mock)")
+    return LLMClient(**llm_config, **client_kwargs)
+
+
+class _NullLogger:
+    """不输出任何内容的日志器 (运行前估算等无任务上下文的场景)。"""
+
+    def info(self, msg):
+        pass
+
+    def progress(self, percent, status_text):
+        pass
+
+
+class ParseCache:
+    """
+    进程内的解析结果缓存，以数据源内容哈希为键，避免重复解析同一份导出。
+    """
+
+    def __init__(self, max_entries: int = PARSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._items: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key: tuple, value) -> None:
+        with self._lock:
+            if key not in self._items and len(self._items) >= self.max_entries:
+                self._items.pop(next(iter(self._items)))
+            self._items[key] = value
+
+
+class AnalysisPipeline:
+    """
+    分析流水线，持有可在多个任务间共享的组件 (LLM 客户端、渲染器、解析缓存)。
+    """
+
+    def __init__(self, output_folder: str = "output", renderer: Optional[HTMLRenderer] = None,
+                 parse_cache: Optional[ParseCache] = None, history_manager=None,
+                 report_store: Optional[ReportStore] = None, stats_preview: bool = False):
+        # 意义: 初始化流水线
+        # 作用: 注入共享组件；renderer 为空时每次任务新建；report_store 非空时报告内容寻址入库；
+        #       stats_preview 为 True 时统计完成后立即写出预览数据 (Web 服务在 LLM 阶段结束前展示)
+        # 关联: Web 服务每个任务一个流水线，命令行批处理在所有任务间共享一个
+        self.output_folder = output_folder
+        self.renderer = renderer
+        self.parse_cache = parse_cache
+        self.history_manager = history_manager
+        self.report_store = report_store
+        self.stats_preview = stats_preview
+
+    def report_path(self, task_id: str) -> str:
+        """任务报告的输出路径。"""
+        return os.path.join(self.output_folder, f"report_{task_id}.html")
+
+    def stats_path(self, task_id: str) -> str:
+        """任务统计预览 (紧凑 JSON) 的输出路径。"""
+        return os.path.join(self.output_folder, STATS_PREVIEW_PATTERN.format(task_id=task_id))
+
+    def working_set_path(self, task_id: str) -> str:
+        """out-of-core 模式下任务的 Arrow 工作集路径。"""
+        return os.path.join(self.output_folder, OOC_WORKING_SET_PATTERN.format(task_id=task_id))
+
+    def _use_out_of_core(self, config: Dict[str, Any], rows: int, logger) -> bool:
+        """config.out_of_core: true / false / "auto" (默认，消息数达到 OOC_AUTO_MIN_ROWS 时启用)。"""
+        mode = config.get('out_of_core', 'auto')
+        wanted = rows >= OOC_AUTO_MIN_ROWS if mode == 'auto' else bool(mode)
+        if wanted and not out_of_core_available():
+            logger.info("未安装 pyarrow，无法启用 out-of-core 模式，继续使用内存模式")
+            return False
+        return wanted
+
+    def _parse(self, file_paths: List[str], source_hashes: Optional[List[str]], logger, cancel_token=None):
+        """解析数据源，返回 (df, meta, 是否命中解析缓存)。"""
+        cache_key = tuple(source_hashes) if source_hashes and self.parse_cache is not None else None
+        cached = self.parse_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.info("命中解析缓存，跳过解析")
+            return cached[0].copy(), dict(cached[1]), True
+        try:
+            ingestor = MultiFileIngestor(logger=logger, cancel_token=cancel_token)
+            df, meta, _ = ingestor.ingest(file_paths)
+        except Exception as e:
+            raise ValueError(f"文件解析失败: {str(e)}")
+        return df, meta, False
+
+    def _cache_parsed(self, source_hashes: Optional[List[str]], df, meta) -> None:
+        if source_hashes and self.parse_cache is not None:
+            self.parse_cache.put(tuple(source_hashes), (df.copy(), dict(meta)))
+
+    def _plan(self, analyzer: ChatAnalyzer, config: Dict[str, Any], default_model: str):
+        """
+        规划分块并按预算确定执行方案，返回 (splits, plan, is_periodic, budget)；
+        开启级联时 budget.cascade 为级联设置 (src.cascade)。
+        """
+        # 意义: 调用模型前的规划
+        # 作用: 分块规划 (src.planner) + 成本 / 延迟预算 (src.budget)，run 与 estimate 共用
+        # 关联: budget.sample_budget 为每块实际采样预算，budget.skip_refine 为 True 时跳过 HTML 增强
+        max_tokens = int(config.get('max_tokens', 128000))
+        # 单个 Map 请求中聊天记录的 Token 预算 (其余上下文留给指令与输出)
+        split_budget = int(max_tokens * SPLIT_CONTEXT_FILL)
+        splits, plan = analyzer.get_planned_splits(
+            split_budget,
+            coverage=float(config.get('split_coverage') or SPLIT_TARGET_COVERAGE),
+            max_splits=int(config.get('max_map_calls') or SPLIT_MAX_CALLS)
+        )
+        # 非自然季度切分 (非完整年度 / 分块数不为 4) 使用阶段性分析模式
+        is_periodic = bool(splits) and any(k.startswith("Period_") for k in splits.keys())
+        models = {
+            stage: config.get(f'model_{stage}') or default_model
+            for stage in ('map', 'reduce', 'refine')
+        }
+        cascade = cascade_settings(config, len(splits), models['map'])
+        budget = plan_budget(plan, split_budget, models, config, is_periodic=is_periodic, cascade=cascade)
+        return splits, plan, is_periodic, budget
+
+    def estimate(self, file_paths: List[str], config: Dict[str, Any], source_hashes: Optional[List[str]] = None,
+                 logger=None) -> Dict[str, Any]:
+        """
+        运行前估算：解析并规划分块，返回预算方案 (不调用任何模型)。
+
+        解析结果写入解析缓存 (提供 source_hashes 时)，随后确认执行的任务不必重复解析。
+
+        Returns:
+            Dict: plan (分块规划) / budget (src.budget.plan_budget 的结果) / total_messages
+        """
+        logger = logger or _NullLogger()
+        df, meta, cached = self._parse(file_paths, source_hashes, logger)
+        if not cached and not self._use_out_of_core(config, len(df), logger):
+            self._cache_parsed(source_hashes, df, meta)
+        default_model = (config.get('model') if config.get('mode') == 'custom' else None) or DEFAULT_MODEL
+        _, plan, _, budget = self._plan(ChatAnalyzer(df), config, default_model)
+        return {
+            'total_messages': len(df),
+            'plan': {k: v for k, v in plan.items() if k != 'boundaries'},
+            'budget': budget
+        }
+
+    def run(self, task_id: str, file_paths: List[str], config: Dict[str, Any], logger,
+            client: Optional[LLMClient] = None, source_hashes: Optional[List[str]] = None,
+            cancel_token=None) -> Dict[str, Any]:
+        """
+        执行一次完整分析。
+
+        Args:
+            task_id: 任务 ID，用于命名报告文件
+            file_paths: 待分析的文件 / 压缩包 / 目录
+            config: 任务配置 (与 config.json 结构一致)
+            logger: 需提供 info(msg) 与 progress(percent, text)
+            client: 共享的 LLMClient，为空时按 config 新建
+            source_hashes: 数据源内容哈希，提供时用作解析缓存的键
+            cancel_token: 取消令牌 (src.cancel.CancelToken)，取消时各阶段抛出 TaskCancelled
+
+        Returns:
+            Dict: report_path / report_filename / chat_name / total_messages / timings / peak_rss_mb (各阶段峰值内存) / usage / budget (预算方案)；
+            stats_preview 开启时统计预览写入 stats_path(task_id)
+        """
+        if client is None:
+            client = build_llm_client(config, logger)
+        steps = self._run_steps(task_id, file_paths, config, logger, client, source_hashes, cancel_token)
+        return run_steps(steps, client)
+
+    async def arun(self, task_id: str, file_paths: List[str], config: Dict[str, Any], logger,
+                   client: Optional[LLMClient] = None, source_hashes: Optional[List[str]] = None,
+                   cancel_token=None, executor=None) -> Dict[str, Any]:
+        """
+        run 的异步版本：参数与返回值相同。解析 / 统计 / 采样 / 渲染在 executor (线程池，None 为事件循环默认执行器)
+        中执行，LLM 请求通过 AsyncOpenAI 在事件循环上等待，等待期间不占用线程。
+        """
+        if client is None:
+            client = build_llm_client(config, logger)
+        steps = self._run_steps(task_id, file_paths, config, logger, client, source_hashes, cancel_token)
+        return await arun_steps(steps, client, executor)
+
+    def _run_steps(self, task_id: str, file_paths: List[str], config: Dict[str, Any], logger, client: LLMClient,
+                   source_hashes: Optional[List[str]], cancel_token) -> Steps:
+        """
+        run / arun 共用的分析流程 (src.steps)：CPU 阶段直接执行，需要模型时产出 LLM 请求。
+        """
+        timings = {}
+        peak_rss = {}
+        stage_start = time.perf_counter()
+        reset_peak_rss()
+
+        def mark(stage):
+            nonlocal stage_start
+            now = time.perf_counter()
+            timings[stage] = round(now - stage_start, 3)
+            stage_start = now
+            # 各阶段的峰值常驻内存 (进程级；Web 进程内多个任务并发时为近似值)
+            peak_rss[stage] = peak_rss_mb()
+            reset_peak_rss()
+            checkpoint()
+
+        def checkpoint():
+            if cancel_token is not None:
+                cancel_token.check()
+
+        logger.progress(5, "正在初始化组件...")
+
+        # 1. Parse (支持多文件 / zip 压缩包，并行解析后按时间归并去重)
+        for digest in source_hashes or []:
+            logger.info(f"数据指纹 (sha256): {digest}")
+        logger.info(f"正在解析文件: {', '.join(os.path.basename(p) for p in file_paths)}")
+
+        df, meta, cached = self._parse(file_paths, source_hashes, logger, cancel_token)
+        out_of_core = self._use_out_of_core(config, len(df), logger)
+        if not cached and not out_of_core:
+            # 工作集模式下不在进程内缓存整张表
+            self._cache_parsed(source_hashes, df, meta)
+
+        logger.progress(20, f"解析完成，共加载 {len(df)} 条消息")
+        logger.info(f"解析成功: {len(df)} messages")
+
+        # 1.1 out-of-core：写入 Arrow 工作集后释放 DataFrame，后续各阶段按列 / 记录批读取
+        working_set = None
+        if out_of_core:
+            working_set = MessageStore.write(df, self.working_set_path(task_id))
+            size_mb = os.path.getsize(working_set.path) / 1024 / 1024
+            logger.info(f"out-of-core 模式: 已写入工作集 ({len(working_set)} 条, {size_mb:.1f}MB)，释放内存中的 DataFrame")
+            del df
+            gc.collect()
+        mark('parse')
+
+        # 2. Analyze (Stats)
+        logger.progress(30, "正在进行统计分析...")
+        analyzer = ChatAnalyzer(working_set if working_set is not None else df)
+        stats = analyzer.get_basic_stats()
+        # Merge meta into stats if needed, or keep separate.
+        # analyzer.get_basic_stats() returns dict.
+        # meta contains chat_name.
+        stats.update(meta)
+
+        daily_activity = analyzer.get_daily_activity()
+        temporal = analyzer.get_temporal_summary()
+        interactions = analyzer.get_interaction_summary()
+        # 图表序列：默认只内嵌自动选择的粒度，config.chart_resolutions 可指定多个 (day / week / month)
+        activity = build_activity_series(daily_activity, resolutions=config.get('chart_resolutions'))
+        hardcore = analyzer.get_hardcore_stats()
+        hot_sessions = analyzer.get_top_sessions()
+        # 异常时刻：统计检测的事件窗口在 Map 采样中优先保留 (config.event_detection 可关闭)
+        events = analyzer.get_events() if config.get('event_detection', True) else []
+        if events:
+            logger.info(f"检测到 {len(events)} 个异常时刻: " + "，".join(f"{e['start']} {e['label']}" for e in events))
+        rankings = analyzer.get_user_rankings()
+
+        # 统计预览：LLM 阶段开始前即可展示图表与排行榜 (/api/tasks/<id>/stats)
+        if self.stats_preview:
+            write_stats_preview(
+                build_stats_preview(
+                    stats, activity, temporal, rankings,
+                    hardcore=hardcore, interactions=interactions, hot_sessions=hot_sessions,
+                    events=[{k: v for k, v in e.items() if k != 'window'} for e in events]
+                ),
+                self.stats_path(task_id)
+            )
+            logger.info("统计预览已生成，可在 AI 分析完成前查看")
+        logger.progress(40, "统计分析完成")
+        logger.info("基础统计完成")
+        mark('stats')
+
+        # 3. AI Analysis (Map-Reduce)
+        logger.progress(45, "正在初始化 AI 分析组件...")
+
+        if cancel_token is not None:
+            client.cancel_token = cancel_token
+        usage_before = dict(client.usage)
+
+        # Get specific models for each phase
+        default_model = client.model if config.get('mode') == 'custom' else None
+        model_map = config.get('model_map') or default_model
+        model_reduce = config.get('model_reduce') or default_model
+        model_refine = config.get('model_refine') or default_model
+
+        generator = ReportGenerator(client)
+
+        # Step 1: Map (Quarterly/Periodic Analysis)
+        logger.info("正在进行切分...")
+        splits, plan, is_periodic, budget = self._plan(analyzer, config, default_model or client.model)
+        if plan['n_splits']:
+            logger.info(
+                f"切分规划: {len(splits)} 块 ({plan['reason']})，估算 {plan['total_tokens']} tokens，"
+                f"单块预算 {plan['split_budget']}，目标覆盖率 {plan['target_coverage']:.0%}，"
+                f"预计覆盖率 {plan['predicted_coverage']:.0%}"
+            )
+        if is_periodic:
+            logger.info("按阶段切分，启用阶段性分析模式")
+
+        # 预算：调用任何模型之前确定执行方案
+        logger.info(f"预算估算: {format_estimate(budget['estimate'])}")
+        if budget['actions']:
+            logger.info(f"超出任务预算 (原估算 {format_estimate(budget['original'])})，调整: {'; '.join(budget['actions'])}")
+        if not budget['within_budget']:
+            logger.info("调整后仍超出任务预算，按最小方案继续执行")
+        sample_budget = budget['sample_budget']
+
+        quarterly_results = []
+
+        total_quarters = len(splits)
+        if total_quarters == 0:
+            logger.info("切分失败，降级为全量分析")
+            splits = {"Whole_Year": analyzer.get_frame()}
+            total_quarters = 1
+
+        def analyze_split(q_name, q_df, budget_tokens, model):
+            checkpoint()
+            # Sample using Adaptive Strategy (Phase 2 - 3.3)
+            split_events = events_in_frame(q_df, events)
+            sample_lines = smart_sample(q_df, budget_tokens, logger, cancel_token=cancel_token, events=split_events)
+
+            # Generate
+            logger.info(f"发送 AI 请求: {q_name} (Model: {model})")
+            return (yield from generator.quarterly_analysis_steps(
+                q_name, sample_lines, model=model, is_periodic=is_periodic,
+                interactions=summarize_graph(build_interaction_graph(q_df)), events=split_events
+            ))
+
+        cascade = budget['cascade']
+        if cascade:
+            # 级联：廉价模型以小采样初筛全部分块，再由 model_map 以完整采样重跑最热的分块
+            results, features, failed = {}, {}, []
+            for processed_count, (q_name, q_df) in enumerate(splits.items(), 1):
+                logger.progress(50 + int((processed_count - 1) / total_quarters * 15), f"正在初筛 {q_name} ({processed_count}/{total_quarters})...")
+                if q_df.empty:
+                    logger.info(f"分块 {q_name} 数据为空，跳过")
+                    continue
+                features[q_name] = split_features(q_df)
+                results[q_name] = yield from analyze_split(q_name, q_df, cascade['screen_budget'], cascade['model'])
+                if results[q_name].get('summary') == f"{q_name} 分析失败":
+                    failed.append(q_name)
+
+            hot = select_hot_splits(features, results, cascade['hot_splits'], failed)
+            logger.info(f"级联初筛完成: {len(hot)}/{len(results)} 个热点分块交由 {model_map or client.model} 深度分析: {', '.join(hot)}")
+            for processed_count, q_name in enumerate(hot, 1):
+                logger.progress(65 + int((processed_count - 1) / len(hot) * 15), f"正在深度分析 {q_name} ({processed_count}/{len(hot)})...")
+                results[q_name] = yield from analyze_split(q_name, splits[q_name], sample_budget, model_map)
+            quarterly_results = [results[name] for name in splits if name in results]
+        else:
+            for processed_count, (q_name, q_df) in enumerate(splits.items(), 1):
+                progress_start = 50 + int((processed_count - 1) / total_quarters * 30) # 50% -> 80%
+                logger.progress(progress_start, f"正在分析 {q_name} ({processed_count}/{total_quarters})...")
+
+                if q_df.empty:
+                    logger.info(f"分块 {q_name} 数据为空，跳过")
+                    continue
+                quarterly_results.append((yield from analyze_split(q_name, q_df, sample_budget, model_map)))
+
+        for stage, digests in generator.prefix_hashes.items():
+            logger.info(f"Prompt 静态前缀哈希 ({stage}): {', '.join(digests)}")
+        mark('map')
+
+        # Step 2: Reduce (Annual/Periodic Report)
+        logger.progress(85, "正在生成汇总报告...")
+
+        # Prepare Global Stats for Reduce
+        global_stats_simple = {
+            'total_messages': stats.get('total_messages'),
+            'total_users': stats.get('total_users'),
+            'year': analyzer.get_target_year(),
+            'active_users_count': stats.get('active_users_count', 0), # Added safely
+            'silent_users_count': stats.get('silent_users_count', 0), # Added safely
+            'top_talkers': stats.get('top_talkers', []), # Added safely
+            'top_repeaters': stats.get('top_repeaters', []), # Added safely
+            'hardcore': hardcore,
+            # 作息画像 (热力图本身不进入 Prompt，只保留结论)
+            'temporal': {k: v for k, v in temporal.items() if k not in ('heatmap', 'heatmap_max')},
+            'interactions': interactions,
+            'hot_sessions': hot_sessions,
+            'events': events
+        }
+
+        # 获取小剧场配置
+        anime_theme = config.get('anime_theme', 'default')
+        custom_theme_prompt = config.get('custom_theme_prompt', '')
+
+        logger.info(f"发送 AI 请求: 汇总报告 (Model: {model_reduce})")
+        final_html = yield from generator.annual_report_steps(
+            quarterly_results,
+            global_stats_simple,
+            anime_theme=anime_theme,
+            custom_theme_prompt=custom_theme_prompt,
+            model=model_reduce,
+            is_periodic=is_periodic
+        )
+        logger.info("报告生成完成")
+        mark('reduce')
+
+        # 4. Render
+        logger.progress(95, "正在渲染 HTML...")
+        renderer = self.renderer or HTMLRenderer()
+        chat_name = stats.get('title', 'QQ聊天记录')
+        report_path = self.report_path(task_id)
+        report_filename = os.path.basename(report_path)
+
+        cache = analyzer.cache_stats()
+        logger.info(f"统计缓存: {cache['entries']} 项, 命中 {cache['hits']} 次, 未命中 {cache['misses']} 次")
+
+        renderer.render(
+            stats=stats,
+            daily_activity=daily_activity,
+            summary=final_html,
+            rankings=rankings,
+            output_path=report_path,
+            cancel_token=cancel_token,
+            activity=activity,
+            temporal=temporal
+        )
+        mark('render')
+
+        # 4.1 Enhance HTML (Optional)
+        if config.get('enhance_mode', False) and budget['skip_refine']:
+            logger.info("按任务预算跳过 HTML 增强")
+        elif config.get('enhance_mode', False):
+            logger.progress(98, "正在进行最终输出增强 (HTML Refine)...")
+            logger.info(f"启动 HTML 修复与 CSS 优化... (Model: {model_refine})")
+
+            try:
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    raw_html = f.read()
+
+                refine_mode = config.get('refine_mode', REFINE_MODE_SECTIONS)
+                refined_html = yield from generator.refine_report_steps(raw_html, model=model_refine, mode=refine_mode)
+
+                refine_stats = generator.refine_stats
+                if refine_stats.get('mode') == REFINE_MODE_SECTIONS:
+                    logger.info(f"分段增强: 成功 {refine_stats['refined']} 段, 失败 {refine_stats['failed']} 段 {refine_stats.get('failed_blocks', [])}")
+
+                if refined_html and len(refined_html) > 100:
+                    with open(report_path, 'w', encoding='utf-8') as f:
+                        f.write(refined_html)
+                    logger.info("HTML 增强完成并已保存")
+                else:
+                    logger.info("HTML 增强结果异常，保留原文件")
+
+            except Exception as e:
+                logger.info(f"HTML 增强失败: {e}")
+            mark('refine')
+
+        # 4.2 内容寻址入库 (去重 + 预压缩 gzip / brotli)
+        if self.report_store is not None:
+            stored = self.report_store.put_file(report_path)
+            report_path, report_filename = stored['path'], stored['filename']
+            sizes = ", ".join(f"{k} {v / 1024:.0f}KB" for k, v in stored['sizes'].items())
+            logger.info(f"报告已入库 {stored['digest'][:12]}{' (内容重复，复用已有报告)' if stored['deduplicated'] else ''}: {sizes}")
+
+        usage = {k: client.usage[k] - usage_before.get(k, 0) for k in client.usage}
+        if usage['requests']:
+            cached_ratio = usage['cached_tokens'] / max(usage['prompt_tokens'], 1)
+            logger.info(
+                f"Token 用量: 请求 {usage['requests']} 次, 输入 {usage['prompt_tokens']} "
+                f"(缓存命中 {usage['cached_tokens']}, {cached_ratio:.0%}), 输出 {usage['completion_tokens']}"
+            )
+            if usage['failovers'] or usage['hedges']:
+                logger.info(f"端点故障转移 {usage['failovers']} 次, 对冲请求 {usage['hedges']} 次 (对冲胜出 {usage['hedge_wins']} 次)")
+            logger.info(
+                f"预算对比: 估算 {budget['estimate']['total_tokens']} tokens, "
+                f"实际 {usage['prompt_tokens'] + usage['completion_tokens']} tokens"
+            )
+
+        # 5. Save History
+        if self.history_manager:
+            self.history_manager.add_record(
+                chat_name=chat_name,
+                messages_count=stats['total_messages'],
+                report_path=report_path
+            )
+
+        if working_set is not None:
+            working_set.close(remove=True)
+        logger.info("各阶段峰值内存 (MB): " + ", ".join(f"{k} {v}" for k, v in peak_rss.items() if v is not None))
+
+        timings['total'] = round(sum(timings.values()), 3)
+        return {
+            'report_path': report_path,
+            'report_filename': report_filename,
+            'chat_name': stats.get('chat_name', chat_name),
+            'total_messages': stats.get('total_messages', 0),
+            'timings': timings,
+            'peak_rss_mb': peak_rss,
+            'usage': usage,
+            'budget': budget
+        }
@@ -0,0 +1,109 @@
+# src/planner.py
+
+"""
+Split Planner Module
+====================
+负责 Map 阶段的分块规划：根据估算的总 Token 数、Map 模型上下文、目标覆盖率与最大调用数，
+决定分块数量，并按 Token 量均分、把边界对齐到会话间隙。
+遵循 Phase 5 编程规范。
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+from src.registry import *
+from src.sessions import SessionIndex
+
+# smart_sample 中每条消息的格式: "[YYYY-MM-DD HH:MM] 名称: 内容[:100]" + 换行
+_LINE_OVERHEAD_CHARS = 21
+_CONTENT_CHARS_LIMIT = 100
+
+
+def estimate_message_tokens(df: pd.DataFrame) -> np.ndarray:
+    """按 smart_sample 的行格式向量化估算每条消息的 Token 数 (行顺序与 df 一致)。"""
+    if df.empty:
+        return np.zeros(0)
+    content = df[COL_CONTENT].astype(str).str.len().clip(upper=_CONTENT_CHARS_LIMIT).to_numpy()
+    names = df[COL_USER_NAME].astype(str).str.len().to_numpy() if COL_USER_NAME in df.columns else 7
+    return (content + names + _LINE_OVERHEAD_CHARS) / TOKENS_PER_CHAR_ESTIMATE
+
+
+def plan_split_count(total_tokens: float, split_budget: int, coverage: float = SPLIT_TARGET_COVERAGE,
+                     max_splits: int = SPLIT_MAX_CALLS, min_split_tokens: int = SPLIT_MIN_TOKENS) -> Dict[str, Any]:
+    """
+    决定分块数量。
+
+    Args:
+        total_tokens: 全部消息的估算 Token 数
+        split_budget: 单个 Map 请求可容纳的聊天记录 Token 数
+        coverage: 目标覆盖率 (发送给 LLM 的 Token / 全部 Token)
+        max_splits: 最大分块数 (即 Map 调用数上限)
+        min_split_tokens: 单个分块的最小 Token 数，避免数据很少时发出多个几乎为空的请求
+
+    Returns:
+        Dict: n_splits / split_budget / total_tokens / predicted_coverage / reason
+    """
+    # 意义: 分块数量决策
+    # 作用: 需要的分块数 = 目标覆盖的 Token / 单块预算，再受最大调用数与最小分块大小约束
+    # 关联: 被 plan_splits 调用，结果写入任务日志
+    split_budget = max(1, int(split_budget))
+    wanted = max(1, math.ceil(total_tokens * coverage / split_budget))
+    by_size = max(1, math.ceil(total_tokens / max(1, min_split_tokens)))
+    n_splits = min(wanted, max(1, max_splits), by_size)
+
+    if n_splits == wanted:
+        reason = "满足目标覆盖率"
+    elif n_splits == by_size:
+        reason = "数据量较小，合并为更少的分块"
+    else:
+        reason = "受最大调用数限制，分块内将采样"
+    predicted = min(1.0, n_splits * split_budget / total_tokens) if total_tokens else 1.0
+    return {
+        'n_splits': int(n_splits),
+        'split_budget': split_budget,
+        'total_tokens': int(total_tokens),
+        'target_coverage': coverage,
+        'predicted_coverage': round(predicted, 4),
+        'reason': reason
+    }
+
+
+def predicted_coverage(split_tokens: List[int], split_budget: int) -> float:
+    """按各分块的估算 Token 数计算预计覆盖率：每块最多发送 split_budget，超出部分被采样掉。"""
+    total = sum(split_tokens)
+    if not total:
+        return 1.0
+    return round(min(1.0, sum(min(t, split_budget) for t in split_tokens) / total), 4)
+
+
+def split_boundaries(tokens: np.ndarray, n_splits: int, index: Optional[SessionIndex] = None) -> List[int]:
+    """
+    按 Token 量均分 (时间排序后的) 消息，返回 n_splits + 1 个边界位置；
+    提供会话索引时边界对齐到最近的会话起点。
+    """
+    total = len(tokens)
+    if n_splits <= 1 or total == 0:
+        return [0, total]
+    cumulative = np.cumsum(tokens)
+    targets = cumulative[-1] * np.arange(1, n_splits) / n_splits
+    cuts = np.searchsorted(cumulative, targets, side='right')
+    if index is not None:
+        cuts = [index.nearest_boundary(int(c)) for c in cuts]
+    bounds = np.maximum.accumulate([0, *cuts, total])
+    return [int(b) for b in bounds]
+
+
+def plan_splits(tokens: np.ndarray, split_budget: int, coverage: float = SPLIT_TARGET_COVERAGE,
+                max_splits: int = SPLIT_MAX_CALLS, index: Optional[SessionIndex] = None) -> Dict[str, Any]:
+    """
+    规划分块：返回 plan_split_count 的结果，并附带 boundaries 与每块的估算 Token 数。
+
+    Args:
+        tokens: 时间排序后每条消息的估算 Token 数 (estimate_message_tokens)
+        index: 同一顺序上的会话索引，提供时分块边界对齐到会话起点
+    """
+    plan = plan_split_count(float(tokens.sum()), split_budget, coverage, max_splits)
+    plan['boundaries'] = split_boundaries(tokens, plan['n_splits'], index)
+    plan['split_tokens'] = [int(tokens[a:b].sum()) for a, b in zip(plan['boundaries'][:-1], plan['boundaries'][1:])]
+    return plan
@@ -0,0 +1,110 @@
+# src/prompt_builder.py
+
+"""
+Prompt Builder Module
+=====================
+负责 Map 阶段 Prompt 的组装，避免聊天记录在内存中出现多份完整副本：
+- ChatLines: 按列向量化地生成 "[YYYY-MM-DD HH:MM] 名称: 内容" 采样行，
+  先只计算每行长度用于预算与采样，最终只格式化入选的行 (不再逐行 df.apply)
+- PromptBuilder: 按引用收集模板、标题与聊天记录各行，build() 时一次 join 生成最终请求文本
+遵循 Phase 5 编程规范。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional
+from src.registry import *
+
+# "[" + 时间戳 + "] " + 名称 + ": " + 内容 + 换行
+_LINE_PUNCTUATION_CHARS = 6
+
+
+class ChatLines:
+    """
+    一个分块的采样行，按列保存 (时间戳 / 名称 / 截断后的内容) 与每行字符数。
+
+    Attributes:
+        lengths: (n,) 每行格式化后的字符数 (含换行)，与 df 行顺序一致
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        # 意义: 向量化预处理
+        # 作用: 三列各做一次 astype(str) / 切片，行长度由列长度相加得到，无需先拼出每一行
+        # 关联: 被 pipeline.smart_sample 使用；格式与 planner.estimate_message_tokens 的估算一致
+        self.stamps = df[COL_DATETIME].astype(str).str[:SAMPLE_STAMP_CHARS]
+        if COL_USER_NAME in df.columns:
+            self.names = df[COL_USER_NAME].astype(str)
+        else:
+            self.names = pd.Series(SAMPLE_UNKNOWN_USER, index=df.index, dtype=object)
+        self.contents = df[COL_CONTENT].astype(str).str[:SAMPLE_CONTENT_CHARS]
+        self.lengths = np.asarray(
+            self.stamps.str.len() + self.names.str.len() + self.contents.str.len() + _LINE_PUNCTUATION_CHARS,
+            dtype=np.int64
+        )
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def format(self, rows: Optional[np.ndarray] = None) -> List[str]:
+        """格式化 rows (行位置，按给定顺序) 对应的行；rows 为空时格式化全部行。"""
+        stamps, names, contents = self.stamps, self.names, self.contents
+        if rows is not None:
+            stamps, names, contents = stamps.iloc[rows], names.iloc[rows], contents.iloc[rows]
+        return ("[" + stamps + "] " + names + ": " + contents).tolist()
+
+    def fit(self, rows: Optional[np.ndarray], max_chars: int, required: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        返回 rows 中字符数合计不超过 max_chars 的部分 (保持顺序)。
+
+        Args:
+            required: 可选的布尔掩码 (df 行顺序)，超出预算时先从末尾去掉非必选行，仍超出时再截去末尾
+        """
+        # 意义: 逐行预算检查
+        # 作用: 累加与截断在长度向量上完成，超出预算的行不会被格式化
+        # 关联: smart_sample 在格式化之前调用，作为采样结果的最终上限；required 为事件窗口的行
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        excess = int(self.lengths[rows].sum()) - max_chars
+        if excess <= 0:
+            return rows
+        if required is not None:
+            optional = np.flatnonzero(~required[rows])[::-1]
+            drop = int(np.searchsorted(np.cumsum(self.lengths[rows[optional]]), excess, side='left')) + 1
+            keep = np.ones(len(rows), dtype=bool)
+            keep[optional[:drop]] = False
+            rows = rows[keep]
+        cumulative = np.cumsum(self.lengths[rows])
+        return rows[:int(np.searchsorted(cumulative, max_chars, side='right'))]
+
+
+class PromptBuilder:
+    """
+    按引用收集 Prompt 片段，build() 时一次 join。聊天记录各行只在最终结果中出现一次。
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self.chars = 0
+
+    def add(self, *texts: str) -> 'PromptBuilder':
+        """追加固定片段 (模板、标题等)。"""
+        for text in texts:
+            if text:
+                self._parts.append(text)
+                self.chars += len(text)
+        return self
+
+    def add_lines(self, lines: Iterable[str], sep: str = "\n") -> int:
+        """逐行追加 (以 sep 分隔)，lines 可以是任意可迭代对象；返回追加的行数。"""
+        count = 0
+        for line in lines:
+            if count:
+                self._parts.append(sep)
+                self.chars += len(sep)
+            self._parts.append(line)
+            self.chars += len(line)
+            count += 1
+        return count
+
+    def build(self) -> str:
+        """生成最终 Prompt (唯一一次拼接)。"""
+        return "".join(self._parts)
@@ -8,7 +8,12 @@ Prompt Management Module (Phase 3)
 """
 
 from src.registry import *
+from src.graph import format_graph_facts
+from src.events import format_event_facts
+from src.prompt_builder import PromptBuilder
+from typing import Sequence, Union
 import json
+import hashlib
 
 class PromptManager:
     """
@@ -20,16 +25,51 @@ class PromptManager:
         # 作用: 占位，未来可加载外部模板文件
         pass
 
-    def build_map_prompt(self, quarter_name: str, chat_content: str, is_periodic: bool = False) -> str:
+    def get_static_prefix(self, stage: str, is_periodic: bool = False) -> str:
+        """
+        获取某阶段 Prompt 的静态前缀 (不含任何本次任务的变量)。
+        """
+        # 意义: 前缀缓存友好布局
+        # 作用: 静态指令块在所有请求间逐字节一致，可命中服务商的 Prompt 前缀缓存
+        # 关联: build_map_prompt / build_reduce_prompt 总是以此为开头
+        if stage == "map":
+            return PROMPT_MAP_PERIODIC if is_periodic else PROMPT_MAP_QUARTERLY
+        return PROMPT_REDUCE_PERIODIC if is_periodic else PROMPT_REDUCE_ANNUAL
+
+    def prefix_hash(self, system_prompt: str, stage: str, is_periodic: bool = False) -> str:
+        """计算 (System Prompt + 静态前缀) 的哈希，用于在日志中核对前缀是否稳定。"""
+        prefix = system_prompt + "\n" + self.get_static_prefix(stage, is_periodic)
+        return hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:12]
+
+    def build_map_prompt(self, quarter_name: str, chat_content: Union[str, Sequence[str]], is_periodic: bool = False,
+                         interactions: dict = None, events: list = None) -> str:
         """
         构建 Map 阶段 (季度/阶段分析) 的 Prompt。
+
+        Args:
+            chat_content: 聊天记录文本，或采样行列表 (pipeline.smart_sample 的结果，直接按行拼入)
+            interactions: 本片段的关系事实 (src.graph.summarize_graph 的结果)，为空时不附加
+            events: 本片段的异常时刻 (src.events.detect_events 的结果)，其窗口已保留在聊天记录中，为空时不附加
         """
         # 意义: 构造单季度分析指令
-        # 作用: 填充模板，注入压缩后的聊天记录
+        # 作用: 静态指令在前，分段名称、预先计算的互动关系、异常时刻与压缩后的聊天记录在后；
+        #       各片段与每行聊天记录由 PromptBuilder 一次拼接，不生成中间的聊天记录全文
         # 关联: 被 Generator 调用，用于获取中间态 JSON
-        
-        template = PROMPT_MAP_PERIODIC if is_periodic else PROMPT_MAP_QUARTERLY
-        return template.format(quarter=quarter_name) + "\n\n聊天记录片段:\n" + chat_content
+        facts = format_graph_facts(interactions)
+        moments = format_event_facts(events, excerpts=False)
+        builder = PromptBuilder().add(
+            self.get_static_prefix("map", is_periodic),
+            f"\n\n---\n分析片段: {quarter_name}",
+            f"\n\n互动关系数据 (由全部消息中的 @ 与接话统计得出):\n{facts}" if facts else "",
+            f"\n\n异常时刻 (由消息速率、撤回、图片与复读统计检测，对应的聊天记录已优先保留，可作为社死 / 搞笑时刻的线索):\n{moments}"
+            if moments else "",
+            "\n\n聊天记录片段:\n"
+        )
+        if isinstance(chat_content, str):
+            builder.add(chat_content)
+        else:
+            builder.add_lines(chat_content)
+        return builder.build()
 
     def build_reduce_prompt(self, quarterly_results: list, global_stats: dict, anime_theme: str = "default", custom_theme_prompt: str = "", is_periodic: bool = False) -> str:
         """
@@ -43,7 +83,7 @@ class PromptManager:
             is_periodic: 是否为非完整年度/阶段性报告
         """
         # 意义: 构造年度汇总指令
-        # 作用: 聚合所有季度的分析结果和全局统计数据
+        # 作用: 静态指令在前，年份、小剧场主题、统计数据与季度结果依次附在末尾
         # 关联: 被 Generator 调用，用于生成最终 HTML 内容
         
         # 序列化中间态数据
@@ -51,6 +91,9 @@ class PromptManager:
         
         # 格式化统计数据 (包含硬核榜单)
         hardcore = global_stats.get('hardcore', {})
+        temporal = global_stats.get('temporal', {})
+        owls = [f"{u['user_name']}({u['score']:.0%}, 全群{u['lift']}倍)" for u in temporal.get('night_owls', [])]
+        birds = [f"{u['user_name']}({u['score']:.0%}, 全群{u['lift']}倍)" for u in temporal.get('early_birds', [])]
         stats_str = f"""
         - 消息总数: {global_stats.get('total_messages', 0)}
         - 活跃用户数: {global_stats.get('active_users_count', 0)}
@@ -60,18 +103,29 @@ class PromptManager:
         - 熬夜冠军 (Top 3): {hardcore.get('night_owls', [])}
         - 早起冠军 (Top 3): {hardcore.get('early_birds', [])}
         - 最长连续发言: {hardcore.get('longest_streak', {})}
+        - 最热时段: {temporal.get('peak_slot', '未知')}，最活跃的一天: {temporal.get('busiest_weekday', '未知')}，最冷清的小时: {temporal.get('quietest_hour', '未知')} 点
+        - 夜猫子指数 (夜间消息占本人消息比例，全群 {temporal.get('night_share', 0):.0%}): {owls}
+        - 早起鸟指数 (清晨消息占本人消息比例，全群 {temporal.get('early_share', 0):.0%}): {birds}
         """
-        
-        template = PROMPT_REDUCE_PERIODIC if is_periodic else PROMPT_REDUCE_ANNUAL
+        for s in global_stats.get('hot_sessions', []):
+            stats_str += (f"- 高能对话: {s['start']} ~ {s['end']}，{s['participants']} 人 {s['messages']} 条，"
+                          f"每分钟 {s['intensity']} 条\n")
+        facts = format_graph_facts(global_stats.get('interactions'))
+        if facts:
+            stats_str += f"- 全年互动关系 (由 @ 与接话统计得出):\n{facts}\n"
+        moments = format_event_facts(global_stats.get('events'))
+        if moments:
+            stats_str += f"- 异常时刻 (由消息速率、撤回、图片与复读统计检测，按显著程度排序，附摘录):\n{moments}\n"
         
         # 处理小剧场主题指令
         anime_instruction = self._get_anime_instruction(anime_theme, custom_theme_prompt)
         
-        return template.format(
-            quarterly_data=q_data_str,
-            stats_data=stats_str,
-            year=global_stats.get('year', 'Unknown'),
-            anime_instruction=anime_instruction
+        return (
+            self.get_static_prefix("reduce", is_periodic)
+            + f"\n\n---\n报告年份: {global_stats.get('year', 'Unknown')}"
+            + f"\n\n小剧场主题:\n{anime_instruction}"
+            + f"\n\n全局统计数据:\n{stats_str}"
+            + f"\n\n输入数据:\n{q_data_str}"
         )
 
     def _get_anime_instruction(self, theme: str, custom_prompt: str) -> str:
@@ -0,0 +1,84 @@
+# src/ratelimit.py
+
+"""
+Rate Limiter Module
+===================
+负责限制发往 LLM 服务商的并发请求数与每分钟请求数，可在多个任务间共享。
+遵循 Phase 5 编程规范。
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    并发 + 滑动窗口 (每分钟) 双重限流器，以上下文管理器形式使用 (with / async with)。
+
+    同一实例可同时被线程与事件循环使用；异步获取时轮询等待，不阻塞事件循环。
+    """
+
+    def __init__(self, max_concurrent: int = 4, requests_per_minute: Optional[int] = None):
+        # 意义: 初始化限流器
+        # 作用: max_concurrent 限制同时在途的请求数；requests_per_minute 为空时不限速率
+        # 关联: 注入 LLMClient，批处理模式下所有任务共享同一个实例
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._recent = deque()
+
+    def acquire(self) -> None:
+        """获取一个请求名额，必要时阻塞等待。"""
+        self._semaphore.acquire()
+        while True:
+            wait = self._reserve()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """acquire 的异步版本。"""
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        while True:
+            wait = self._reserve()
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+
+    def _reserve(self) -> Optional[float]:
+        """在滑动窗口中占用一个名额；窗口已满时返回需等待的秒数。"""
+        if not self.requests_per_minute:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if len(self._recent) < self.requests_per_minute:
+                self._recent.append(now)
+                return None
+            return max(60 - (now - self._recent[0]), 0.05)
+
+    def release(self) -> None:
+        """归还请求名额。"""
+        self._semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -11,6 +11,8 @@ Registry Module
 # 作用: 提供统一的配置管理，方便后续修改和维护。
 # 关联: 被 src/parser.py, src/analyzer.py, src/llm_client.py 等模块引用。
 
+import re
+
 # --- JSON 字段映射 (Field Mapping) ---
 JSON_FIELD_MESSAGES = "messages"
 JSON_FIELD_TIMESTAMP = "timestamp"
@@ -38,10 +40,118 @@ DEFAULT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 UNKNOWN_USER_NAME = "Unknown"
 UNKNOWN_GROUP_NAME = "Unknown Group"
 
+# --- 多文件导入 (Multi-file Ingestion) ---
+INGEST_EXTENSIONS = {'.json', '.zip'}
+INGEST_MAX_WORKERS = 4 # 并行解析的最大进程数
+INGEST_MAX_ZIP_BYTES = 2 * 1024 * 1024 * 1024 # 压缩包内 JSON 成员解压后的总大小上限 2GB (防止解压炸弹)
+
+# --- 批处理 (Batch / CLI) ---
+PARSE_CACHE_MAX_ENTRIES = 8 # 解析缓存最多保留的数据集个数
+BATCH_MANIFEST_NAME = "manifest.json"
+
+# --- 流式上传 (Streaming Upload) ---
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # 每次读取 1MB
+UPLOAD_MAX_DECOMPRESSED_BYTES = 2 * 1024 * 1024 * 1024 # 解压后上限 2GB
+UPLOAD_ZSTD_FEED_SIZE = 4096 # zstd 每次喂入的压缩数据量，限制单次解压展开的内存 (zstd 最大压缩比约 3 万倍)
+UPLOAD_COMPRESSED_SUFFIXES = ('.gz', '.zst')
+UPLOAD_TTL_SECONDS = 3600 # 上传完成后超过该时长仍未被任务认领的文件与记录会被清理 (秒)
+
+# --- 任务状态与工作进程 (Task Store / Workers) ---
+TASK_BACKEND_MEMORY = "memory" # 进程内字典，仅适用于单进程部署
+TASK_BACKEND_SQLITE = "sqlite" # SQLite 文件，可跨进程共享，并作为持久化任务队列
+TASK_STORE_PATH = "tasks.db"
+WORKER_POLL_INTERVAL = 1.0 # 队列为空时的轮询间隔 (秒)
+WORKER_HEARTBEAT_INTERVAL = 10.0 # 执行中任务的心跳间隔 (秒)
+WORKER_STALE_SECONDS = 120.0 # 心跳超过该时间未更新的任务视为工作进程已退出，重新入队
+WORKER_MAX_ATTEMPTS = 2 # 单个任务的最大执行次数 (含崩溃后重试)
+TASK_RUNNER_THREAD = "thread" # 每个任务一个线程，同步调用 LLM (默认)
+TASK_RUNNER_ASYNC = "async" # 所有任务共享一个事件循环，LLM 请求异步等待，CPU 阶段在线程池中执行
+ASYNC_CPU_WORKERS = 4 # 异步执行模式下 CPU 阶段线程池的大小上限 (不超过 CPU 核数)
+
+# --- 任务取消 (Cancellation) ---
+CANCEL_POLL_INTERVAL = 0.1 # 取消信号 / 阻塞调用的检查间隔 (秒)
+CANCEL_STORE_POLL_INTERVAL = 0.5 # 从任务存储读取取消请求的间隔 (秒)
+CANCEL_CHECK_EVERY = 5000 # 逐行循环中每处理多少行检查一次取消
+CANCEL_REASON_USER = "用户取消"
+CANCEL_REASON_DEADLINE = "超过任务时限"
+
+# --- 报告渲染 (Renderer) ---
+RENDER_AUTO_RELOAD_ENV = "TEMPLATE_AUTO_RELOAD" # 设为 1 时模板修改后自动重新加载 (开发用)
+RENDER_BYTECODE_CACHE_PATTERN = "qqchat_report_%s.cache" # Jinja2 字节码缓存文件名 (位于系统临时目录)
+RENDER_STREAM_BUFFER = 16 # 流式渲染时每次合并写出的模板片段数
+
+# --- 时间矩阵 (Temporal Matrices) ---
+NIGHT_HOURS = (0, 5) # 守夜人时段 [起, 止)
+EARLY_HOURS = (5, 8) # 早起鸟时段 [起, 止)
+WEEKDAY_NAMES = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+TEMPORAL_SCORE_PRIOR_WEIGHT = 20 # 夜猫子 / 早起鸟得分的平滑强度 (相当于按全群占比补的虚拟消息数)
+TEMPORAL_MIN_MESSAGES = 20 # 参与作息得分排名的最少消息数
+
+# --- 互动关系图 (Interaction Graph) ---
+GRAPH_REPLY_WINDOW_SECONDS = 120 # 相邻两条消息换人且间隔不超过该秒数，视为“接话”
+GRAPH_MENTION_WEIGHT = 3.0 # 一次 @ 的权重 (明确指向，强于接话)
+GRAPH_REPLY_WEIGHT = 1.0 # 一次接话的权重
+GRAPH_TOP_EDGES = 8 # 注入 Prompt 的最强关系对数量
+GRAPH_ONE_SIDED_MIN_WEIGHT = 10 # 单向关注的最小正向权重
+GRAPH_ONE_SIDED_RATIO = 4 # 单向关注：正向权重至少为反向的倍数
+GRAPH_LPA_MAX_ITER = 20 # 标签传播最大轮数
+GRAPH_MAX_COMMUNITIES = 5 # 注入 Prompt 的社群数量
+GRAPH_COMMUNITY_MEMBERS = 5 # 每个社群列出的核心成员数
+
+# --- 会话切分 (Session Index) ---
+SESSION_GAP_SECONDS = 600 # 相邻消息间隔超过该秒数即视为新的一段对话
+SESSION_MIN_MESSAGES = 5 # 参与热门会话排名的最少消息数
+SESSION_HOT_BUDGET_RATIO = 0.7 # 采样时分配给热门完整对话的字符预算比例，其余用于均匀背景
+SESSION_TOP_N = 5 # 注入 Reduce 统计的热门会话数量
+
+# --- 异常时刻检测 (Event Detector) ---
+EVENT_BURST = "burst" # 消息速率激增
+EVENT_RECALL = "recall" # 集中撤回
+EVENT_IMAGE = "image" # 图片刷屏
+EVENT_CHAIN = "chain" # 复读接龙 (不同用户连续发送相同内容)
+EVENT_KIND_LABELS = {EVENT_BURST: "消息激增", EVENT_RECALL: "集中撤回", EVENT_IMAGE: "图片刷屏", EVENT_CHAIN: "复读接龙"}
+EVENT_BASELINE_MINUTES = 1440 # 滚动 z 分数的基线窗口 (当前分钟之前的分钟数，含无消息的分钟)
+EVENT_Z_THRESHOLD = 4.0 # 任一信号的 z 分数达到该值即视为异常分钟
+EVENT_MIN_STD = 1.0 # 基线标准差下限，避免长期沉默后的零星消息被判为异常
+EVENT_MIN_COUNTS = {EVENT_BURST: 8, EVENT_RECALL: 2, EVENT_IMAGE: 3, EVENT_CHAIN: 3} # 异常分钟各信号的最小计数
+EVENT_MERGE_GAP_MINUTES = 5 # 间隔不超过该分钟数的异常分钟合并为同一事件窗口
+EVENT_PAD_MINUTES = 2 # 事件窗口前后各扩展的分钟数 (保留起因与后续)
+EVENT_WINDOW_MAX_LINES = 60 # 单个事件窗口保留的最多消息数 (以峰值分钟为中心截取)
+EVENT_TOP_N = 8 # 输出的事件数量 (按得分排序)
+EVENT_EXCERPT_LINES = 4 # 每个事件附带的摘录行数
+EVENT_SAMPLE_BUDGET_RATIO = 0.3 # Map 采样中事件窗口可占用的字符预算比例
+
+# --- 分块规划 (Split Planner) ---
+SPLIT_TARGET_COVERAGE = 1.0 # 目标覆盖率：发送给 Map 的 Token 占全部聊天记录 Token 的比例
+SPLIT_MAX_CALLS = 12 # 最大分块数 (Map 调用数上限)，可由 config.max_map_calls 覆盖
+SPLIT_MIN_TOKENS = 4000 # 单个分块的最小 Token 数，数据很少时合并为更少的分块
+SPLIT_CONTEXT_FILL = 0.75 # 聊天记录占 Map 模型上下文 (config.max_tokens) 的比例，其余留给指令与输出
+
+# --- 活跃度时间序列 (Report Charts) ---
+TS_UNIT_DAY = "day"
+TS_UNIT_WEEK = "week"
+TS_UNIT_MONTH = "month"
+TS_MAX_POINTS = 365 # 单条序列内嵌的最大点数，超出时 LTTB 降采样
+TS_DAILY_MAX_BUCKETS = 400 # 跨度不超过该天数时默认按日展示
+TS_WEEKLY_MAX_BUCKETS = 260 # 跨度不超过该周数时默认按周展示，否则按月
+
+# --- 报告存储 (Report Store) ---
+REPORT_STORE_DIR = "reports" # 输出目录下的内容寻址存储子目录
+REPORT_GZIP_LEVEL = 9
+REPORT_BROTLI_QUALITY = 11
+REPORT_STORE_CHUNK_SIZE = 1024 * 1024 # 入库时按块哈希 / 压缩，报告不会整体读入内存
+REPORT_CACHE_MAX_AGE = 31536000 # 内容寻址的报告永不变化，可长期缓存 (秒)
+STATS_PREVIEW_PATTERN = "stats_{task_id}.json" # 统计阶段完成后写入输出目录的预览数据，供 /api/tasks/<id>/stats 读取
+PREVIEW_PENDING_HTML = '<p style="color: #999;">AI 分析生成中，完成后将在完整报告中呈现…</p>' # 预览报告中 AI 段落的占位
+
 # --- Phase 3: Prompt Templates ---
+# 注意: Map / Reduce 模板不包含任何占位符，作为逐字节一致的静态前缀以命中服务商的 Prompt 缓存；
+#       本次任务的变量内容 (分段名称、统计数据等) 由 PromptManager 追加在末尾。
+SYSTEM_PROMPT_JSON = "你是一个 JSON 生成器。请仅返回合法的 JSON 数据，不要包含 markdown 代码块标记。"
+
 # Map 阶段：季度分析
 PROMPT_MAP_QUARTERLY = """
-你是一位冷静但透着冷幽默的资深群聊观察员，同时也是一位资深的 ACGN（动画、漫画、游戏、小说）爱好者。请分析以下群聊记录片段（{quarter}），并提取关键信息。
+你是一位冷静但透着冷幽默的资深群聊观察员，同时也是一位资深的 ACGN（动画、漫画、游戏、小说）爱好者。请分析本提示末尾给出的群聊记录片段（片段的时间段标注在“分析片段”一行），并提取关键信息。
 这是一个 Map-Reduce 任务的中间步骤，你的输出将被用于生成年度总结。
 
 **风格要求**：
@@ -59,7 +169,7 @@ PROMPT_MAP_QUARTERLY = """
 7. "memes_died": (list) 本季度消失或过气的梗。
 8. "mvp": (str) 本季度的 MVP 用户。50-100字详细论述“丰功伟绩”。
 9. "characters": (dict) 活跃用户行为特征。key为用户名，value为人物画像（50字左右），描述说话风格和担当。
-10. "relations": (list) 发现的用户间羁绊关系（如“CP感”、“宿敌”等）。
+10. "relations": (list) 发现的用户间羁绊关系（如“CP感”、“宿敌”等）。若提供了“互动关系数据”，请以其为准进行解读，不要凭空编造。
 
 注意：
 - 必须详细挖掘，拒绝流水账。
@@ -69,7 +179,7 @@ PROMPT_MAP_QUARTERLY = """
 
 # Map 阶段：阶段分析 (非完整年度/动态切分)
 PROMPT_MAP_PERIODIC = """
-你是一位冷静但透着冷幽默的资深群聊观察员，同时也是一位资深的 ACGN（动画、漫画、游戏、小说）爱好者。请分析以下群聊记录片段（{quarter}），并提取关键信息。
+你是一位冷静但透着冷幽默的资深群聊观察员，同时也是一位资深的 ACGN（动画、漫画、游戏、小说）爱好者。请分析本提示末尾给出的群聊记录片段（片段的时间段标注在“分析片段”一行），并提取关键信息。
 这是一个 Map-Reduce 任务的中间步骤，你的输出将被用于生成整体分析报告。
 
 **风格要求**：
@@ -87,7 +197,7 @@ PROMPT_MAP_PERIODIC = """
 7. "memes_died": (list) 本阶段消失或过气的梗。
 8. "mvp": (str) 本阶段的 MVP 用户。50-100字详细论述“丰功伟绩”。
 9. "characters": (dict) 活跃用户行为特征。
-10. "relations": (list) 发现的用户间羁绊关系。
+10. "relations": (list) 发现的用户间羁绊关系。若提供了“互动关系数据”，请以其为准进行解读。
 
 注意：
 - 必须详细挖掘，拒绝流水账。
@@ -95,13 +205,7 @@ PROMPT_MAP_PERIODIC = """
 
 # Reduce 阶段：年度汇总
 PROMPT_REDUCE_ANNUAL = """
-你是一位既幽默又深刻的群聊观察员，擅长通过数据洞察群聊的灵魂，且深谙 ACGN 文化。基于以下4个季度的分析摘要，生成一份年度群聊报告。
-
-输入数据：
-{quarterly_data}
-
-全局统计数据：
-{stats_data}
+你是一位既幽默又深刻的群聊观察员，擅长通过数据洞察群聊的灵魂，且深谙 ACGN 文化。基于本提示末尾给出的4个季度的分析摘要与全局统计数据，生成一份年度群聊报告。
 
 **任务要求**：
 1. **风格自适应**：请先分析该群聊的整体氛围，并据此决定报告的**视觉配色方案**和**文案风格**。
@@ -139,14 +243,14 @@ PROMPT_REDUCE_ANNUAL = """
    - 颁发奖项（如“最佳捧哏”、“节奏大师”、“年度潜水员”等），附颁奖词。
 
 8. "anime_theater": (str) <h3>全年度动漫IP小剧场</h3> 
-   {anime_instruction}
+   - 主题要求见本提示末尾的“小剧场主题”部分。
    - 编写一段全年度的小剧场脚本。
 
 9. "moments": (str) <h3>社死/搞笑时刻回顾</h3> 
    - 挖掘尴尬或爆笑瞬间。
 
 10. "essay": (str) <h3>年度总结小作文</h3> 
-   - 基于 {year} 年的经历，写一篇感性或深刻的小作文（非打油诗）。
+   - 基于报告年份（见本提示末尾的“报告年份”）这一年的经历，写一篇感性或深刻的小作文（非打油诗）。
 
 风格要求：
 - 语言犀利但不失温情，充满网络梗和 ACGN 梗。
@@ -156,13 +260,7 @@ PROMPT_REDUCE_ANNUAL = """
 
 # Reduce 阶段：通用/阶段性汇总
 PROMPT_REDUCE_PERIODIC = """
-你是一位既幽默又深刻的群聊观察员，擅长通过数据洞察群聊的灵魂，且深谙 ACGN 文化。基于以下分段分析摘要，生成一份深度群聊分析报告。
-
-输入数据：
-{quarterly_data}
-
-全局统计数据：
-{stats_data}
+你是一位既幽默又深刻的群聊观察员，擅长通过数据洞察群聊的灵魂，且深谙 ACGN 文化。基于本提示末尾给出的分段分析摘要与全局统计数据，生成一份深度群聊分析报告。
 
 **任务要求**：
 1. **风格自适应**：请先分析该群聊的整体氛围，并据此决定报告的**视觉配色方案**和**文案风格**。
@@ -199,7 +297,7 @@ PROMPT_REDUCE_PERIODIC = """
    - 颁发趣味奖项（如“最佳捧哏”、“节奏大师”等），附颁奖词。
 
 8. "anime_theater": (str) <h3>动漫IP小剧场</h3> 
-   {anime_instruction}
+   - 主题要求见本提示末尾的“小剧场主题”部分。
    - **必须生成**：请务必编写一段小剧场脚本，不要留空。
    - 格式：使用 HTML 标签进行排版。
 
@@ -222,6 +320,64 @@ PROMPT_REFINE_HTML = """
 请直接返回修复和优化后的完整 HTML 代码，不要包含 ```html 标记，也不要包含其他解释性文字。
 """
 
+# 额外功能：分段 HTML 优化 (仅发送主题 CSS 与各 AI 段落)
+PROMPT_REFINE_CSS = """
+下面是一份群聊年度报告的主题 CSS。请修复其中可能存在的语法错误，并发挥你的自由想象力对样式进行优化，使之更符合报告主题，效果越炫酷越好。
+要求：保留所有已有的选择器与 CSS 变量名 (如 --primary-color)，不要删除任何规则。
+请直接返回优化后的 CSS 代码，不要包含 <style> 标签、```css 标记或其他解释性文字。
+"""
+
+PROMPT_REFINE_SECTION = """
+下面是一份群聊年度报告中由 AI 生成的一个 HTML 片段（{section}）。请检查并修复其中可能存在的格式错误（未闭合标签、错误嵌套等），可适当优化排版结构，但不要改变文字内容。
+请直接返回修复后的 HTML 片段，不要包含 <html>/<body> 等外层标签、```html 标记或其他解释性文字。
+"""
+
+REFINE_MODE_FULL = "full" # 整份文档一次性发送
+REFINE_MODE_SECTIONS = "sections" # 分段并发发送
+REFINE_MAX_WORKERS = 4
+REFINE_MIN_LENGTH_RATIO = 0.5 # 优化结果长度不得低于原段落的比例
+# 模板中的分段标记 (见 templates/report.html)
+REFINE_CSS_PATTERN = re.compile(r"/\* theme-css \*/(.*?)/\* /theme-css \*/", re.S)
+REFINE_SECTION_PATTERN = re.compile(r"<!-- ai-section:(\w+) -->(.*?)<!-- /ai-section:\1 -->", re.S)
+
+# --- LLM JSON 输出 Schema (按阶段) ---
+MAP_JSON_SCHEMA = {
+    "summary": str,
+    "vibe": str,
+    "active_members": list,
+    "inactive_members": list,
+    "events": list,
+    "memes_born": list,
+    "memes_died": list,
+    "mvp": str,
+    "characters": dict,
+    "relations": list
+}
+
+REDUCE_JSON_SCHEMA = {
+    "style_config": dict,
+    "keywords": list,
+    "portrait": str,
+    "timeline": str,
+    "quarterly_review": str,
+    "roasts": str,
+    "awards": str,
+    "anime_theater": str,
+    "moments": str,
+    "essay": str
+}
+
+# 补请求：简短的续写请求 (不重发聊天记录)，附上模型之前的输出，仅要求返回缺失的字段
+PROMPT_JSON_MISSING_FIELDS = """
+以下是你之前输出的 JSON，其中部分字段缺失或格式错误：
+{previous}
+
+请根据上面已有的分析补全以下字段：{fields}。
+只返回一个仅包含这些字段的 JSON 对象，不要返回其他字段，也不要包含 markdown 代码块标记。
+"""
+JSON_FOLLOWUP_CONTEXT_CHARS = 6000 # 补请求中附带的上一次输出的最大字符数
+JSON_TYPE_NAMES = {str: "字符串", list: "数组", dict: "对象"}
+
 # --- 消息类型 (Message Types) ---
 MSG_TYPE_TEXT = "text"
 MSG_TYPE_IMAGE = "image"
@@ -237,11 +393,55 @@ DEFAULT_API_BASE = "https://api.openai.com/v1"
 DEFAULT_MODEL = "gpt-4o"
 DEFAULT_TEMPERATURE = 0.7
 
+# --- LLM 连接池 (Client Pool) ---
+CLIENT_POOL_MAX_CONNECTIONS = 20 # 每个 (base_url, key) 的最大连接数
+CLIENT_POOL_MAX_KEEPALIVE = 10 # 保持 keep-alive 的空闲连接数
+CLIENT_POOL_KEEPALIVE_EXPIRY = 120.0 # 空闲连接保活时间 (秒)
+CLIENT_POOL_IDLE_SECONDS = 900.0 # 客户端空闲超过该时间后被淘汰 (秒)
+CLIENT_POOL_HEALTH_INTERVAL = 300.0 # 空闲超过该时间的客户端在复用前做一次健康检查 (秒)
+CLIENT_POOL_HEALTH_TIMEOUT = 5.0
+CLIENT_POOL_MAX_FAILURES = 3 # 连续失败达到该次数后重建客户端
+
+# --- LLM 多端点故障转移 / 对冲请求 (Failover & Hedging) ---
+LLM_MAX_ATTEMPTS = 2 # 单次调用的最少尝试次数 (端点更多时每个可用端点至少尝试一次)
+LLM_REQUEST_TIMEOUT = 60.0 # 单个请求的超时 (秒)，且不超过任务截止时间
+LLM_RETRY_BACKOFF = 1.0 # 重试同一端点前的退避 (秒)
+LLM_HEDGE_QUANTILE = 0.95 # 请求耗时超过端点近期延迟的该分位数后，向下一个端点发起对冲请求
+LLM_HEDGE_MIN_SAMPLES = 10 # 端点该模型的延迟样本少于该值时不对冲
+LLM_HEDGE_MIN_DELAY = 2.0 # 对冲延迟下限 (秒)
+LLM_LATENCY_WINDOW = 200 # 每个端点每个模型保留的最近延迟样本数
+LLM_BREAKER_FAILURES = 3 # 连续失败达到该次数后熔断该端点
+LLM_BREAKER_COOLDOWN = 30.0 # 熔断冷却时间 (秒)，之后放行一个探测请求 (半开)
+LLM_HEALTH_ALPHA = 0.2 # 端点成功率 EWMA 的平滑系数
+
+# --- Map 模型级联 (Cascade) ---
+CASCADE_MIN_SPLITS = 3 # 分块数少于该值时级联没有收益，直接使用 model_map
+CASCADE_HOT_RATIO = 0.34 # 使用强模型重跑的分块比例 (向上取整，至少 1 块)
+CASCADE_SCREEN_SAMPLE_RATIO = 0.25 # 初筛采样预算占完整采样预算的比例
+
+# --- LLM 成本 / 延迟预算 (Budget Controller) ---
+BUDGET_MAP_OUTPUT_TOKENS = 1500 # 单个 Map 请求的预估输出 Token
+BUDGET_REDUCE_OUTPUT_TOKENS = 6000 # Reduce 请求的预估输出 Token (整份报告 JSON)
+BUDGET_REDUCE_STATS_TOKENS = 3000 # Reduce Prompt 中统计数据与小剧场指令的预估 Token
+BUDGET_MAP_FACTS_TOKENS = 400 # Map Prompt 中互动关系数据的预估 Token
+BUDGET_REFINE_CSS_TOKENS = 3000 # 分段增强时 CSS 块的预估 Token
+BUDGET_REFINE_TEMPLATE_TOKENS = 20000 # 整体增强时报告模板 (样式 + 图表脚本) 的预估 Token
+BUDGET_REQUEST_OVERHEAD_SECONDS = 1.5 # 每个请求的固定开销 (网络 + 排队 + 首 Token)
+BUDGET_INPUT_TOKENS_PER_SECOND = 3000.0 # 输入 (prefill) 处理速度的保守估计
+BUDGET_DEFAULT_OUTPUT_TPS = 40.0 # 尚无历史数据时的输出速度 (Token / 秒)
+BUDGET_THROUGHPUT_ALPHA = 0.2 # 输出速度 EWMA 的平滑系数
+BUDGET_MIN_SAMPLE_TOKENS = 4000 # 超出预算时单块采样的最小 Token 数
+BUDGET_SHRINK_FACTOR = 0.8 # 超出预算时单块采样预算的逐次缩减比例
+BUDGET_MODEL_PRICES = {} # 模型单价 {model: [输入, 输出]} (每百万 Token)，可被 config.model_prices 覆盖
+
 # --- Sampling Levels (Phase 2) ---
 LEVEL_1_LOSSLESS = "lossless"
 LEVEL_2_LIGHT = "light_compression"
 LEVEL_3_SMART = "smart_focus"
 LEVEL_4_EXTREME = "extreme_summary"
+SAMPLE_STAMP_CHARS = 16 # 采样行中时间戳保留的字符数 ("YYYY-MM-DD HH:MM")
+SAMPLE_CONTENT_CHARS = 100 # 采样行中单条消息内容保留的字符数
+SAMPLE_UNKNOWN_USER = "Unknown" # 缺少 user_name 列时采样行使用的名称
 
 # --- Token Limits (Phase 2 - Estimated) ---
 # Assuming ~1.5 chars per token for Chinese/Mixed text conservatively
@@ -261,3 +461,10 @@ COL_TYPE = "type"
 COL_IS_RECALLED = "is_recalled"
 COL_MENTIONS = "mentions"
 COL_IMAGE_COUNT = "image_count"
+
+# --- 列式工作集 (Out-of-core Working Set) ---
+OOC_AUTO_MIN_ROWS = 1_000_000 # out_of_core 为 "auto" 时，消息数达到该值即写入 Arrow 工作集
+OOC_BATCH_SIZE = 65536 # 工作集记录批大小 (按行区间读取时的最小单位)
+OOC_WORKING_SET_PATTERN = "working_{task_id}.arrow" # 位于输出目录下，任务结束后删除
+# Map 分块只需读取的列 (采样、会话切分、互动关系)
+OOC_SPLIT_COLUMNS = [COL_DATETIME, COL_USER_ID, COL_USER_NAME, COL_CONTENT, COL_TYPE, COL_MENTIONS]
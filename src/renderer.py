@@ -7,56 +7,170 @@ Report Renderer Module (Phase 4)
 遵循 Phase 5 编程规范。
 """
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 import os
+import json
+import uuid
+import threading
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from src.registry import *
+from src.timeseries import build_activity_series
+
+# 模块级模板环境缓存：(模板目录, auto_reload) -> Environment
+_environments: Dict[tuple, Environment] = {}
+_environments_lock = threading.Lock()
+
+
+def get_environment(template_dir: str = "templates", auto_reload: Optional[bool] = None) -> Environment:
+    """
+    获取进程内共享的 Jinja2 环境 (编译后的模板常驻内存，并落盘字节码缓存)。
+
+    auto_reload 为空时读取环境变量 TEMPLATE_AUTO_RELOAD，生产环境默认关闭，
+    模板不会在每次渲染时检查文件修改时间。
+    """
+    if auto_reload is None:
+        auto_reload = os.environ.get(RENDER_AUTO_RELOAD_ENV, "0").lower() in ("1", "true", "yes")
+    key = (os.path.abspath(template_dir), auto_reload)
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            env = Environment(
+                loader=FileSystemLoader(template_dir),
+                auto_reload=auto_reload,
+                bytecode_cache=FileSystemBytecodeCache(pattern=RENDER_BYTECODE_CACHE_PATTERN)
+            )
+            _environments[key] = env
+        return env
+
+
+def ranking_records(rankings: Optional[Dict[str, pd.DataFrame]]) -> Dict[str, list]:
+    """将 ChatAnalyzer.get_user_rankings 的 DataFrame 转为模板 / JSON 使用的记录列表。"""
+    return {key: df.to_dict('records') if not df.empty else [] for key, df in (rankings or {}).items()}
+
+
+def _json_default(value):
+    # numpy 标量 (统计结果中的 int64 / float64) 与时间戳
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def build_stats_preview(stats: Dict[str, Any], activity: Dict[str, Any], temporal: Optional[Dict[str, Any]],
+                        rankings: Dict[str, pd.DataFrame], **sections) -> Dict[str, Any]:
+    """
+    组装统计预览：AI 阶段开始前即可展示的全部数据 (基础统计、排行榜、活跃趋势、作息热力图等)。
+    sections 为其余可直接 JSON 序列化的统计块 (如 hardcore / interactions / hot_sessions)。
+    """
+    return {
+        'chat_name': stats.get('chat_name', '群聊'),
+        'stats': stats,
+        'activity': activity,
+        'temporal': temporal,
+        'rankings': ranking_records(rankings),
+        **sections,
+        'generated_at': pd.Timestamp.now().strftime(DEFAULT_TIME_FORMAT)
+    }
+
+
+def _temp_path(path: str) -> str:
+    """目标文件同目录下的唯一临时文件名 (并发写同一目标时互不覆盖，替换后保留常规文件权限)。"""
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def write_stats_preview(preview: Dict[str, Any], path: str) -> str:
+    """以紧凑 JSON 原子写入统计预览 (先写临时文件再替换，读取方不会读到半个文件)。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(preview, f, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
 
 class HTMLRenderer:
     """
     HTML 报告渲染器。
     """
 
-    def __init__(self, template_dir: str = "templates"):
+    def __init__(self, template_dir: str = "templates", auto_reload: Optional[bool] = None):
         # 意义: 初始化渲染器
-        # 作用: 设置 Jinja2 模板环境
+        # 作用: 复用模块级 Jinja2 环境，避免每个任务重新解析与编译模板
         # 关联: 依赖 templates 目录下的 HTML 文件
-        self.env = Environment(loader=FileSystemLoader(template_dir))
+        self.env = get_environment(template_dir, auto_reload)
         self.template_name = "report.html"
 
-    def render(self, stats: Dict[str, Any], daily_activity: pd.DataFrame, summary: Dict[str, Any], rankings: Dict[str, pd.DataFrame] = None, output_path: str = "output/report.html") -> str:
+    def render(self, stats: Dict[str, Any], daily_activity: pd.DataFrame, summary: Dict[str, Any], rankings: Dict[str, pd.DataFrame] = None, output_path: str = "output/report.html", cancel_token=None,
+               activity: Optional[Dict[str, Any]] = None, temporal: Optional[Dict[str, Any]] = None) -> str:
         """
-        渲染并保存报告。
+        渲染并保存报告。activity 为 build_activity_series 的结果，为空时由 daily_activity 生成；
+        temporal 为 ChatAnalyzer.get_temporal_summary 的结果，为空时不展示作息热力图。
         """
         # 意义: 生成最终文件
-        # 作用: 将统计数据 (stats) 和 AI 文案 (ai_content) 注入模板，并保存到磁盘
-        # 关联: 被 app.py 调用，输出最终结果
+        # 作用: 将统计数据 (stats) 和 AI 文案 (ai_content) 注入模板，流式写入磁盘
+        # 关联: 被 AnalysisPipeline 调用，输出最终结果
         
         template = self.env.get_template(self.template_name)
         
-        # 处理排行榜数据
-        processed_rankings = {}
-        if rankings:
-             for key, df in rankings.items():
-                 processed_rankings[key] = df.to_dict('records') if not df.empty else []
-        
         # 准备渲染上下文
-        context = {
-            "title": f"{stats.get('chat_name', '群聊')} - 年度总结报告",
-            "stats": stats,
-            "daily_activity": daily_activity.to_dict('records') if not daily_activity.empty else [],
-            "summary": summary,
-            "rankings": processed_rankings,
-            "generated_at": pd.Timestamp.now().strftime(DEFAULT_TIME_FORMAT)
-        }
-        
-        html_content = template.render(**context)
+        context = self._context(
+            stats,
+            activity if activity is not None else build_activity_series(daily_activity),
+            temporal,
+            ranking_records(rankings),
+            summary
+        )
         
         # 确保输出目录存在
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        # 按块流式写入临时文件，完整报告不会整体驻留内存；写完后原子替换
+        tmp_path = _temp_path(output_path)
+        stream = template.stream(**context)
+        stream.enable_buffering(RENDER_STREAM_BUFFER)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for chunk in stream:
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    f.write(chunk)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             
         return output_path
+
+    def render_preview(self, preview: Dict[str, Any]) -> str:
+        """
+        由统计预览 (build_stats_preview 的结果) 渲染部分报告：统计图表完整展示，AI 段落显示占位文字。
+        """
+        # 意义: 部分报告
+        # 作用: 与完整报告共用模板，LLM 阶段完成前即可查看统计部分
+        # 关联: app.py 的 /api/tasks/<id>/preview 路由
+        pending = {key: PREVIEW_PENDING_HTML for key, kind in REDUCE_JSON_SCHEMA.items() if kind is str}
+        pending.update(style_config={}, keywords=[], timeline='')
+        context = self._context(
+            preview.get('stats', {}), preview.get('activity'), preview.get('temporal'),
+            preview.get('rankings', {}), pending
+        )
+        context['title'] += " (统计预览)"
+        return self.env.get_template(self.template_name).render(**context)
+
+    def _context(self, stats: Dict[str, Any], activity: Optional[Dict[str, Any]], temporal: Optional[Dict[str, Any]],
+                 rankings: Dict[str, list], summary: Dict[str, Any]) -> Dict[str, Any]:
+        """报告模板的渲染上下文 (排行榜为记录列表)。"""
+        return {
+            "title": f"{stats.get('chat_name', '群聊')} - 年度总结报告",
+            "stats": stats,
+            "activity": activity,
+            "temporal": temporal,
+            "weekday_names": WEEKDAY_NAMES,
+            "summary": summary,
+            "rankings": rankings,
+            "generated_at": pd.Timestamp.now().strftime(DEFAULT_TIME_FORMAT)
+        }
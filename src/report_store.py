@@ -0,0 +1,168 @@
+# src/report_store.py
+
+"""
+Report Store Module
+===================
+负责报告的内容寻址存储：按 sha256 命名去重，写入时预先生成 gzip / brotli 压缩版本，
+下载时按 Accept-Encoding 协商并提供强 ETag。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import re
+import zlib
+import hashlib
+import uuid
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple
+try:
+    import brotli  # brotli 为可选依赖，未安装时只提供 gzip 版本
+except ImportError:
+    brotli = None
+
+from src.registry import *
+from src.metrics import metrics
+
+_DIGEST_FILENAME = re.compile(r'^([0-9a-f]{64})\.html$')
+# 编码 -> 文件后缀 / ETag 后缀，按服务端优先级排列
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class ReportStore:
+    """
+    内容寻址的报告存储，文件位于 <root>/<digest[:2]>/<digest>.html[.gz|.br]。
+    """
+
+    def __init__(self, root: str = os.path.join("output", REPORT_STORE_DIR)):
+        # 意义: 初始化存储
+        # 作用: 确保根目录存在
+        # 关联: 被 AnalysisPipeline (写入) 与 app.download_file (读取) 使用
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest: str, encoding: Optional[str] = None) -> str:
+        suffix = dict(_ENCODINGS).get(encoding, '')
+        return os.path.join(self.root, digest[:2], f"{digest}.html{suffix}")
+
+    def put_file(self, path: str) -> Dict[str, Any]:
+        """
+        将渲染好的报告移入存储 (原文件会被删除)，内容相同的报告只保存一份。
+
+        Returns:
+            Dict: digest / filename / path / sizes (各编码的字节数) / deduplicated
+        """
+        # 意义: 报告入库
+        # 作用: 按块计算内容哈希；新内容再按块流式写入压缩版本，已有内容直接复用
+        # 关联: 压缩在写入时一次完成，下载时不再消耗 CPU；两遍读取都只占用一个块的内存
+        sha = hashlib.sha256()
+        size = 0
+        for chunk in self._chunks(path):
+            sha.update(chunk)
+            size += len(chunk)
+        digest = sha.hexdigest()
+        target = self.path_for(digest)
+
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            os.remove(path)
+            metrics.incr('report_store_dedup_total')
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for encoding, _ in _ENCODINGS:
+                compressor = self._compressor(encoding)
+                if compressor is not None:
+                    self._write_atomic(self.path_for(digest, encoding), self._compressed_chunks(path, *compressor))
+            # 原文最后落盘，作为入库完成的标志
+            os.replace(path, target)
+            metrics.incr('report_store_put_total')
+
+        sizes = {'identity': size}
+        for encoding, _ in _ENCODINGS:
+            variant = self.path_for(digest, encoding)
+            if os.path.exists(variant):
+                sizes[encoding] = os.path.getsize(variant)
+        return {
+            'digest': digest,
+            'filename': os.path.basename(target),
+            'path': target,
+            'sizes': sizes,
+            'deduplicated': deduplicated
+        }
+
+    def lookup(self, filename: str) -> Optional[str]:
+        """文件名为 <sha256>.html 且已入库时返回摘要，否则返回 None。"""
+        match = _DIGEST_FILENAME.match(filename)
+        if match and os.path.exists(self.path_for(match.group(1))):
+            return match.group(1)
+        return None
+
+    def negotiate(self, digest: str, accept_encoding: str) -> Tuple[str, Optional[str]]:
+        """
+        按 Accept-Encoding 选择已预压缩的版本。
+
+        Returns:
+            (文件路径, Content-Encoding 或 None)
+        """
+        accepted = self._parse_accept_encoding(accept_encoding or '')
+        for encoding, _ in _ENCODINGS:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            path = self.path_for(digest, encoding)
+            if q > 0 and os.path.exists(path):
+                return path, encoding
+        return self.path_for(digest), None
+
+    def etag(self, digest: str, encoding: Optional[str] = None) -> str:
+        """强 ETag：不同编码是不同的字节表示，使用不同的标签。"""
+        suffix = dict(_ENCODINGS).get(encoding, '')
+        return f'"{digest}{suffix}"'
+
+    def _parse_accept_encoding(self, header: str) -> Dict[str, float]:
+        """解析 Accept-Encoding 的编码与 q 值。"""
+        accepted = {}
+        for part in header.split(','):
+            token, _, params = part.strip().partition(';')
+            if not token:
+                continue
+            q = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[token.strip().lower()] = q
+        return accepted
+
+    def _chunks(self, path: str) -> Iterator[bytes]:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(REPORT_STORE_CHUNK_SIZE), b''):
+                yield chunk
+
+    def _compressor(self, encoding: str) -> Optional[Tuple[Callable[[bytes], bytes], Callable[[], bytes]]]:
+        """返回编码对应的 (按块压缩, 结束) 函数对，不支持的编码返回 None。"""
+        if encoding == 'gzip':
+            # wbits=31 输出 gzip 格式 (头部 mtime 为 0，与 gzip.compress(mtime=0) 一样可复现)
+            compressor = zlib.compressobj(REPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+            return compressor.compress, compressor.flush
+        if encoding == 'br' and brotli is not None:
+            compressor = brotli.Compressor(quality=REPORT_BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+            return compressor.process, compressor.finish
+        return None
+
+    def _compressed_chunks(self, path: str, compress: Callable[[bytes], bytes],
+                           finish: Callable[[], bytes]) -> Iterator[bytes]:
+        for chunk in self._chunks(path):
+            yield compress(chunk)
+        yield finish()
+
+    def _write_atomic(self, path: str, chunks: Iterator[bytes]) -> None:
+        """写入同目录下的唯一临时文件再替换，多个进程同时入库同一份报告时互不覆盖临时文件。"""
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'xb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
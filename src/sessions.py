@@ -0,0 +1,186 @@
+# src/sessions.py
+
+"""
+Session Index Module
+====================
+负责会话切分索引：按相邻消息的时间间隔把时间线切成一段段“对话”，
+向量化地计算每段对话的起止时间、参与人数、消息数、强度与突发度 (burstiness)，
+供采样与分块挑选完整的热门对话，而不是任意时间窗口的碎片。
+遵循 Phase 5 编程规范。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+from src.registry import *
+
+
+class SessionIndex:
+    """
+    会话索引。所有统计均由 np.diff / cumsum / bincount 一次算出，构建为 O(n)，不逐会话循环。
+
+    Attributes:
+        session_of_row: (n,) 每行 (按传入顺序) 所属的会话编号，会话按时间先后编号
+        starts / ends: (S,) 每个会话在时间排序后的行区间 [start, end)
+        start_time / end_time: (S,) datetime64[ns] 起止时间
+        messages / participants: (S,) 消息数 / 不同发言人数
+        duration: (S,) 持续秒数
+        intensity: (S,) 强度，每分钟消息数 (持续时间按至少 1 分钟计)
+        burstiness: (S,) 会话内消息间隔的突发度 (σ-μ)/(σ+μ)，-1 为完全均匀，趋近 1 为集中爆发
+    """
+
+    def __init__(self, times, users=None, gap_seconds: float = SESSION_GAP_SECONDS):
+        # 意义: 构建索引
+        # 作用: 间隔超过 gap_seconds 处断开；times 未排序时先做稳定排序，结果仍按传入顺序映射回每一行
+        # 关联: 被 ChatAnalyzer.get_session_index、smart_sample 与 _smart_focus_sample 使用
+        ts = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+        n = len(ts)
+        self.gap_seconds = gap_seconds
+        self.order = None
+        if n > 1 and np.any(ts[1:] < ts[:-1]):
+            self.order = np.argsort(ts, kind='stable')
+            ts = ts[self.order]
+
+        gaps = np.diff(ts)
+        breaks = gaps > int(gap_seconds * 1e9)
+        sorted_session = np.concatenate([[0], np.cumsum(breaks)]) if n else np.zeros(0, dtype=np.int64)
+        self.starts = np.flatnonzero(np.concatenate([[True], breaks])) if n else np.zeros(0, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], n) if n else np.zeros(0, dtype=np.int64)
+        n_sessions = len(self.starts)
+
+        self.session_of_row = np.empty(n, dtype=np.int64)
+        if self.order is None:
+            self.session_of_row[:] = sorted_session
+        else:
+            self.session_of_row[self.order] = sorted_session
+
+        self.messages = self.ends - self.starts
+        self.start_time = ts[self.starts].astype('datetime64[ns]')
+        self.end_time = ts[self.ends - 1].astype('datetime64[ns]') if n else self.start_time
+        self.duration = (ts[self.ends - 1] - ts[self.starts]) / 1e9 if n else np.zeros(0)
+        self.intensity = self.messages / np.maximum(self.duration / 60.0, 1.0)
+
+        # 突发度：只统计会话内部的间隔 (断点处的间隔属于会话之间)
+        inner = ~breaks
+        inner_session = sorted_session[1:][inner]
+        inner_gaps = gaps[inner] / 1e9
+        k = np.bincount(inner_session, minlength=n_sessions)
+        total = np.bincount(inner_session, weights=inner_gaps, minlength=n_sessions)
+        total_sq = np.bincount(inner_session, weights=inner_gaps ** 2, minlength=n_sessions)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / k
+            std = np.sqrt(np.maximum(total_sq / k - mean ** 2, 0.0))
+            burst = (std - mean) / (std + mean)
+        self.burstiness = np.where((k >= 2) & np.isfinite(burst), burst, 0.0)
+
+        # 参与人数：(会话, 用户) 组合哈希去重后按会话计数
+        if users is not None and n:
+            user_codes, _ = pd.factorize(np.asarray(users), sort=False)
+            if self.order is not None:
+                user_codes = user_codes[self.order]
+            base = int(user_codes.max()) + 1
+            pairs = pd.unique(sorted_session * base + user_codes)
+            self.participants = np.bincount(pairs // base, minlength=n_sessions)
+        else:
+            self.participants = np.zeros(n_sessions, dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, gap_seconds: float = SESSION_GAP_SECONDS) -> 'SessionIndex':
+        """由消息 DataFrame 构建 (使用 datetime 与 user_id 列)。"""
+        users = df[COL_USER_ID].to_numpy() if COL_USER_ID in df.columns else None
+        return cls(df[COL_DATETIME].to_numpy(), users, gap_seconds)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def top(self, n: int = DEFAULT_TOP_N, by: str = 'intensity',
+            min_messages: int = SESSION_MIN_MESSAGES) -> np.ndarray:
+        """
+        按指标 (intensity / messages / participants / burstiness / duration) 降序返回会话编号，
+        只考虑消息数不少于 min_messages 的会话。
+        """
+        values = getattr(self, by)
+        eligible = np.flatnonzero(self.messages >= min_messages)
+        return eligible[np.argsort(-values[eligible], kind='stable')][:n]
+
+    def rows(self, session: int) -> np.ndarray:
+        """某个会话包含的行位置 (按传入顺序的下标，时间升序)。"""
+        positions = np.arange(self.starts[session], self.ends[session])
+        return positions if self.order is None else self.order[positions]
+
+    def sort_rows(self, rows: np.ndarray) -> np.ndarray:
+        """把若干行位置 (按传入顺序的下标) 按时间先后重新排列。"""
+        rows = np.asarray(rows)
+        sort_key = rows if self.order is None else np.argsort(self.order)[rows]
+        return rows[np.argsort(sort_key, kind='stable')]
+
+    def nearest_boundary(self, position: int) -> int:
+        """距给定 (时间排序后的) 行位置最近的会话起点，用于把分块边界对齐到完整对话。"""
+        if len(self.starts) == 0:
+            return position
+        i = int(np.searchsorted(self.starts, position))
+        candidates = [self.starts[j] for j in (i - 1, i) if 0 <= j < len(self.starts)]
+        return int(min(candidates, key=lambda s: abs(s - position)))
+
+    def describe(self, sessions) -> List[Dict[str, Any]]:
+        """导出若干会话的摘要 (纯 Python 类型)。"""
+        return [
+            {
+                'start': str(self.start_time[s])[:16].replace('T', ' '),
+                'end': str(self.end_time[s])[:16].replace('T', ' '),
+                'messages': int(self.messages[s]),
+                'participants': int(self.participants[s]),
+                'duration_minutes': round(float(self.duration[s]) / 60, 1),
+                'intensity': round(float(self.intensity[s]), 2),
+                'burstiness': round(float(self.burstiness[s]), 3)
+            }
+            for s in sessions
+        ]
+
+    def hot_mask(self, lengths, budget: float) -> np.ndarray:
+        """
+        在字符预算内按强度从高到低挑选完整会话，返回每行 (按传入顺序) 是否入选。
+
+        Args:
+            lengths: (n,) 每行的字符数
+            budget: 可分配给热门会话的字符数；放不下的会话整体跳过，不截取片段
+        """
+        lengths = np.asarray(lengths, dtype=np.float64)
+        session_chars = np.bincount(self.session_of_row, weights=lengths, minlength=len(self))
+        ranked = self.top(len(self), 'intensity')
+        ranked = ranked[session_chars[ranked] <= budget]
+        chosen = ranked[np.cumsum(session_chars[ranked]) <= budget]
+        selected = np.zeros(len(self), dtype=bool)
+        selected[chosen] = True
+        return selected[self.session_of_row]
+
+
+def sample_by_sessions(texts: List[str], index: SessionIndex, target_chars: int,
+                       hot_ratio: float = SESSION_HOT_BUDGET_RATIO) -> List[str]:
+    """
+    按会话采样：先把预算的 hot_ratio 分给最热的完整对话，剩余预算均匀抽取其余消息作为背景。
+    texts 与 index 的行一一对应 (传入顺序)，返回按时间排序的入选文本。
+    """
+    lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+    return [texts[i] for i in sample_rows_by_sessions(lengths, index, target_chars, hot_ratio)]
+
+
+def sample_rows_by_sessions(lengths: np.ndarray, index: SessionIndex, target_chars: int,
+                            hot_ratio: float = SESSION_HOT_BUDGET_RATIO) -> np.ndarray:
+    """
+    sample_by_sessions 的行号形式：只需每行的字符数 (含换行)，返回按时间排序的入选行位置，
+    调用方只需格式化入选的行 (src.prompt_builder.ChatLines)。
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    hot = index.hot_mask(lengths, target_chars * hot_ratio)
+    remaining = target_chars - lengths[hot].sum()
+
+    cold = np.flatnonzero(~hot)
+    cold_chars = lengths[cold].sum()
+    if remaining <= 0:
+        cold = cold[:0]
+    elif cold_chars > remaining:
+        step = int(cold_chars / max(1, remaining)) + 1
+        cold = cold[::step]
+    # 按时间排序输出
+    return index.sort_rows(np.concatenate([np.flatnonzero(hot), cold]))
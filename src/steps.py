@@ -0,0 +1,112 @@
+# src/steps.py
+
+"""
+Pipeline Steps Module
+=====================
+负责把“流水线逻辑”与“LLM I/O 方式”解耦：流水线与报告生成器的各阶段写成生成器 (steps)，
+需要模型时产出 LLMCall / LLMBatch 并接收响应，不关心请求如何发出。
+
+- run_steps: 同步驱动，直接调用 LLMClient.chat_completion (线程执行模式，原有行为)
+- arun_steps: 异步驱动，两次请求之间的 CPU 片段 (解析 / 统计 / 采样 / 渲染) 放入执行器，
+  LLM 请求在事件循环上等待，一个事件循环即可驱动大量任务的模型流量
+遵循 Phase 5 编程规范。
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generator, List, NamedTuple, Optional, Union
+
+
+class LLMCall(NamedTuple):
+    """一次模型请求；驱动方返回响应文本，请求抛出的异常 (Exception) 会在产出处重新抛出。"""
+    system_prompt: str
+    prompt: str
+    model: Optional[str] = None
+
+
+class LLMBatch(NamedTuple):
+    """一组可并发的模型请求；驱动方按顺序返回结果列表，失败项为对应的异常对象。"""
+    calls: List[LLMCall]
+    max_workers: int = 1
+
+
+Steps = Generator[Union[LLMCall, LLMBatch], Any, Any]
+
+
+def run_steps(steps: Steps, client) -> Any:
+    """
+    同步驱动：在当前线程执行 steps，返回其返回值。
+    """
+    # 意义: 线程执行模式
+    # 作用: LLMCall 直接调用 client.chat_completion；LLMBatch 使用线程池并发
+    # 关联: AnalysisPipeline.run 与 ReportGenerator 的同步方法
+    value, error = None, None
+    try:
+        while True:
+            try:
+                effect = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            if isinstance(effect, LLMBatch):
+                with ThreadPoolExecutor(max_workers=max(1, effect.max_workers)) as pool:
+                    value = list(pool.map(lambda call: _call_sync(client, call), effect.calls))
+                continue
+            try:
+                value = client.chat_completion(effect.system_prompt, effect.prompt, model=effect.model)
+            except Exception as e:
+                error = e
+    finally:
+        steps.close()
+
+
+async def arun_steps(steps: Steps, client, executor=None) -> Any:
+    """
+    异步驱动：steps 的每个 CPU 片段在 executor (线程池) 中执行，LLM 请求通过 client.achat_completion 等待。
+    """
+    # 意义: 异步执行模式
+    # 作用: 生成器可在不同线程中依次恢复 (从不并发)，因此 CPU 片段不阻塞事件循环；
+    #       等待模型响应期间任务不占用任何线程
+    # 关联: AnalysisPipeline.arun；由 src.async_runner.AsyncTaskRunner 调度
+    loop = asyncio.get_running_loop()
+
+    def advance(value, error):
+        try:
+            return (steps.throw(error) if error is not None else steps.send(value)), False
+        except StopIteration as stop:
+            return stop.value, True
+
+    value, error = None, None
+    try:
+        while True:
+            effect, finished = await loop.run_in_executor(executor, advance, value, error)
+            if finished:
+                return effect
+            value, error = None, None
+            if isinstance(effect, LLMBatch):
+                limit = asyncio.Semaphore(max(1, effect.max_workers))
+
+                async def call_one(call):
+                    async with limit:
+                        try:
+                            return await client.achat_completion(call.system_prompt, call.prompt, model=call.model)
+                        except Exception as e:
+                            return e
+
+                value = list(await asyncio.gather(*(call_one(call) for call in effect.calls)))
+                continue
+            try:
+                value = await client.achat_completion(effect.system_prompt, effect.prompt, model=effect.model)
+            except Exception as e:
+                error = e
+    finally:
+        # 协程被取消时生成器可能仍在执行器中运行，此时由其自行结束
+        if not steps.gi_running:
+            steps.close()
+
+
+def _call_sync(client, call: LLMCall):
+    try:
+        return client.chat_completion(call.system_prompt, call.prompt, model=call.model)
+    except Exception as e:
+        return e
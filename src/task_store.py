@@ -0,0 +1,277 @@
+# src/task_store.py
+
+"""
+Task Store Module
+=================
+负责任务状态与任务队列的存储，提供进程内实现与可跨进程共享的 SQLite 实现。
+Web 层 (可多进程部署) 只写入任务与入队，分析由独立的工作进程从持久化队列中领取执行。
+遵循 Phase 5 编程规范。
+"""
+
+import json
+import time
+import queue
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from src.registry import *
+
+
+class TaskStore:
+    """
+    任务状态存储接口。记录为 JSON 可序列化的 dict，日志单独追加以便增量读取。
+    """
+
+    # 为 True 时任务由独立工作进程从队列中领取；为 False 时由 Web 进程内线程直接执行
+    durable = False
+
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, task_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def pop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def append_log(self, task_id: str, msg: str) -> None:
+        raise NotImplementedError
+
+    def pop_logs(self, task_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def enqueue(self, task_id: str, payload: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """领取一个待执行任务，队列为空时返回 None。"""
+        raise NotImplementedError
+
+    def heartbeat(self, task_id: str) -> None:
+        """执行中任务的心跳，超时未更新的任务会被 recover_stale 重新入队。"""
+
+    def finish(self, task_id: str) -> None:
+        """标记队列中的任务已结束 (无论成功与否)。"""
+
+    def recover_stale(self, stale_seconds: float = WORKER_STALE_SECONDS) -> List[str]:
+        """将心跳超时的任务重新入队 (或超过重试次数后标记失败)，返回受影响的任务 ID。"""
+        return []
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    进程内实现，行为与原先的全局字典一致，仅适用于单进程部署。
+    """
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._records[task_id] = {**record, 'logs': []}
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.get(task_id)
+            return {k: v for k, v in record.items() if k != 'logs'} if record else None
+
+    def update(self, task_id: str, **fields) -> None:
+        with self._lock:
+            if task_id in self._records:
+                self._records[task_id].update(fields)
+
+    def pop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.pop(task_id, None)
+        if record:
+            record.pop('logs', None)
+        return record
+
+    def append_log(self, task_id: str, msg: str) -> None:
+        with self._lock:
+            if task_id in self._records:
+                self._records[task_id]['logs'].append(msg)
+
+    def pop_logs(self, task_id: str) -> List[str]:
+        with self._lock:
+            record = self._records.get(task_id)
+            if not record:
+                return []
+            logs, record['logs'] = record['logs'], []
+            return logs
+
+    def enqueue(self, task_id: str, payload: Dict[str, Any]) -> None:
+        self._queue.put((task_id, payload))
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    基于 SQLite (WAL 模式) 的实现，多个 Web 进程与工作进程共享同一个数据库文件。
+    """
+
+    durable = True
+
+    def __init__(self, path: str = TASK_STORE_PATH, namespace: str = "tasks"):
+        # 意义: 初始化存储
+        # 作用: 每个 namespace 对应一组表 (记录 / 日志 / 队列)，如 tasks 与 uploads
+        # 关联: 每个线程使用独立连接，写操作使用 BEGIN IMMEDIATE 串行化
+        if not namespace.isidentifier():
+            raise ValueError(f"Invalid task store namespace: {namespace}")
+        self.path = path
+        self.ns = namespace
+        self._local = threading.local()
+        with self._tx() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.ns} (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL)")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.ns}_logs (seq INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT, msg TEXT)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.ns}_logs_task ON {self.ns}_logs (task_id, seq)")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.ns}_queue ("
+                "task_id TEXT PRIMARY KEY, payload TEXT NOT NULL, state TEXT NOT NULL, "
+                "worker TEXT, attempts INTEGER DEFAULT 0, enqueued_at REAL, heartbeat REAL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    def create(self, task_id: str, record: Dict[str, Any]) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.ns} (id, data, updated_at) VALUES (?, ?, ?)",
+                (task_id, json.dumps(record, ensure_ascii=False), time.time())
+            )
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(f"SELECT data FROM {self.ns} WHERE id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id: str, **fields) -> None:
+        with self._tx() as conn:
+            row = conn.execute(f"SELECT data FROM {self.ns} WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                return
+            record = json.loads(row[0])
+            record.update(fields)
+            conn.execute(
+                f"UPDATE {self.ns} SET data = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(record, ensure_ascii=False), time.time(), task_id)
+            )
+
+    def pop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._tx() as conn:
+            row = conn.execute(f"SELECT data FROM {self.ns} WHERE id = ?", (task_id,)).fetchone()
+            conn.execute(f"DELETE FROM {self.ns} WHERE id = ?", (task_id,))
+            conn.execute(f"DELETE FROM {self.ns}_logs WHERE task_id = ?", (task_id,))
+        return json.loads(row[0]) if row else None
+
+    def append_log(self, task_id: str, msg: str) -> None:
+        with self._tx() as conn:
+            conn.execute(f"INSERT INTO {self.ns}_logs (task_id, msg) VALUES (?, ?)", (task_id, msg))
+
+    def pop_logs(self, task_id: str) -> List[str]:
+        with self._tx() as conn:
+            rows = conn.execute(
+                f"SELECT seq, msg FROM {self.ns}_logs WHERE task_id = ? ORDER BY seq", (task_id,)
+            ).fetchall()
+            if rows:
+                conn.execute(f"DELETE FROM {self.ns}_logs WHERE task_id = ? AND seq <= ?", (task_id, rows[-1][0]))
+        return [msg for _, msg in rows]
+
+    def enqueue(self, task_id: str, payload: Dict[str, Any]) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.ns}_queue (task_id, payload, state, attempts, enqueued_at) "
+                "VALUES (?, ?, 'pending', 0, ?)",
+                (task_id, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._tx() as conn:
+            row = conn.execute(
+                f"SELECT task_id, payload FROM {self.ns}_queue WHERE state = 'pending' ORDER BY enqueued_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                f"UPDATE {self.ns}_queue SET state = 'running', worker = ?, attempts = attempts + 1, heartbeat = ? "
+                "WHERE task_id = ?",
+                (worker_id, time.time(), row[0])
+            )
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, task_id: str) -> None:
+        with self._tx() as conn:
+            conn.execute(f"UPDATE {self.ns}_queue SET heartbeat = ? WHERE task_id = ?", (time.time(), task_id))
+
+    def finish(self, task_id: str) -> None:
+        with self._tx() as conn:
+            conn.execute(f"DELETE FROM {self.ns}_queue WHERE task_id = ?", (task_id,))
+
+    def recover_stale(self, stale_seconds: float = WORKER_STALE_SECONDS) -> List[str]:
+        cutoff = time.time() - stale_seconds
+        with self._tx() as conn:
+            rows = conn.execute(
+                f"SELECT task_id, attempts FROM {self.ns}_queue WHERE state = 'running' AND heartbeat < ?", (cutoff,)
+            ).fetchall()
+            for task_id, attempts in rows:
+                if attempts >= WORKER_MAX_ATTEMPTS:
+                    conn.execute(f"DELETE FROM {self.ns}_queue WHERE task_id = ?", (task_id,))
+                else:
+                    conn.execute(
+                        f"UPDATE {self.ns}_queue SET state = 'pending', worker = NULL WHERE task_id = ?", (task_id,)
+                    )
+        for task_id, attempts in rows:
+            if attempts >= WORKER_MAX_ATTEMPTS:
+                self.update(task_id, state='failed', error='工作进程异常退出，已超过最大重试次数')
+            else:
+                self.update(task_id, state='queued', status_text='工作进程异常退出，重新排队...')
+        return [task_id for task_id, _ in rows]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT / ROLLBACK 上下文 (连接处于 autocommit 模式)。"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def create_task_store(backend: str = TASK_BACKEND_MEMORY, path: str = TASK_STORE_PATH,
+                      namespace: str = "tasks") -> TaskStore:
+    """
+    按后端名称创建任务存储。
+    """
+    if backend == TASK_BACKEND_SQLITE:
+        return SQLiteTaskStore(path, namespace)
+    if backend == TASK_BACKEND_MEMORY:
+        return MemoryTaskStore()
+    raise ValueError(f"Unknown task backend: {backend}")
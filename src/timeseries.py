@@ -0,0 +1,125 @@
+# src/timeseries.py
+
+"""
+Time Series Module
+==================
+负责报告图表使用的活跃度时间序列：按 日 / 周 / 月 聚合，LTTB 降采样，
+并打包为 base64 编码的 Uint32 数组 (小端) + 起始日期，避免在 HTML 中内嵌大量 JSON 对象。
+遵循 Phase 5 编程规范。
+"""
+
+import base64
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+from src.registry import *
+
+_UNITS = (TS_UNIT_DAY, TS_UNIT_WEEK, TS_UNIT_MONTH)
+
+
+def daily_counts(daily_activity: pd.DataFrame) -> Tuple[Optional[np.datetime64], np.ndarray]:
+    """
+    将 (date, count) 表转为从首日开始的连续日计数数组，缺失日期补 0。
+    """
+    if daily_activity is None or daily_activity.empty:
+        return None, np.zeros(0, dtype=np.uint32)
+    dates = pd.to_datetime(daily_activity['date']).to_numpy().astype('datetime64[D]')
+    start = dates.min()
+    offsets = (dates - start).astype(np.int64)
+    counts = np.bincount(offsets, weights=daily_activity['count'].to_numpy(dtype=np.float64))
+    return start, counts.astype(np.uint32)
+
+
+def resample(start: np.datetime64, daily: np.ndarray, unit: str) -> Tuple[np.datetime64, np.ndarray]:
+    """
+    将日计数聚合到 周 (周一起) / 月 粒度，返回 (该粒度下的起点日期, 计数数组)。
+    """
+    if unit == TS_UNIT_DAY or len(daily) == 0:
+        return start, daily
+    days = np.arange(len(daily))
+    if unit == TS_UNIT_WEEK:
+        shift = int((start.astype(np.int64) + 3) % 7) # 1970-01-01 为周四，周一为 0
+        idx = (days + shift) // 7
+        first = start - np.timedelta64(shift, 'D')
+    elif unit == TS_UNIT_MONTH:
+        months = (start + days).astype('datetime64[M]')
+        idx = (months - months[0]).astype(np.int64)
+        first = months[0].astype('datetime64[D]')
+    else:
+        raise ValueError(f"Unknown time series unit: {unit}")
+    return first, np.bincount(idx, weights=daily).astype(np.uint32)
+
+
+def lttb(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标 (x 为等距下标)。
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64) # 中间 threshold-2 个桶的边界
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的平均点 (最后一个桶取末点)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = (nlo + nhi - 1) / 2.0
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+        xs = np.arange(lo, hi)
+        areas = np.abs((a - avg_x) * (y[lo:hi] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        keep[i + 1] = a
+    return keep
+
+
+def pack_uint32(values: np.ndarray) -> str:
+    """小端 Uint32 数组 -> base64 字符串 (前端以 Uint32Array 解码)。"""
+    return base64.b64encode(np.asarray(values, dtype='<u4').tobytes()).decode('ascii')
+
+
+def build_activity_series(daily_activity: pd.DataFrame, max_points: int = TS_MAX_POINTS,
+                          resolutions: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    生成报告图表使用的多粒度活跃度序列。
+
+    Args:
+        daily_activity: ChatAnalyzer.get_daily_activity() 的结果
+        max_points: 每条序列保留的最大点数，超出时 LTTB 降采样
+        resolutions: 需要内嵌的粒度；为空时只内嵌自动选择的默认粒度
+
+    Returns:
+        Dict: default (默认粒度) / series {粒度: {start, unit, buckets, points, x, y, max}}
+              x 为相对 start 的粒度偏移，x / y 均为 base64 小端 Uint32
+    """
+    # 意义: 图表数据压缩
+    # 作用: 按跨度选择默认粒度 (日 -> 周 -> 月)，仅对超出点数上限的序列降采样
+    # 关联: 被 AnalysisPipeline 调用，结果由 HTMLRenderer 注入模板
+    start, daily = daily_counts(daily_activity)
+    if start is None:
+        return {'default': TS_UNIT_DAY, 'series': {}}
+
+    if len(daily) <= TS_DAILY_MAX_BUCKETS:
+        default = TS_UNIT_DAY
+    elif len(daily) // 7 <= TS_WEEKLY_MAX_BUCKETS:
+        default = TS_UNIT_WEEK
+    else:
+        default = TS_UNIT_MONTH
+
+    series = {}
+    for unit in (resolutions or [default]):
+        first, counts = resample(start, daily, unit)
+        keep = lttb(counts, max_points)
+        series[unit] = {
+            'start': str(first),
+            'unit': unit,
+            'buckets': int(len(counts)),
+            'points': int(len(keep)),
+            'max': int(counts.max()) if len(counts) else 0,
+            'x': pack_uint32(keep),
+            'y': pack_uint32(counts[keep])
+        }
+    return {'default': default, 'series': series}
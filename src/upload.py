@@ -0,0 +1,190 @@
+# src/upload.py
+
+"""
+Streaming Upload Module
+=======================
+负责将上传的请求体按块直接写入磁盘，同时计算内容哈希、字节计数并按需流式解压。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import time
+import zlib
+import hashlib
+from typing import Dict, Any, Iterator, Optional, Callable
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from src.registry import *
+
+
+class _GzipStream:
+    """gzip 流式解压器，兼容多成员 (concatenated) gzip 文件；每次产出的数据不超过 max_length 字节。"""
+
+    def __init__(self, max_length: int = UPLOAD_CHUNK_SIZE):
+        self.max_length = max_length
+        self._d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def decompress(self, chunk: bytes) -> Iterator[bytes]:
+        # 意义: 有界解压
+        # 作用: 按 max_length 分段输出，剩余输入留在 unconsumed_tail 中下一轮继续，
+        #       调用方可在每段之后检查解压总量 (高压缩比的小块不会一次性展开到内存)
+        # 关联: StreamingUploader.receive 逐段写盘并检查 max_decompressed_bytes
+        data = chunk
+        while True:
+            out = self._d.decompress(data, self.max_length)
+            if out:
+                yield out
+            if self._d.eof:
+                # 当前成员结束，其后的字节属于下一个 gzip 成员
+                data = self._d.unused_data
+                if not data:
+                    break
+                self._d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                continue
+            data = self._d.unconsumed_tail
+            if not data and len(out) < self.max_length:
+                break
+
+    def flush(self) -> bytes:
+        return self._d.flush()
+
+
+class _ZstdStream:
+    """
+    zstd 流式解压器 (依赖可选的 zstandard 库)，兼容多帧 (multi-frame) zstd 文件。
+    zstandard 的 decompressobj 不支持 max_length，输入按 UPLOAD_ZSTD_FEED_SIZE 分片喂入以限制单次展开量。
+    """
+
+    def __init__(self):
+        self._dctx = zstandard.ZstdDecompressor()
+        self._d = self._dctx.decompressobj()
+
+    def decompress(self, chunk: bytes) -> Iterator[bytes]:
+        data = chunk
+        while data:
+            piece, data = data[:UPLOAD_ZSTD_FEED_SIZE], data[UPLOAD_ZSTD_FEED_SIZE:]
+            out = self._d.decompress(piece)
+            if out:
+                yield out
+            if self._d.eof:
+                # 当前帧结束 (decompressobj 只解码一帧)，其后的字节交给新的解压对象
+                data = self._d.unused_data + data
+                self._d = self._dctx.decompressobj()
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class StreamingUploader:
+    """
+    流式上传接收器，绕过 Werkzeug 的表单解析与临时文件，边接收边落盘。
+    """
+
+    def __init__(self, upload_folder: str, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 max_decompressed_bytes: int = UPLOAD_MAX_DECOMPRESSED_BYTES):
+        # 意义: 初始化接收器
+        # 作用: 设置落盘目录、读块大小以及解压后的体积上限 (防止解压炸弹)
+        # 关联: 被 app.py 的 /api/upload 路由调用
+        self.upload_folder = upload_folder
+        self.chunk_size = chunk_size
+        self.max_decompressed_bytes = max_decompressed_bytes
+
+    def receive(self, stream, filename: str, save_name: str, total_bytes: Optional[int] = None,
+                progress_callback: Optional[Callable[[int, Optional[int], float], None]] = None) -> Dict[str, Any]:
+        """
+        从输入流读取数据并写入上传目录。
+
+        Args:
+            stream: 可读的二进制流 (如 request.stream)
+            filename: 客户端原始文件名，用于判断压缩格式
+            save_name: 落盘文件名 (不含压缩后缀)
+            total_bytes: 请求体总长度 (Content-Length)，未知时为 None
+            progress_callback: 进度回调 (已接收字节, 总字节, 当前吞吐 MB/s)
+
+        Returns:
+            Dict: 落盘路径、内容哈希 (解压后)、字节计数、耗时与吞吐
+        """
+        # 意义: 流式上传核心
+        # 作用: 按块读取 -> (可选) 解压 -> 更新 sha256 -> 写盘，内存中最多只保留一个块
+        # 关联: 返回的 sha256 作为下游去重/缓存的键
+        first = stream.read(self.chunk_size)
+        compression = self._detect_compression(filename, first)
+        decoder = self._make_decoder(compression)
+
+        target_name = save_name
+        for suffix in UPLOAD_COMPRESSED_SUFFIXES:
+            if target_name.lower().endswith(suffix):
+                target_name = target_name[:-len(suffix)]
+                break
+        path = os.path.join(self.upload_folder, target_name)
+
+        hasher = hashlib.sha256()
+        received = 0
+        written = 0
+        start = time.perf_counter()
+
+        try:
+            with open(path, 'wb') as out:
+                chunk = first
+                while chunk:
+                    received += len(chunk)
+                    for data in (decoder.decompress(chunk) if decoder else (chunk,)):
+                        written += len(data)
+                        if written > self.max_decompressed_bytes:
+                            raise ValueError("解压后文件过大，已拒绝")
+                        hasher.update(data)
+                        out.write(data)
+
+                    if progress_callback:
+                        elapsed = time.perf_counter() - start
+                        progress_callback(received, total_bytes, received / 1024 / 1024 / max(elapsed, 1e-6))
+                    chunk = stream.read(self.chunk_size)
+
+                if decoder:
+                    tail = decoder.flush()
+                    if tail:
+                        written += len(tail)
+                        hasher.update(tail)
+                        out.write(tail)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+        elapsed = time.perf_counter() - start
+        return {
+            'path': path,
+            'filename': target_name,
+            'sha256': hasher.hexdigest(),
+            'compression': compression,
+            'bytes_received': received,
+            'bytes_written': written,
+            'seconds': round(elapsed, 3),
+            'throughput_mbps': round(received / 1024 / 1024 / max(elapsed, 1e-6), 2)
+        }
+
+    def _detect_compression(self, filename: str, head: bytes) -> Optional[str]:
+        """根据魔数 (优先) 或文件后缀判断压缩格式。"""
+        if head.startswith(b'\x1f\x8b'):
+            return 'gzip'
+        if head.startswith(b'\x28\xb5\x2f\xfd'):
+            return 'zstd'
+        lower = filename.lower()
+        if lower.endswith('.gz'):
+            return 'gzip'
+        if lower.endswith('.zst'):
+            return 'zstd'
+        return None
+
+    def _make_decoder(self, compression: Optional[str]):
+        """创建对应格式的流式解压器。"""
+        if compression == 'gzip':
+            return _GzipStream()
+        if compression == 'zstd':
+            if zstandard is None:
+                raise ValueError("上传的是 zstd 压缩文件，但未安装 zstandard 库")
+            return _ZstdStream()
+        return None
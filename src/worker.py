@@ -0,0 +1,266 @@
+# src/worker.py
+
+"""
+Worker Module
+=============
+负责执行分析任务：既可在 Web 进程内以线程方式运行 (内存后端)，
+也可作为独立工作进程从 SQLite 持久化队列中领取任务 (多进程部署)。
+遵循 Phase 5 编程规范。
+"""
+
+import os
+import gc
+import time
+import socket
+import asyncio
+import threading
+import multiprocessing
+from typing import Dict, Any, List, Optional
+from src.registry import *
+from src.task_store import TaskStore, create_task_store
+from src.pipeline import AnalysisPipeline, ParseCache
+from src.renderer import HTMLRenderer
+from src.history import HistoryManager
+from src.report_store import ReportStore
+from src.cancel import CancelToken, TaskCancelled
+from src.metrics import metrics
+from src.async_runner import AsyncTaskRunner
+
+
+class TaskLogger:
+    """将任务日志与进度写入任务存储，供 /api/status 读取。"""
+
+    def __init__(self, task_id: str, store: TaskStore):
+        self.task_id = task_id
+        self.store = store
+
+    def info(self, msg):
+        self.store.append_log(self.task_id, msg)
+        print(f"[Task {self.task_id}] {msg}")
+
+    def progress(self, percent, status_text):
+        self.store.update(self.task_id, progress=percent, status_text=status_text)
+
+
+def _watch_task(store: TaskStore, task_id: str, token: CancelToken, done: threading.Event) -> None:
+    """
+    后台监视线程：轮询任务存储中的取消请求 (跨进程可见)，并定期写入队列心跳。
+    """
+    last_beat = time.monotonic()
+    while not done.wait(CANCEL_STORE_POLL_INTERVAL):
+        last_beat = _poll_task(store, task_id, token, last_beat)
+
+
+async def _watch_task_async(store: TaskStore, task_id: str, token: CancelToken) -> None:
+    """
+    _watch_task 的协程版本，随任务结束被取消。
+    任务存储的读写是同步的 (SQLite 可能等锁)，放到线程中执行，不阻塞事件循环上的其他任务。
+    """
+    last_beat = time.monotonic()
+    while True:
+        await asyncio.sleep(CANCEL_STORE_POLL_INTERVAL)
+        last_beat = await asyncio.to_thread(_poll_task, store, task_id, token, last_beat)
+
+
+def _poll_task(store: TaskStore, task_id: str, token: CancelToken, last_beat: float) -> float:
+    if (store.get(task_id) or {}).get('cancel_requested_at'):
+        token.cancel(CANCEL_REASON_USER)
+    token.cancelled # 同时触发截止时间检查
+    if time.monotonic() - last_beat >= WORKER_HEARTBEAT_INTERVAL:
+        store.heartbeat(task_id)
+        last_beat = time.monotonic()
+    return last_beat
+
+
+def execute_task(store: TaskStore, task_id: str, payload: Dict[str, Any], pipeline: AnalysisPipeline) -> None:
+    """
+    执行单个分析任务并把结果写回任务存储，结束后删除上传的原始文件。
+
+    Args:
+        payload: file_paths / config / source_hashes；config.deadline_seconds 为任务时限 (<= 0 不限)
+    """
+    logger = TaskLogger(task_id, store)
+    file_paths = payload.get('file_paths', [])
+    config = payload.get('config', {})
+    token = CancelToken(float(config.get('deadline_seconds') or 0))
+    done = threading.Event()
+    threading.Thread(target=_watch_task, args=(store, task_id, token, done), daemon=True).start()
+    try:
+        _begin(store, task_id, token)
+        result = pipeline.run(
+            task_id,
+            file_paths,
+            config,
+            logger,
+            source_hashes=payload.get('source_hashes'),
+            cancel_token=token
+        )
+        _complete(store, task_id, result, logger)
+
+    except TaskCancelled as e:
+        _on_cancelled(store, task_id, e.reason, pipeline, logger)
+    except Exception as e:
+        _on_failed(store, task_id, e, pipeline, logger)
+    finally:
+        done.set()
+        _cleanup(file_paths, pipeline, task_id)
+    if token.cancelled:
+        # 异常及其栈帧 (持有 DataFrame 等中间结果) 已释放，立即回收
+        gc.collect()
+
+
+async def execute_task_async(store: TaskStore, task_id: str, payload: Dict[str, Any], pipeline: AnalysisPipeline,
+                             executor=None) -> None:
+    """
+    execute_task 的协程版本 (src.async_runner)：状态写回、取消与清理的约定相同，
+    流水线以 AnalysisPipeline.arun 执行，CPU 阶段使用共享的 executor，等待模型期间不占用线程。
+    """
+    logger = TaskLogger(task_id, store)
+    file_paths = payload.get('file_paths', [])
+    config = payload.get('config', {})
+    token = CancelToken(float(config.get('deadline_seconds') or 0))
+    watcher = asyncio.ensure_future(_watch_task_async(store, task_id, token))
+    try:
+        await asyncio.to_thread(_begin, store, task_id, token)
+        result = await pipeline.arun(
+            task_id,
+            file_paths,
+            config,
+            logger,
+            source_hashes=payload.get('source_hashes'),
+            cancel_token=token,
+            executor=executor
+        )
+        # 状态写回与清理涉及 SQLite 事务 (可能等锁) 与删除文件，同样放到线程中，不阻塞其他任务
+        await asyncio.to_thread(_complete, store, task_id, result, logger)
+
+    except TaskCancelled as e:
+        await asyncio.to_thread(_on_cancelled, store, task_id, e.reason, pipeline, logger)
+    except Exception as e:
+        await asyncio.to_thread(_on_failed, store, task_id, e, pipeline, logger)
+    finally:
+        watcher.cancel()
+        await asyncio.to_thread(_cleanup, file_paths, pipeline, task_id)
+    if token.cancelled:
+        gc.collect()
+
+
+def _begin(store: TaskStore, task_id: str, token: CancelToken) -> None:
+    if (store.get(task_id) or {}).get('cancel_requested_at'):
+        token.cancel(CANCEL_REASON_USER) # 排队期间已被取消
+    token.check()
+    store.update(task_id, state='processing')
+
+
+def _complete(store: TaskStore, task_id: str, result: Dict[str, Any], logger: TaskLogger) -> None:
+    store.update(task_id, result_url=f"/download/{result['report_filename']}", state='completed')
+    logger.progress(100, "分析完成！")
+
+
+def _on_failed(store: TaskStore, task_id: str, error: Exception, pipeline: AnalysisPipeline, logger: TaskLogger) -> None:
+    _discard_outputs(pipeline, task_id)
+    logger.info(f"Error: {str(error)}")
+    store.update(task_id, state='failed', error=str(error))
+
+
+def _cleanup(file_paths: List[str], pipeline: AnalysisPipeline, task_id: str) -> None:
+    # Clean up uploaded files (及失败 / 取消时残留的 out-of-core 工作集)
+    for file_path in file_paths + [pipeline.working_set_path(task_id)]:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def _discard_outputs(pipeline: AnalysisPipeline, task_id: str) -> None:
+    """
+    删除未完成任务的输出：未完成的报告与统计预览 (stats_<task_id>.json)。
+    预览与报告保留策略一致：任务完成后一并保留，取消 / 失败时一并删除。
+    """
+    for path in (pipeline.report_path(task_id), pipeline.stats_path(task_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _on_cancelled(store: TaskStore, task_id: str, reason: str, pipeline: AnalysisPipeline, logger: TaskLogger) -> None:
+    """
+    取消收尾：删除未完成的报告与统计预览、释放内存，并记录从发出取消到任务停止的延迟。
+    """
+    _discard_outputs(pipeline, task_id)
+
+    requested_at = (store.get(task_id) or {}).get('cancel_requested_at')
+    latency = round(time.time() - requested_at, 3) if requested_at else None
+    if latency is not None:
+        metrics.observe('task_cancel_latency_seconds', latency)
+    metrics.incr('tasks_cancelled_total', reason=reason)
+
+    logger.info(f"任务已取消: {reason}" + (f" (取消耗时 {latency}s)" if latency is not None else ""))
+    store.update(task_id, state='cancelled', error=reason, cancel_latency=latency, status_text="任务已取消")
+
+
+def worker_loop(store_path: str = TASK_STORE_PATH, output_folder: str = "output",
+                history_file: Optional[str] = "history.json", stop_event=None, concurrency: int = 1) -> None:
+    """
+    工作进程主循环：回收心跳超时的任务，领取并执行队列中的任务。
+
+    concurrency > 1 时使用异步执行器 (src.async_runner)，同一进程最多同时执行 concurrency 个任务。
+    """
+    # 意义: 独立工作进程入口 (需可被 multiprocessing 以 spawn 方式启动)
+    # 作用: 每个进程持有自己的流水线、解析缓存与模板环境；执行期间监视线程 / 协程定期写心跳
+    # 关联: 由 worker.py 启动；app.py 在 SQLite 后端下只负责入队
+    store = create_task_store(TASK_BACKEND_SQLITE, store_path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    pipeline = AnalysisPipeline(
+        output_folder=output_folder,
+        renderer=HTMLRenderer(),
+        parse_cache=ParseCache(),
+        history_manager=HistoryManager(history_file) if history_file else None,
+        report_store=ReportStore(os.path.join(output_folder, REPORT_STORE_DIR)),
+        stats_preview=True
+    )
+    runner = AsyncTaskRunner() if concurrency > 1 else None
+    print(f"[Worker {worker_id}] started, store={store_path}" + (f", concurrency={concurrency}" if runner else ""))
+
+    while stop_event is None or not stop_event.is_set():
+        recovered = store.recover_stale()
+        if recovered:
+            print(f"[Worker {worker_id}] recovered stale tasks: {recovered}")
+        if runner is not None and runner.active >= concurrency:
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+        job = store.claim(worker_id)
+        if job is None:
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        task_id, payload = job
+        print(f"[Worker {worker_id}] claimed task {task_id}")
+        if runner is not None:
+            runner.submit(_execute_claimed(store, task_id, payload, pipeline, runner.executor))
+            continue
+        try:
+            execute_task(store, task_id, payload, pipeline)
+        finally:
+            store.finish(task_id)
+    if runner is not None:
+        runner.stop()
+
+
+async def _execute_claimed(store: TaskStore, task_id: str, payload: Dict[str, Any], pipeline: AnalysisPipeline,
+                           executor) -> None:
+    try:
+        await execute_task_async(store, task_id, payload, pipeline, executor=executor)
+    finally:
+        store.finish(task_id)
+
+
+def start_workers(count: int, store_path: str = TASK_STORE_PATH, output_folder: str = "output",
+                  history_file: Optional[str] = "history.json", concurrency: int = 1) -> List[multiprocessing.Process]:
+    """启动 count 个工作进程，返回进程列表 (非守护进程：解析阶段还需创建子进程池)。"""
+    processes = []
+    for _ in range(max(1, count)):
+        proc = multiprocessing.Process(
+            target=worker_loop,
+            args=(store_path, output_folder, history_file, None, concurrency)
+        )
+        proc.start()
+        processes.append(proc)
+    return processes
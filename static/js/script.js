@@ -158,15 +158,16 @@ function handleDrop(e) {
 
 function handleFiles(files) {
     if (files.length > 0) {
-        uploadFile(files[0]);
+        uploadFiles(Array.from(files));
     }
 }
 
 // --- Core Logic ---
 
-async function uploadFile(file) {
-    if (!file.name.endsWith('.json')) {
-        alert("请上传 JSON 文件！");
+async function uploadFiles(files) {
+    const allowed = /\.(json|zip)(\.gz|\.zst)?$/i;
+    if (!files.every(f => allowed.test(f.name))) {
+        alert("请上传 JSON 文件、ZIP 压缩包或 gzip/zstd 压缩的 JSON！");
         return;
     }
 
@@ -194,16 +195,45 @@ async function uploadFile(file) {
         max_tokens: parseInt(document.getElementById('sampling-strength').value),
         anime_theme: document.getElementById('anime-theme').value,
         custom_theme_prompt: document.getElementById('custom-theme-prompt').value,
-        enhance_mode: document.getElementById('enhance-mode').checked
+        enhance_mode: document.getElementById('enhance-mode').checked,
+        deadline_seconds: (parseFloat(document.getElementById('deadline-minutes').value) || 0) * 60,
+        budget_max_tokens: parseInt(document.getElementById('budget-max-tokens').value) || 0
     };
 
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('config', JSON.stringify(config));
-
     try {
         statusMsg.innerText = "正在上传并启动分析...";
-        log("系统: 开始上传文件...");
+        log(`系统: 开始上传 ${files.length} 个文件...`);
+
+        // 逐个流式上传，服务端边收边写盘并计算哈希
+        const uploadIds = [];
+        for (const file of files) {
+            const info = await streamUpload(file);
+            log(`系统: ${file.name} 上传完成 (${(info.bytes_received / 1024 / 1024).toFixed(1)}MB, ${info.throughput_mbps} MB/s, sha256 ${info.sha256.slice(0, 12)})`);
+            uploadIds.push(info.upload_id);
+        }
+
+        const formData = new FormData();
+        formData.append('upload_ids', JSON.stringify(uploadIds));
+        formData.append('config', JSON.stringify(config));
+
+        // 运行前估算用量与耗时，确认后再启动 (解析结果会被随后的任务复用)
+        statusMsg.innerText = "正在估算用量...";
+        const estimateRes = await fetch('/api/estimate', { method: 'POST', body: formData });
+        const estimate = await estimateRes.json();
+        if (estimate.status === 'success') {
+            const text = formatEstimate(estimate);
+            log(`系统: ${text.replace(/\n/g, ' ')}`);
+            if (!confirm(`${text}\n\n确认开始分析？`)) {
+                statusMsg.innerText = "已取消";
+                log('系统: 用户取消了本次分析');
+                // 释放服务端已上传的文件
+                await Promise.all(uploadIds.map(id => fetch(`/api/upload/${encodeURIComponent(id)}`, { method: 'DELETE' })));
+                return;
+            }
+        } else {
+            log(`系统: 估算失败 (${estimate.message})，直接开始分析`);
+        }
+        statusMsg.innerText = "正在启动分析...";
         
         const response = await fetch('/api/analyze', {
             method: 'POST',
@@ -230,12 +260,80 @@ async function uploadFile(file) {
     }
 }
 
+function streamUpload(file) {
+    const progressBar = document.getElementById('progress-fill');
+    const statusMsg = document.getElementById('status-msg');
+    const percentSpan = document.getElementById('status-percent');
+
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        const started = performance.now();
+        xhr.open('PUT', `/api/upload?filename=${encodeURIComponent(file.name)}`);
+        xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+
+        xhr.upload.onprogress = (e) => {
+            if (!e.lengthComputable) return;
+            const pct = Math.round(e.loaded / e.total * 100);
+            const mbps = (e.loaded / 1024 / 1024) / Math.max((performance.now() - started) / 1000, 0.001);
+            progressBar.style.width = `${pct}%`;
+            percentSpan.innerText = `${pct}%`;
+            statusMsg.innerText = `正在上传 ${file.name} (${mbps.toFixed(1)} MB/s)...`;
+        };
+        xhr.onload = () => {
+            try {
+                const data = JSON.parse(xhr.responseText);
+                if (data.status === 'error') reject(new Error(data.message));
+                else resolve(data);
+            } catch (e) {
+                reject(e);
+            }
+        };
+        xhr.onerror = () => reject(new Error('上传失败'));
+        xhr.send(file);
+    });
+}
+
+function formatEstimate(estimate) {
+    const budget = estimate.budget;
+    const est = budget.estimate;
+    const lines = [
+        `共 ${estimate.total_messages} 条消息，分 ${estimate.plan.n_splits} 块分析`,
+        `预计用量 ${est.total_tokens} tokens，耗时约 ${Math.ceil(est.seconds / 60)} 分钟` +
+            (est.cost !== null ? `，费用约 ${est.cost}` : '')
+    ];
+    for (const [name, stage] of Object.entries(est.stages)) {
+        lines.push(`  · ${name}: ${stage.calls} 次请求，${stage.input_tokens + stage.output_tokens} tokens (${stage.model})`);
+    }
+    if (budget.actions.length) lines.push(`超出上限，已调整: ${budget.actions.join('；')}`);
+    if (!budget.within_budget) lines.push('⚠️ 调整后仍超出上限');
+    return lines.join('\n');
+}
+
 async function pollProgress(taskId) {
     const progressBar = document.getElementById('progress-fill');
     const statusMsg = document.getElementById('status-msg');
     const percentSpan = document.getElementById('status-percent');
     const resultActions = document.getElementById('result-actions');
     const downloadBtn = document.getElementById('download-btn');
+    const cancelActions = document.getElementById('cancel-actions');
+    const cancelBtn = document.getElementById('cancel-btn');
+    const previewActions = document.getElementById('preview-actions');
+    let previewShown = false;
+
+    previewActions.style.display = 'none';
+    cancelActions.style.display = 'block';
+    cancelBtn.disabled = false;
+    cancelBtn.onclick = async () => {
+        cancelBtn.disabled = true;
+        try {
+            const res = await fetch(`/api/cancel/${taskId}`, { method: 'POST' });
+            const data = await res.json();
+            log(data.status === 'success' ? '系统: 已发送取消请求' : `ERROR: ${data.message}`);
+        } catch (e) {
+            cancelBtn.disabled = false;
+            log(`ERROR: ${e.message}`);
+        }
+    };
 
     const interval = setInterval(async () => {
         try {
@@ -253,6 +351,16 @@ async function pollProgress(taskId) {
             percentSpan.innerText = `${pct}%`;
             statusMsg.innerText = data.status_text || "处理中...";
 
+            // 统计预览在 LLM 阶段开始前就绪，先展示核心数字与部分报告入口
+            if (data.stats_url && !previewShown) {
+                previewShown = true;
+                showStatsPreview(taskId, data.stats_url);
+            }
+
+            if (['completed', 'failed', 'cancelled'].includes(data.state)) {
+                cancelActions.style.display = 'none';
+            }
+
             if (data.state === 'completed') {
                 clearInterval(interval);
                 statusMsg.innerText = "✅ 分析完成！";
@@ -264,6 +372,10 @@ async function pollProgress(taskId) {
                 statusMsg.innerText = "❌ 分析失败";
                 statusMsg.style.color = "red";
                 log(`ERROR: ${data.error}`);
+            } else if (data.state === 'cancelled') {
+                clearInterval(interval);
+                statusMsg.innerText = "⏹ 任务已取消";
+                log(`系统: ${data.error}`);
             }
 
         } catch (e) {
@@ -272,6 +384,24 @@ async function pollProgress(taskId) {
     }, 1000);
 }
 
+async function showStatsPreview(taskId, statsUrl) {
+    try {
+        const res = await fetch(statsUrl);
+        if (res.status !== 200) return;
+        const preview = await res.json();
+        const stats = preview.stats || {};
+        const talkers = Object.keys((preview.hardcore || {}).top_talkers || {}).slice(0, 3).join('、');
+        document.getElementById('preview-summary').innerText =
+            `共 ${stats.total_messages} 条消息 · ${stats.total_users} 位成员 · 跨越 ${stats.days_covered} 天` +
+            (talkers ? ` · 话痨: ${talkers}` : '');
+        document.getElementById('preview-btn').href = `/api/tasks/${taskId}/preview`;
+        document.getElementById('preview-actions').style.display = 'block';
+        log('系统: 统计预览已就绪，AI 分析完成前可先查看');
+    } catch (e) {
+        console.error("Preview error", e);
+    }
+}
+
 function log(msg) {
     const box = document.getElementById('log-box');
     const p = document.createElement('div');
@@ -345,6 +475,12 @@ async function loadConfig() {
         if (config.enhance_mode !== undefined) {
             document.getElementById('enhance-mode').checked = config.enhance_mode;
         }
+        if (config.deadline_seconds) {
+            document.getElementById('deadline-minutes').value = config.deadline_seconds / 60;
+        }
+        if (config.budget_max_tokens) {
+            document.getElementById('budget-max-tokens').value = config.budget_max_tokens;
+        }
 
     } catch (e) {
         console.error("Failed to load config", e);
@@ -363,7 +499,9 @@ async function saveConfig(successMsg = '✅ 配置已保存') {
         max_tokens: parseInt(document.getElementById('sampling-strength').value),
         anime_theme: document.getElementById('anime-theme').value,
         custom_theme_prompt: document.getElementById('custom-theme-prompt').value,
-        enhance_mode: document.getElementById('enhance-mode').checked
+        enhance_mode: document.getElementById('enhance-mode').checked,
+        deadline_seconds: (parseFloat(document.getElementById('deadline-minutes').value) || 0) * 60,
+        budget_max_tokens: parseInt(document.getElementById('budget-max-tokens').value) || 0
     };
 
     try {
@@ -0,0 +1,49 @@
+# worker.py
+
+"""
+Worker Entry
+============
+多进程部署时的分析工作进程入口：从 SQLite 持久化队列中领取 Web 层提交的任务并执行。
+
+用法示例:
+    TASK_BACKEND=sqlite gunicorn -w 4 app:app
+    python worker.py --workers 4
+    python worker.py --workers 2 --concurrency 16   # 每个进程用一个事件循环同时执行 16 个任务
+"""
+
+import os
+import sys
+import argparse
+from src.registry import *
+from src.worker import start_workers
+
+HISTORY_FILE = 'history.json'
+OUTPUT_FOLDER = 'output'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QQ Chat AI Analyzer - 分析工作进程")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="工作进程数 (默认 CPU 核数)")
+    parser.add_argument('--store', default=os.environ.get('TASK_STORE_PATH', TASK_STORE_PATH), help="任务数据库路径")
+    parser.add_argument('--output', default=OUTPUT_FOLDER, help="报告输出目录 (需与 Web 服务一致)")
+    parser.add_argument('--no-history', action='store_true', help="不写入 history.json")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="每个进程同时执行的任务数；大于 1 时使用异步执行器 (LLM 请求共享一个事件循环)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    processes = start_workers(args.workers, args.store, args.output, None if args.no_history else HISTORY_FILE,
+                              concurrency=args.concurrency)
+    print(f"Started {len(processes)} workers (store={args.store})")
+    try:
+        for proc in processes:
+            proc.join()
+    except KeyboardInterrupt:
+        # 未完成的任务心跳会超时，下次启动时自动重新入队
+        for proc in processes:
+            proc.terminate()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())